@@ -1,12 +1,37 @@
 #!/usr/bin/env python3
 
+import io
 import os
+import sys
+import json
+import time
+import zlib
+import queue
 import shutil
 import argparse
+import subprocess
 import datetime
-from PIL import Image
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+from PIL import Image, ImageOps
 import py7zr
-from ultralytics import YOLO
+
+from areas_gamba import (IMAGE_WIDTH, IMAGE_HEIGHT, areas_desde_resultado, escribir_areas_txt, escribir_mascaras,
+                         escribir_tamanos, borrar_mascaras)
+from backend_yolo import BACKENDS, TOLERANCIA_NUM_GAMBAS, cargar, exportar, ruta_artefacto, comparar_modelos
+from catalogo import huella, sin_cambios, cargar_catalogo, guardar_catalogo, registrar
+from duplicados import DISTANCIA_DUPLICADO, NOMBRE_CACHE, CacheDuplicados, calcular_dhashes
+from metricas import Metricas, contar, observar, medir, extraer, combinar
+from indice_exif import archivo_vigente, miembros_seleccionables, guardar_archivo
+from metadatos_opmm import HILOS_EXIF, escanear_imagen_seguro, escanear_imagenes, es_seleccionable
+from servicio_inferencia import (PUERTO, ServicioNoDisponible, ErrorServicio, ClaveNoConfigurada, comprobar_clave,
+                                 servir, enviar, estado)
+
+try:
+    from py7zr.io import Py7zIO, WriterFactory
+except ImportError:  # py7zr < 1.0: se usa SevenZipFile.readall()
+    Py7zIO = WriterFactory = object
 
 
 # ------------------------
@@ -16,9 +41,20 @@ BASE = "C:\\Users\\UIB\\Desktop\\REMAR-automatizacion"
 BASE_INPUT = os.path.join(BASE, "data\\img_lonja")
 BASE_RESULTS = os.path.join(BASE, "INFERENCE")
 BASE_TEMPORAL = os.path.join(BASE_RESULTS, "temporal")
+BASE_AREAS = os.path.join(BASE, "AREAS")  # areas_resultados_<fecha>.txt (entrada de la etapa 3)
+BASE_COMBINADOS = os.path.join(BASE, "RESULTS")  # resultados_procesados_<fecha>.csv, lonja y DATOS_GAMBA/ (etapas 3 y 4b)
 YOLO_WEIGHTS = "best.pt"
 YEAR = datetime.date.today().year
 OUTPUT_TXT = os.path.join(BASE_RESULTS, f"resultados_metadatos.txt")
+DIR_FRAGMENTOS = os.path.join(BASE_RESULTS, "fragmentos_metadatos")  # un .txt de filas por archivo .7z
+MANIFIESTO = os.path.join(BASE_RESULTS, "manifiesto_archivos.json")   # archivos .7z ya inferidos
+HUELLA_TABLA = os.path.join(BASE_RESULTS, "huella_resultados_metadatos.json")  # OUTPUT_TXT tal como lo dejó combinar_fragmentos
+INDICE_EXIF = os.path.join(BASE_RESULTS, "indice_exif.sqlite")        # metadatos OPMM de cada miembro (indice_exif.py)
+BATCH_SIZE = 8
+INTERVALO_VIGILANCIA = 60  # s entre dos sondeos de BASE_INPUT en modo --vigilar
+ESPERA_ESTABLE = 30        # s sin cambios en un .7z para darlo por copiado
+SALIDAS = ("completo", "etiquetas", "muestra", "mascaras")
+CADA_ANOTADA = 50  # en 'muestra' y 'mascaras' se guarda la imagen anotada de 1 de cada N
 
 
 # ------------------------
@@ -32,6 +68,76 @@ def parser_arguments():
                         help="Fecha inicial (dd-mm-yyyy)")
     parser.add_argument('--final_date', type=str, default="",
                         help="Fecha final (dd-mm-yyyy)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Número de imágenes por llamada a predict()")
+    parser.add_argument('--extraccion', choices=["disco", "memoria"], default="disco",
+                        help="disco: extrae cada .7z en temporal/; "
+                             "memoria: lee los miembros en buffers y solo decodifica los que pasan el filtro EXIF")
+    parser.add_argument('--hilos-exif', type=int, default=HILOS_EXIF,
+                        help="Hilos para leer las cabeceras EXIF en modo disco")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos en paralelo; cada uno carga el modelo una vez y procesa archivos .7z completos")
+    parser.add_argument('--hilos-torch', type=int, default=0,
+                        help="Hilos intra-op de torch por proceso (0: núcleos / workers)")
+    parser.add_argument('--areas-directas', action="store_true", default=False,
+                        help="Calcula las áreas desde las máscaras en la propia inferencia y escribe "
+                             "AREAS/areas_resultados_<fecha>.txt (no hace falta la etapa 2)")
+    parser.add_argument('--salidas', choices=SALIDAS, default="completo",
+                        help="completo: etiqueta e imagen anotada de cada imagen; etiquetas: solo labels/; "
+                             "muestra: labels/ y anotadas de 1 de cada --cada-anotada; mascaras: polígonos en "
+                             "mascaras.bin/.idx de la fecha (sin labels/) y anotadas de la muestra")
+    parser.add_argument('--cada-anotada', type=int, default=CADA_ANOTADA,
+                        help="Frecuencia de las imágenes anotadas en --salidas muestra y mascaras")
+    parser.add_argument('--dedup', action="store_true", default=False,
+                        help="Calcula un dHash de cada imagen seleccionable y, si repite una foto anterior del "
+                             "día con el mismo Pes y Vta, reutiliza su predicción en vez de inferirla")
+    parser.add_argument('--distancia-dedup', type=int, default=DISTANCIA_DUPLICADO,
+                        help="Bits distintos (de 64) del dHash hasta los que dos fotos se consideran la misma")
+    parser.add_argument('--encadenado', action="store_true", default=False,
+                        help="Solapa lectura/filtrado, decodificación, inferencia y escritura con colas acotadas "
+                             "(un solo proceso; ignora --workers)")
+    parser.add_argument('--hilos-decodificacion', type=int, default=HILOS_DECODIFICACION,
+                        help="Hilos del pool de decodificación en modo --encadenado")
+    parser.add_argument('--cola-decodificacion', type=int, default=COLA_DECODIFICACION,
+                        help="Imágenes en vuelo entre la lectura y la inferencia en modo --encadenado")
+    parser.add_argument('--cola-escritura', type=int, default=COLA_ESCRITURA,
+                        help="Lotes inferidos pendientes de escribir en modo --encadenado")
+    parser.add_argument('--sin-indice', action="store_true", default=False,
+                        help="No usa ni actualiza el índice EXIF (escanea siempre el .7z completo)")
+    parser.add_argument('--solo-indice', action="store_true", default=False,
+                        help="Indexa los .7z de las fechas seleccionadas sin inferir y termina")
+    parser.add_argument('--force', action="store_true", default=False,
+                        help="Reprocesa los archivos de las fechas seleccionadas aunque ya estén en el manifiesto")
+    parser.add_argument('--vigilar', action="store_true", default=False,
+                        help="Modo continuo: sondea la carpeta de entrada, infiere cada OPMM_Subasta_*.7z nuevo "
+                             "en cuanto termina de copiarse y lanza las etapas 2, 3 y 4b solo para su fecha")
+    parser.add_argument('--intervalo', type=int, default=INTERVALO_VIGILANCIA,
+                        help="Segundos entre dos sondeos de la carpeta de entrada en modo --vigilar")
+    parser.add_argument('--espera-estable', type=int, default=ESPERA_ESTABLE,
+                        help="Segundos que un .7z debe seguir sin cambios (tamaño y fecha) para procesarlo")
+    parser.add_argument('--servir', action="store_true", default=False,
+                        help="Arranca el servicio de inferencia: carga el modelo una vez y atiende trabajos "
+                             "por un socket local hasta que se pare")
+    parser.add_argument('--cliente', action="store_true", default=False,
+                        help="Envía los archivos al servicio de inferencia; si no está en marcha (o se cae) "
+                             "se infiere en este proceso")
+    parser.add_argument('--parar-servicio', action="store_true", default=False,
+                        help="Detiene el servicio de inferencia y termina")
+    parser.add_argument('--puerto', type=int, default=PUERTO,
+                        help="Puerto local del servicio de inferencia")
+    parser.add_argument('--backend', choices=BACKENDS, default="pytorch",
+                        help="pytorch: best.pt; onnx/openvino: modelo exportado una vez y guardado junto a best.pt")
+    parser.add_argument('--int8', action="store_true", default=False,
+                        help="Usa la variante cuantizada INT8 del backend onnx u openvino")
+    parser.add_argument('--datos-calibracion', type=str, default="",
+                        help="Dataset .yaml para calibrar la cuantización INT8 de OpenVINO")
+    parser.add_argument('--verificar-backend', action="store_true", default=False,
+                        help="Compara el backend con best.pt sobre una muestra de imágenes de las fechas "
+                             "seleccionadas (conteos, máscaras, áreas y num_gambas) y termina")
+    parser.add_argument('--muestra', type=int, default=50,
+                        help="Imágenes de la muestra de --verificar-backend")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_NUM_GAMBAS,
+                        help="Diferencia relativa media de num_gambas admitida por --verificar-backend")
     return parser.parse_args()
 
 
@@ -49,119 +155,1380 @@ def get_date(file_date, args):
 
 
 # ------------------------
-# EXTRAER METADATOS
+# EXTRACCION EN DISCO
 # ------------------------
-def get_metadatos(metadatos_raw):
-    metadatos = {}
-    for item in metadatos_raw.split("*"):
-        if ":" in item:
-            key, value = item.split(":")
-            metadatos[key.replace('\x00', '')] = value.replace('\x00', '')
-    return metadatos
+def seleccionar_en_disco(ruta_7z, dir_temporal, hilos=HILOS_EXIF, objetivos=None, miembros=None):
+    """
+    Extrae el .7z completo en dir_temporal, lee las cabeceras EXIF en paralelo
+    y devuelve las imágenes que cumplen los criterios como tuplas
+    (ruta_img, filename, pes, vta). dir_temporal se borra después de la inferencia.
+    Con `objetivos` (nombres dentro del .7z) solo se extraen esos miembros; en
+    `miembros` se añade (nombre, tamaño, registro) de todo lo escaneado.
+    """
+    # Reset temporal folder
+    if os.path.exists(dir_temporal):
+        shutil.rmtree(dir_temporal)
+
+    os.makedirs(dir_temporal)
+
+    with py7zr.SevenZipFile(ruta_7z, mode='r') as z:
+        if objetivos:
+            z.extract(dir_temporal, targets=objetivos)
+        else:
+            z.extractall(dir_temporal)
+
+    items = []
+    for root, _, files in os.walk(dir_temporal):
+        for filename in sorted(files):
+            items.append((os.path.join(root, filename), filename))
+    contar("imagenes_escaneadas", len(items))
+
+    registros = escanear_imagenes(items, hilos)
+    if miembros is not None:
+        miembros.extend((os.path.relpath(ruta_img, dir_temporal).replace(os.sep, "/"), os.path.getsize(ruta_img), registro)
+                        for (ruta_img, _), registro in zip(items, registros))
+    return [
+        (ruta_img, filename, registro["Pes"], registro["Vta"])
+        for (ruta_img, filename), registro in zip(items, registros)
+        if es_seleccionable(registro)
+    ]
 
 
 # ------------------------
-# MAIN
+# EXTRACCION EN MEMORIA
 # ------------------------
-def main():
-    args = parser_arguments()
+class MiembroEnMemoria(Py7zIO):
+    """
+    Buffer de un miembro del .7z. Al cerrarse (py7zr >= 1.1 lo hace al terminar
+    cada miembro) aplica el filtro EXIF y libera los bytes de las imágenes que no
+    pasan, para no retener el archivo completo en memoria.
+    """
 
-    # Preparar directorios
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.buffer = io.BytesIO()
+        self.registro = None
+        self.cerrado = False
+
+    def write(self, s):
+        return self.buffer.write(s)
+
+    def read(self, size=None):
+        return self.buffer.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.buffer.seek(offset, whence)
+
+    def flush(self):
+        return self.buffer.flush()
+
+    def size(self):
+        return self.buffer.getbuffer().nbytes if self.buffer is not None else 0
+
+    def close(self):
+        if self.cerrado:
+            return
+        self.cerrado = True
+        self.buffer.seek(0)
+        self.registro = escanear_imagen_seguro(self.buffer, os.path.basename(self.nombre))
+        if not es_seleccionable(self.registro):
+            self.buffer = None
+
+
+class FabricaMiembros(WriterFactory):
+    def __init__(self):
+        self.miembros = {}
+
+    def create(self, filename):
+        miembro = MiembroEnMemoria(filename)
+        self.miembros[filename] = miembro
+        return miembro
+
+
+def seleccionar_en_memoria(ruta_7z, dir_temporal=None, hilos=HILOS_EXIF, objetivos=None, miembros=None):
+    """
+    Descomprime los miembros del .7z en buffers, aplica el filtro leyendo solo la
+    cabecera EXIF y devuelve las que lo cumplen como tuplas
+    (bytes_img, filename, pes, vta). Nada se escribe en disco.
+    `objetivos` y `miembros` como en seleccionar_en_disco.
+    """
+    seleccionadas = []
+    with py7zr.SevenZipFile(ruta_7z, mode='r') as z:
+        tamanos = {info.filename: info.uncompressed for info in z.list()} if miembros is not None else {}
+        if hasattr(z, "readall"):
+            # py7zr < 1.0: API read/readall con BytesIO por miembro
+            leidos = sorted((z.read(objetivos) if objetivos else z.readall()).items())
+            items = [(buffer, os.path.basename(nombre)) for nombre, buffer in leidos]
+            contar("imagenes_escaneadas", len(items))
+            registros = escanear_imagenes(items, hilos)
+            if miembros is not None:
+                miembros.extend((nombre, tamanos.get(nombre), registro)
+                                for (nombre, _), registro in zip(leidos, registros))
+            for (buffer, filename), registro in zip(items, registros):
+                if es_seleccionable(registro):
+                    seleccionadas.append((buffer.getvalue(), filename, registro["Pes"], registro["Vta"]))
+            return seleccionadas
+
+        fabrica = FabricaMiembros()
+        if objetivos:
+            z.extract(targets=objetivos, factory=fabrica)
+        else:
+            z.extractall(factory=fabrica)
+    contar("imagenes_escaneadas", len(fabrica.miembros))
+
+    for nombre in sorted(fabrica.miembros):
+        miembro = fabrica.miembros[nombre]
+        miembro.close()  # por si la versión de py7zr no lo llama
+        if miembros is not None:
+            miembros.append((nombre, tamanos.get(nombre), miembro.registro))
+        if es_seleccionable(miembro.registro):
+            registro = miembro.registro
+            seleccionadas.append((miembro.buffer.getvalue(), os.path.basename(nombre), registro["Pes"], registro["Vta"]))
+    return seleccionadas
+
+
+def decodificar_imagen(datos):
+    with Image.open(io.BytesIO(datos)) as img:
+        # Misma orientación que aplica cv2.imread al leer desde disco
+        return ImageOps.exif_transpose(img).convert("RGB")
+
+
+# ------------------------
+# ÍNDICE EXIF
+# ------------------------
+def seleccionar_archivo(archivo, huella_7z, file_date, dir_temporal, args):
+    """
+    Selecciona las imágenes de un .7z con el modo de extracción elegido. Si el
+    archivo está en el índice EXIF y no ha cambiado, solo se extraen los
+    miembros que el índice da por seleccionables; si no, se escanea entero y
+    se indexa para la próxima vez.
+    """
+    ruta_7z = os.path.join(BASE_INPUT, archivo)
+    seleccionar = seleccionar_en_memoria if args.extraccion == "memoria" else seleccionar_en_disco
+    if args.sin_indice:
+        return seleccionar(ruta_7z, dir_temporal, args.hilos_exif)
+
+    if archivo_vigente(INDICE_EXIF, archivo, ruta_7z):
+        objetivos = [miembro for miembro, _, _, _ in miembros_seleccionables(INDICE_EXIF, archivo)]
+        contar("archivos_desde_indice")
+        if not objetivos:
+            return []
+        return seleccionar(ruta_7z, dir_temporal, args.hilos_exif, objetivos=objetivos)
+
+    miembros = []
+    seleccionadas = seleccionar(ruta_7z, dir_temporal, args.hilos_exif, miembros=miembros)
+    guardar_archivo(INDICE_EXIF, archivo, file_date, huella_7z, miembros)
+    contar("archivos_indexados")
+    return seleccionadas
+
+
+def indexar(args):
+    """Modo --solo-indice: indexa los .7z de las fechas elegidas sin inferir (salta los ya indexados salvo --force)."""
+    indexados = 0
+    for archivo, file_date in listar_archivos(args):
+        ruta_7z = os.path.join(BASE_INPUT, archivo)
+        if not args.force and archivo_vigente(INDICE_EXIF, archivo, ruta_7z):
+            continue
+        miembros = []
+        try:
+            seleccionadas = seleccionar_en_memoria(ruta_7z, hilos=args.hilos_exif, miembros=miembros)
+        except py7zr.Bad7zFile as e:
+            print(f"Archivo 7z corrupto o inválido, {archivo}: {e}")
+            continue
+        guardar_archivo(INDICE_EXIF, archivo, file_date, huella(ruta_7z), miembros)
+        print(f"{archivo}: {len(miembros)} miembros indexados, {len(seleccionadas)} seleccionables")
+        indexados += 1
+    print(f"Archivos indexados: {indexados}. Índice en {INDICE_EXIF}")
+
+
+# ------------------------
+# INFERENCIA POR LOTES
+# ------------------------
+def anotar(filename, salidas, cada_anotada):
+    """Si se guarda la imagen anotada: siempre en 'completo', nunca en 'etiquetas' y 1 de cada N en el resto."""
+    if salidas == "completo":
+        return True
+    if salidas == "etiquetas":
+        return False
+    return zlib.crc32(filename.encode("utf-8")) % max(1, cada_anotada) == 0
+
+
+def guardar_resultado(resultado, filename, dir_salida, salidas="completo", cada_anotada=CADA_ANOTADA):
+    """
+    Escribe labels/<nombre>.txt y la imagen anotada como lo hace ultralytics con
+    save_txt/save, según la política de salidas. En 'mascaras' no hay etiqueta:
+    los polígonos van al almacén de la fecha (escribir_resultados).
+    """
+    if salidas != "mascaras":
+        nombre_base = os.path.splitext(filename)[0]
+        ruta_txt = os.path.join(dir_salida, "labels", f"{nombre_base}.txt")
+        if os.path.exists(ruta_txt):
+            os.remove(ruta_txt)  # save_txt añade al final del fichero
+        resultado.save_txt(ruta_txt, save_conf=True)
+    if anotar(filename, salidas, cada_anotada) and not getattr(resultado, "reutilizado", False):
+        resultado.save(filename=os.path.join(dir_salida, filename))
+        contar("imagenes_anotadas")
+
+
+def tamano_original(resultado):
+    """(ancho, alto) de la imagen de un resultado."""
+    alto, ancho = getattr(resultado, "orig_shape", (IMAGE_HEIGHT, IMAGE_WIDTH))[:2]
+    return int(ancho), int(alto)
+
+
+def bloque_mascaras(resultado, filename):
+    """
+    Entrada del almacén de máscaras de un resultado, sin los polígonos de menos
+    de 2 puntos (que labels/ tampoco aporta); None si no queda ninguno.
+    """
+    if resultado.masks is None or resultado.boxes is None:
+        return None
+    poligonos = [(clase, conf, xyn) for clase, conf, xyn in
+                 zip(resultado.boxes.cls.tolist(), resultado.boxes.conf.tolist(), resultado.masks.xyn)
+                 if len(xyn) >= 2]
+    if not poligonos:
+        return None
+    clases, confianzas, xyns = (list(v) for v in zip(*poligonos))
+    return os.path.splitext(filename)[0], clases, confianzas, xyns, tamano_original(resultado)
+
+
+def inferir_lote(yolo, lote, dir_salida, calcular_areas=False, salidas="completo", cada_anotada=CADA_ANOTADA,
+                 cache=None):
+    """
+    Lanza una única llamada a predict() para todas las imágenes del lote, guarda
+    los resultados y devuelve las filas (filename, pes, vta) en el mismo orden.
+    Con calcular_areas devuelve además las áreas de cada imagen a partir de sus
+    máscaras: [(filename, pes, vta)], [(filename, identificadores, areas)].
+    Con dir_salida=None no se escribe nada (trabajos 'lote' del servicio).
+    Con cache (CacheDuplicados) se guarda la predicción de cada imagen para
+    reutilizarla en sus repeticiones.
+    lote: lista de tuplas (fuente, filename, pes, vta); fuente es una ruta o los
+    bytes de la imagen (modo memoria).
+    """
+    entradas, filas = [], []
+    for fuente, filename, pes, vta in lote:
+        if isinstance(fuente, bytes):
+            try:
+                fuente = decodificar_imagen(fuente)
+            except Exception as e:
+                print(f"Error decodificando imagen: {filename} -> {e}")
+                continue
+        entradas.append(fuente)
+        filas.append((filename, pes, vta))
+
+    resultados, filas = predecir(yolo, entradas, filas)
+    if not resultados:
+        return [], []
+    if cache is not None:
+        memorizar(cache, resultados, filas)
+    return escribir_resultados(resultados, filas, dir_salida, calcular_areas, salidas, cada_anotada)
+
+
+def predecir(yolo, entradas, filas):
+    """
+    Una llamada a predict() para todo el lote. Si falla, se repite imagen a imagen
+    para perder solo las imágenes que fallan (como antes de inferir por lotes).
+    Devuelve (resultados, filas) de las imágenes inferidas, en el mismo orden.
+    """
+    if not entradas:
+        return [], []
     try:
-        os.makedirs(BASE_RESULTS, exist_ok=True)
+        return yolo.predict(entradas, batch=len(entradas), save=False), filas
     except Exception as e:
-        print(f"No se pudo crear o acceder a {BASE_RESULTS}: {e}")
+        print(f"Error en inferencia del lote ({len(entradas)} imágenes, {filas[0][0]} ...) -> {e}")
+    if len(entradas) == 1:
+        return [], []
 
-    yolo = YOLO(YOLO_WEIGHTS)
+    resultados, correctas = [], []
+    for entrada, fila in zip(entradas, filas):
+        try:
+            resultados.append(yolo.predict([entrada], batch=1, save=False)[0])
+            correctas.append(fila)
+        except Exception as e:
+            print(f"Error en inferencia: {fila[0]} -> {e}")
+    print(f"[INFO] Lote repetido imagen a imagen: {len(correctas)} de {len(filas)} imágenes inferidas")
+    return resultados, correctas
 
-    # Archivo de salida
-    with open(OUTPUT_TXT, mode="w") as txtfile:
-        txtfile.write("Imagen\tPes\tVta\n")
 
-        print("-> Archivo en carpeta de entrada:", os.listdir(BASE_INPUT))
-        for archivo in sorted(os.listdir(BASE_INPUT)):
+def escribir_resultados(resultados, filas, dir_salida, calcular_areas=False, salidas="completo",
+                        cada_anotada=CADA_ANOTADA):
+    """Guarda los resultados de un lote (si hay dir_salida) y calcula sus áreas. Devuelve (filas, areas)."""
+    if dir_salida is not None:
+        os.makedirs(dir_salida, exist_ok=True)
+    areas, mascaras, tamanos = [], [], []
+    for resultado, (filename, _, _) in zip(resultados, filas):
+        if dir_salida is not None:
+            guardar_resultado(resultado, filename, dir_salida, salidas, cada_anotada)
+            if salidas == "mascaras":
+                bloque = bloque_mascaras(resultado, filename)
+                if bloque is not None:
+                    mascaras.append(bloque)
+            else:
+                # Sin imagen anotada de cada imagen la etapa 2 (--escala real) no sabría su tamaño
+                tamanos.append((os.path.splitext(filename)[0], tamano_original(resultado)))
+        if calcular_areas:
+            identificadores, areas_img = areas_desde_resultado(resultado)
+            # Igual que en la etapa 2: sin detecciones no hay etiqueta ni entrada de áreas
+            if identificadores:
+                areas.append((filename, identificadores, areas_img))
+    if mascaras:
+        escribir_mascaras(dir_salida, mascaras)
+    if tamanos:
+        escribir_tamanos(dir_salida, tamanos)
+    return filas, areas
 
-            if not (archivo.startswith(f"OPMM_Subasta_{YEAR}") and archivo.endswith(".7z")):
-                print(f" - Se salta {archivo}")
-                continue
 
-            # Parsear fecha del archivo
-            nombre_sin_ext, _ = os.path.splitext(archivo)
-            partes = nombre_sin_ext.split("_")
-            if len(partes) < 3:
-                print(f"Error en {archivo} con split() -> partes = {partes}")
-                continue
+# ------------------------
+# PROCESAMIENTO DE UN ARCHIVO
+# ------------------------
+def ruta_fragmento(archivo):
+    return os.path.join(DIR_FRAGMENTOS, os.path.splitext(archivo)[0] + ".txt")
+
+
+def ruta_resultados(file_date):
+    return os.path.join(BASE_RESULTS, f"yolo_inference_results_{file_date}_")
+
+
+def procesar_archivo(yolo, archivo, file_date, args):
+    """
+    Extrae, filtra e infiere un .7z y escribe sus filas Pes/Vta en su fragmento
+    de DIR_FRAGMENTOS. Devuelve un resumen (huella del .7z, salidas y tiempos)
+    o None si el archivo no se pudo abrir.
+    """
+    ruta_7z = os.path.join(BASE_INPUT, archivo)
+    print(f"Procesando {archivo} desde la ruta {ruta_7z}")
+    huella_7z = huella(ruta_7z)
+
+    # Temporal propio por proceso para que los workers no se pisen
+    dir_temporal = BASE_TEMPORAL if args.workers <= 1 else f"{BASE_TEMPORAL}_{os.getpid()}"
+
+    # Extraer y filtrar por EXIF
+    t0 = time.perf_counter()
+    try:
+        seleccionadas = seleccionar_archivo(archivo, huella_7z, file_date, dir_temporal, args)
+    except py7zr.Bad7zFile as e:
+        print(f"Archivo 7z corrupto o inválido, {archivo}: {e}")
+        contar("archivos_corruptos")
+        return None
+    t_extraccion = time.perf_counter() - t0
+    observar("extraccion_archivo", t_extraccion)
+    contar("imagenes_seleccionadas", len(seleccionadas))
+    print(f"{archivo}: {len(seleccionadas)} imágenes seleccionadas en {t_extraccion:.1f} s ({args.extraccion})")
+
+    dir_salida = ruta_resultados(file_date)
+    cache, duplicadas, orden = None, [], None
+    if args.dedup:
+        cache = CacheDuplicados(os.path.join(dir_salida, NOMBRE_CACHE), args.distancia_dedup)
+        orden = {filename: i for i, (_, filename, _, _) in enumerate(seleccionadas)}
+        seleccionadas, duplicadas = separar_duplicados(archivo, seleccionadas, cache, args.hilos_exif)
+
+    # Inferencia YOLO por lotes
+    batch_size = max(1, args.batch_size)
+    filas, areas = [], []
+    t0 = time.perf_counter()
+    for i in range(0, len(seleccionadas), batch_size):
+        t_lote = time.perf_counter()
+        filas_lote, areas_lote = inferir_lote(yolo, seleccionadas[i:i + batch_size], dir_salida,
+                                              args.areas_directas, args.salidas, args.cada_anotada, cache)
+        if filas_lote:
+            # Una sola llamada a predict por lote: la latencia por imagen es la media del lote
+            observar("inferencia_imagen", (time.perf_counter() - t_lote) / len(filas_lote), len(filas_lote))
+        filas.extend(filas_lote)
+        areas.extend(areas_lote)
+    t_inferencia = time.perf_counter() - t0
+    contar("imagenes_inferidas", len(filas))
+
+    reutilizadas = 0
+    if cache is not None:
+        resultados, filas_dup, sin_original = reutilizar(duplicadas, cache)
+        filas_dup, areas_dup = escribir_resultados(resultados, filas_dup, dir_salida, args.areas_directas,
+                                                   args.salidas, args.cada_anotada)
+        # Repeticiones cuya original no llegó a inferirse: se infieren ellas mismas
+        for i in range(0, len(sin_original), batch_size):
+            filas_lote, areas_lote = inferir_lote(yolo, sin_original[i:i + batch_size], dir_salida,
+                                                  args.areas_directas, args.salidas, args.cada_anotada, cache)
+            filas_dup.extend(filas_lote)
+            areas_dup.extend(areas_lote)
+        cache.guardar()
+        reutilizadas = len(resultados)
+        print(f"{archivo}: {reutilizadas} inferencias evitadas reutilizando la predicción de una foto repetida")
+        filas, areas = ordenar(filas + filas_dup, areas + areas_dup, orden)
+
+    resumen = cerrar_archivo(archivo, huella_7z, file_date, filas, areas, dir_temporal, args.areas_directas)
+    resumen.update({
+        "t_extraccion": t_extraccion,
+        "t_inferencia": t_inferencia,
+        "reutilizadas": reutilizadas,
+        "metricas": extraer(),  # desde un worker no se ven los contadores del proceso principal
+    })
+    return resumen
+
+
+def cerrar_archivo(archivo, huella_7z, file_date, filas, areas, dir_temporal, areas_directas):
+    """Escribe las áreas (si se piden) y el fragmento del archivo, borra su temporal y devuelve su resumen."""
+    if areas_directas:
+        escribir_areas(areas, file_date)
+
+    if dir_temporal and os.path.exists(dir_temporal):
+        shutil.rmtree(dir_temporal)
+
+    os.makedirs(DIR_FRAGMENTOS, exist_ok=True)
+    with open(ruta_fragmento(archivo), mode="w") as fragmento:
+        for filename, pes, vta in filas:
+            fragmento.write(f"{filename}\t{pes}\t{vta}\n")
+
+    return {
+        "archivo": archivo,
+        "huella": huella_7z,
+        "fecha": str(file_date),
+        "fragmento": ruta_fragmento(archivo),
+        "resultados": ruta_resultados(file_date),
+        "inferidas": len(filas),
+    }
+
+
+def escribir_areas(areas, file_date):
+    """
+    Escribe AREAS/areas_resultados_<fecha>.txt con el mismo formato que la etapa 2
+    (un archivo .7z por fecha: el fichero se rehace entero).
+    """
+    os.makedirs(BASE_AREAS, exist_ok=True)
+    output_txt = os.path.join(BASE_AREAS, f"areas_resultados_{file_date}.txt")
+    if os.path.exists(output_txt):
+        os.remove(output_txt)
+    escribir_areas_txt(
+        ((os.path.splitext(filename)[0] + ".txt", identificadores, areas_img)
+         for filename, identificadores, areas_img in areas),
+        output_txt
+    )
+    print(f"Áreas de {len(areas)} imágenes escritas en {output_txt}")
+
+
+def combinar_fragmentos(archivos, output_txt, modo="w"):
+    """
+    Copia los fragmentos de `archivos` a output_txt en ese orden. Con modo="w"
+    reconstruye la tabla completa; con modo="a" añade al final de la existente.
+    Guarda la huella del resultado en HUELLA_TABLA (ver tabla_desde_fragmentos).
+    """
+    with open(output_txt, mode=modo) as txtfile:
+        if modo == "w":
+            txtfile.write("Imagen\tPes\tVta\n")
+        for archivo in archivos:
+            with open(ruta_fragmento(archivo)) as fragmento:
+                shutil.copyfileobj(fragmento, txtfile)
+    tabla = {}
+    registrar(tabla, os.path.basename(output_txt), huella(output_txt))
+    guardar_catalogo(tabla, HUELLA_TABLA)
+
+
+def tabla_desde_fragmentos(output_txt):
+    """
+    True si output_txt es exactamente el que dejó combinar_fragmentos. Una tabla
+    de versiones anteriores (escrita imagen a imagen, sin manifiesto) o editada a
+    mano no lo es, y añadirle fragmentos duplicaría filas.
+    """
+    return sin_cambios(cargar_catalogo(HUELLA_TABLA).get(os.path.basename(output_txt)), output_txt)
 
+
+# ------------------------
+# FOTOS REPETIDAS (--dedup)
+# ------------------------
+def separar_duplicados(archivo, seleccionadas, cache, hilos=HILOS_EXIF):
+    """
+    Calcula el dHash de cada imagen seleccionada y separa las que hay que
+    inferir de las que repiten una foto anterior del día (mismo Pes y Vta y
+    hash a distancia <= cache.distancia_max). Las primeras se apuntan en la
+    caché. Devuelve (a_inferir, [(entrada, original)]) con las entradas
+    (fuente, filename, pes, vta) de seleccionar_archivo.
+    """
+    with medir("dhash_archivo"):
+        hashes = calcular_dhashes([fuente for fuente, _, _, _ in seleccionadas], hilos)
+    a_inferir, duplicadas = [], []
+    for entrada, hash_img in zip(seleccionadas, hashes):
+        _, filename, pes, vta = entrada
+        original = cache.buscar(hash_img, pes, vta)
+        if original is not None and original != filename:
+            duplicadas.append((entrada, original))
+        else:
+            cache.anotar(filename, hash_img, pes, vta)
+            a_inferir.append(entrada)
+    print(f"{archivo}: {len(duplicadas)} de {len(seleccionadas)} imágenes repiten una foto anterior del día")
+    return a_inferir, duplicadas
+
+
+def memorizar(cache, resultados, filas):
+    """Guarda en la caché la predicción de cada imagen inferida."""
+    for resultado, (filename, _, _) in zip(resultados, filas):
+        cache.guardar_prediccion(filename, resultado)
+
+
+def reutilizar(duplicadas, cache):
+    """
+    Predicciones guardadas de las originales de `duplicadas`, listas para
+    escribir_resultados: (resultados, filas, sin_original). sin_original son
+    las entradas cuya original no tiene predicción (falló su inferencia).
+    """
+    resultados, filas, sin_original = [], [], []
+    for entrada, original in duplicadas:
+        prediccion = cache.prediccion(original)
+        if prediccion is None:
+            sin_original.append(entrada)
+            continue
+        resultados.append(prediccion)
+        filas.append(entrada[1:])
+    contar("inferencias_evitadas", len(resultados))
+    return resultados, filas, sin_original
+
+
+def ordenar(filas, areas, orden):
+    """Devuelve filas y áreas en el orden de selección, con las repeticiones en su sitio."""
+    return (sorted(filas, key=lambda fila: orden[fila[0]]),
+            sorted(areas, key=lambda area: orden[area[0]]))
+
+
+# ------------------------
+# INFERENCIA ENCADENADA
+# ------------------------
+HILOS_DECODIFICACION = 4
+COLA_DECODIFICACION = 32  # imágenes en decodificación o decodificadas esperando a la inferencia
+COLA_ESCRITURA = 4        # lotes inferidos esperando al escritor
+
+
+class Abortado(Exception):
+    """Otra fase del flujo encadenado ha fallado: las demás dejan de esperar en sus colas."""
+
+
+class ColaMedida(queue.Queue):
+    """
+    Cola acotada que mide cuánto se bloquea quien escribe (cola llena: la fase
+    siguiente no da abasto) y quien lee (cola vacía: la anterior no da abasto),
+    y la ocupación que ve cada lectura. Todo va también a las métricas como
+    cola_<nombre>_espera_llena / _espera_vacia / _ocupacion / _lecturas.
+    """
+
+    def __init__(self, nombre, maxsize, parar):
+        super().__init__(max(1, maxsize))
+        self.nombre = nombre
+        self.parar = parar
+        self.espera_llena = self.espera_vacia = 0.0
+        self.ocupacion = self.lecturas = 0
+
+    def poner(self, item):
+        t0 = time.perf_counter()
+        while True:
             try:
-                fecha = partes[2]
-                file_date = datetime.datetime.strptime(fecha, "%Y-%m-%d").date()
-            except (IndexError, ValueError) as e:
-                print(f"¡No se ha parseado la fecha de {archivo} -> {e}")
-                continue
+                self.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                if self.parar.is_set():
+                    raise Abortado()
+        espera = time.perf_counter() - t0
+        self.espera_llena += espera
+        observar(f"cola_{self.nombre}_espera_llena", espera)
 
-            if not get_date(file_date, args):
-                print(f"{archivo} - (fecha {file_date}) fuera de rango {args.initial_date} -- {args.final_date}")
-                continue
+    def sacar(self):
+        ocupacion = self.qsize()
+        self.ocupacion += ocupacion
+        self.lecturas += 1
+        contar(f"cola_{self.nombre}_ocupacion", ocupacion)
+        contar(f"cola_{self.nombre}_lecturas")
+        t0 = time.perf_counter()
+        while True:
+            try:
+                item = self.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if self.parar.is_set():
+                    raise Abortado()
+        espera = time.perf_counter() - t0
+        self.espera_vacia += espera
+        observar(f"cola_{self.nombre}_espera_vacia", espera)
+        return item
 
-            ruta_7z = os.path.join(BASE_INPUT, archivo)
-            print(f"Procesando {archivo} desde la ruta {ruta_7z}")
+    def resumen(self):
+        media = self.ocupacion / self.lecturas if self.lecturas else 0
+        return (f"cola {self.nombre}: ocupación media {media:.1f}/{self.maxsize}, "
+                f"productor bloqueado {self.espera_llena:.1f} s, consumidor esperando {self.espera_vacia:.1f} s")
 
-            # Reset temporal folder
-            if os.path.exists(BASE_TEMPORAL):
-                shutil.rmtree(BASE_TEMPORAL)
 
-            os.makedirs(BASE_TEMPORAL)
+def preparar_imagen(fuente):
+    """
+    Decodifica una imagen (bytes o ruta) al array BGR contiguo que predict()
+    construiría internamente, para que el hilo de inferencia no lo haga. El
+    letterbox a 640 lo sigue haciendo predict(): así las máscaras siguen
+    referidas a la imagen original y las salidas no cambian.
+    """
+    if isinstance(fuente, bytes):
+        return np.ascontiguousarray(np.asarray(decodificar_imagen(fuente))[:, :, ::-1])
+    import cv2
+    imagen = cv2.imread(fuente)
+    if imagen is None:
+        raise ValueError("no se pudo leer la imagen")
+    return imagen
 
+
+def resolver_duplicados(yolo, ctx, escritura, batch_size):
+    """
+    Al cerrar un archivo en modo encadenado: manda al escritor las predicciones
+    reutilizadas de sus repeticiones (y las que no tienen original, inferidas
+    aquí mismo) y guarda la caché del día.
+    """
+    resultados, filas, sin_original = reutilizar(ctx["duplicadas"], ctx["cache"])
+    if resultados:
+        escritura.poner(("lote", resultados, filas, ctx["dir_salida"]))
+    for i in range(0, len(sin_original), batch_size):
+        entradas, filas = [], []
+        for fuente, filename, pes, vta in sin_original[i:i + batch_size]:
             try:
-                with py7zr.SevenZipFile(ruta_7z, mode='r') as z:
-                    z.extractall(BASE_TEMPORAL)
-            except py7zr.Bad7zFile as e:
-                print(f"Archivo 7z corrupto o inválido, {archivo}: {e}")
-                continue
+                entradas.append(preparar_imagen(fuente))
+                filas.append((filename, pes, vta))
+            except Exception as e:
+                print(f"Error decodificando imagen: {filename} -> {e}")
+        resultados_lote, filas = predecir(yolo, entradas, filas)
+        if resultados_lote:
+            memorizar(ctx["cache"], resultados_lote, filas)
+            escritura.poner(("lote", resultados_lote, filas, ctx["dir_salida"]))
+    ctx["cache"].guardar()
+    ctx["reutilizadas"] = len(resultados)
+    print(f"{ctx['archivo']}: {len(resultados)} inferencias evitadas reutilizando la predicción de una foto repetida")
+
 
-            # Iterar sobre imágenes extraídas
-            for root, _, files in os.walk(BASE_TEMPORAL):
-                for filename in sorted(files):
-                    ruta_img = os.path.join(root, filename)
+def inferir_encadenado(yolo, pendientes, args, registrar_resumen):
+    """
+    Procesa `pendientes` con las fases solapadas y colas acotadas entre ellas:
 
+        lector (hilo): extrae y filtra cada .7z y encarga la decodificación
+          -> pool de --hilos-decodificacion hilos (preparar_imagen)
+          -> cola 'decodificadas' (--cola-decodificacion imágenes)
+        inferencia (este hilo): lotes de --batch-size por predict()
+          -> cola 'escritura' (--cola-escritura lotes)
+        escritor (hilo): etiquetas, imágenes anotadas, áreas y, al cerrar cada
+          archivo, su fragmento y su entrada del manifiesto (registrar_resumen)
+
+    Las salidas son las mismas que con procesar_archivo archivo a archivo.
+    """
+    parar = threading.Event()
+    decodificadas = ColaMedida("decodificadas", args.cola_decodificacion, parar)
+    escritura = ColaMedida("escritura", args.cola_escritura, parar)
+    errores = []
+    batch_size = max(1, args.batch_size)
+
+    def lector(pool):
+        try:
+            for archivo, file_date in pendientes:
+                ruta_7z = os.path.join(BASE_INPUT, archivo)
+                print(f"Procesando {archivo} desde la ruta {ruta_7z}")
+                # Temporal por archivo: el siguiente se extrae mientras se infiere este
+                dir_temporal = f"{BASE_TEMPORAL}_{os.path.splitext(archivo)[0]}"
+                huella_7z = huella(ruta_7z)
+
+                t0 = time.perf_counter()
+                try:
+                    seleccionadas = seleccionar_archivo(archivo, huella_7z, file_date, dir_temporal, args)
+                except py7zr.Bad7zFile as e:
+                    print(f"Archivo 7z corrupto o inválido, {archivo}: {e}")
+                    contar("archivos_corruptos")
+                    continue
+                t_extraccion = time.perf_counter() - t0
+                observar("extraccion_archivo", t_extraccion)
+                contar("imagenes_seleccionadas", len(seleccionadas))
+                print(f"{archivo}: {len(seleccionadas)} imágenes seleccionadas en {t_extraccion:.1f} s ({args.extraccion})")
+
+                dir_salida = ruta_resultados(file_date)
+                ctx = {"archivo": archivo, "huella": huella_7z, "file_date": file_date, "dir_temporal": dir_temporal,
+                       "t_extraccion": t_extraccion, "dir_salida": dir_salida, "cache": None, "reutilizadas": 0}
+                if args.dedup:
+                    # Las repeticiones no se decodifican: se resuelven al cerrar el archivo
+                    ctx["cache"] = CacheDuplicados(os.path.join(dir_salida, NOMBRE_CACHE), args.distancia_dedup)
+                    ctx["orden"] = {filename: i for i, (_, filename, _, _) in enumerate(seleccionadas)}
+                    seleccionadas, ctx["duplicadas"] = separar_duplicados(archivo, seleccionadas, ctx["cache"],
+                                                                          args.hilos_exif)
+                for fuente, filename, pes, vta in seleccionadas:
+                    decodificadas.poner(("imagen", pool.submit(preparar_imagen, fuente), (filename, pes, vta),
+                                         dir_salida, ctx["cache"]))
+                decodificadas.poner(("archivo", ctx))
+            decodificadas.poner(("fin",))
+        except Abortado:
+            pass
+        except Exception as e:
+            errores.append(e)
+            parar.set()
+
+    def escritor():
+        filas, areas = [], []
+        try:
+            while True:
+                tipo, *datos = escritura.sacar()
+                if tipo == "fin":
+                    return
+                if tipo == "lote":
+                    resultados, filas_lote, dir_salida = datos
+                    with medir("escritura_lote"):
+                        filas_lote, areas_lote = escribir_resultados(resultados, filas_lote, dir_salida,
+                                                                     args.areas_directas, args.salidas,
+                                                                     args.cada_anotada)
+                    filas.extend(filas_lote)
+                    areas.extend(areas_lote)
+                else:
+                    ctx, t_inferencia = datos
+                    contar("imagenes_inferidas", len(filas) - ctx["reutilizadas"])
+                    if ctx["cache"] is not None:
+                        filas, areas = ordenar(filas, areas, ctx["orden"])
+                    resumen = cerrar_archivo(ctx["archivo"], ctx["huella"], ctx["file_date"], filas, areas,
+                                             ctx["dir_temporal"], args.areas_directas)
+                    resumen.update({"t_extraccion": ctx["t_extraccion"], "t_inferencia": t_inferencia,
+                                    "reutilizadas": ctx["reutilizadas"], "metricas": None})  # mismo proceso: ya están en el registro
+                    registrar_resumen(resumen)
+                    filas, areas = [], []
+        except Abortado:
+            pass
+        except Exception as e:
+            errores.append(e)
+            parar.set()
+
+    print(f"Inferencia encadenada: {args.hilos_decodificacion} hilos de decodificación, "
+          f"colas de {decodificadas.maxsize} imágenes y {escritura.maxsize} lotes")
+    with ThreadPoolExecutor(max_workers=max(1, args.hilos_decodificacion)) as pool:
+        hilo_lector = threading.Thread(target=lector, args=(pool,), name="lector", daemon=True)
+        hilo_escritor = threading.Thread(target=escritor, name="escritor", daemon=True)
+        hilo_lector.start()
+        hilo_escritor.start()
+        try:
+            lote, dir_lote, cache, t_inferencia = [], None, None, 0.0
+            while True:
+                tipo, *datos = decodificadas.sacar()
+                if tipo == "fin":
+                    escritura.poner(("fin",))
+                    break
+                if tipo == "imagen":
+                    futuro, fila, dir_lote, cache = datos
                     try:
-                        with Image.open(ruta_img) as img:
-                            exifdata = img._getexif()
-                            if not exifdata:
-                                print(f"No hay EXIF en {filename}; se salta")
-                                continue
-
-                            for _, data in exifdata.items():
-                                if isinstance(data, bytes):
-                                    data = data.decode("utf-8", errors="ignore")
-                                metadatos = get_metadatos(data)
-                                metadatos.setdefault("Ord", "None")
-
-                                # Criterios
-                                if (
-                                    metadatos.get("FAO") == "ARA" and
-                                    metadatos.get("Caj") == "001" and
-                                    (metadatos.get("Ord") == "1" or "Ord" not in metadatos)
-                                ):
-                                    # Inferencia YOLO
-                                    yolo.predict(
-                                        ruta_img,
-                                        save=True,
-                                        save_txt=True,
-                                        save_conf=True,
-                                        project=BASE_RESULTS,
-                                        name=f"yolo_inference_results_{file_date}_"
-                                    )
-
-                                    pes = metadatos.get("Pes", "N/A").replace(",", ".").strip()
-                                    vta = metadatos.get("Vta", "N/A").replace(",", ".").strip()
-                                    txtfile.write(f"{filename}\t{pes}\t{vta}\n")
+                        lote.append((futuro.result(), fila))
                     except Exception as e:
-                        print(f"Error procesando imagen: {ruta_img} -> {e}")
+                        print(f"Error decodificando imagen: {fila[0]} -> {e}")
+                    if len(lote) < batch_size:
                         continue
 
-            shutil.rmtree(BASE_TEMPORAL)
+                # Lote completo o fin de archivo (los lotes no mezclan archivos)
+                if lote:
+                    filas = [fila for _, fila in lote]
+                    t0 = time.perf_counter()
+                    resultados, filas = predecir(yolo, [entrada for entrada, _ in lote], filas)
+                    t_lote = time.perf_counter() - t0
+                    t_inferencia += t_lote
+                    if resultados:
+                        observar("inferencia_imagen", t_lote / len(filas), len(filas))
+                        if cache is not None:
+                            memorizar(cache, resultados, filas)
+                        escritura.poner(("lote", resultados, filas, dir_lote))
+                    lote = []
+                if tipo == "archivo":
+                    ctx = datos[0]
+                    if ctx["cache"] is not None:
+                        resolver_duplicados(yolo, ctx, escritura, batch_size)
+                    escritura.poner(("archivo", ctx, t_inferencia))
+                    t_inferencia = 0.0
+        except Abortado:
+            pass
+        except BaseException:
+            parar.set()
+            raise
+        finally:
+            hilo_lector.join()
+            hilo_escritor.join()
+
+    print(decodificadas.resumen())
+    print(escritura.resumen())
+    if errores:
+        raise errores[0]
+
+
+# ------------------------
+# MANIFIESTO
+# ------------------------
+def ya_procesado(manifiesto, archivo):
+    entrada = manifiesto.get(archivo)
+    return (
+        entrada is not None and
+        os.path.isfile(entrada.get("fragmento", "")) and
+        sin_cambios(entrada, os.path.join(BASE_INPUT, archivo))
+    )
+
+
+def borrar_salidas_fragmento(dir_salida, fragmento):
+    """Borra del directorio de resultados lo que escribió la inferencia de `fragmento`."""
+    # Un .7z por fecha: el almacén de máscaras y tamanos.tsv del directorio son enteros de este archivo
+    borrar_mascaras(dir_salida)
+    cache_duplicados = os.path.join(dir_salida, NOMBRE_CACHE)
+    if os.path.exists(cache_duplicados):
+        os.remove(cache_duplicados)
+    with open(fragmento) as f:
+        for linea in f:
+            filename = linea.split("\t", 1)[0].strip()
+            if not filename:
+                continue
+            nombre_base = os.path.splitext(filename)[0]
+            for ruta in (os.path.join(dir_salida, filename),
+                         os.path.join(dir_salida, "labels", f"{nombre_base}.txt")):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+    # Sin etiquetas, labels/ no debe quedar: la etapa 2 lo tomaría por una fecha sin detecciones
+    labels = os.path.join(dir_salida, "labels")
+    if os.path.isdir(labels) and not os.listdir(labels):
+        os.rmdir(labels)
+
+
+def limpiar_salidas_previas(entrada):
+    """
+    Borra las etiquetas, imágenes anotadas, máscaras, caché de duplicados y
+    fragmento de una inferencia anterior del mismo archivo.
+    """
+    dir_salida = entrada.get("resultados", "")
+    fragmento = entrada.get("fragmento", "")
+    if not os.path.isfile(fragmento):
+        return
+    if os.path.isdir(dir_salida):
+        borrar_salidas_fragmento(dir_salida, fragmento)
+    # El último: si el reproceso falla, la tabla no debe recuperar las filas de la inferencia anterior
+    os.remove(fragmento)
+
+
+# ------------------------
+# WORKERS
+# ------------------------
+_yolo_worker = None
+
+
+def cargar_modelo(pesos=None, backend="pytorch", int8=False, datos_calibracion=None):
+    # Import diferido (dentro de backend_yolo): en modo cliente no se paga la carga de torch/ultralytics
+    return cargar(pesos or YOLO_WEIGHTS, backend, int8, datos_calibracion or None)
+
+
+def iniciar_worker(hilos_torch, backend="pytorch", int8=False):
+    """Inicializador de cada proceso: limita los hilos de torch y carga el modelo una sola vez."""
+    global _yolo_worker
+    if hilos_torch > 0:
+        import torch
+        torch.set_num_threads(hilos_torch)
+    _yolo_worker = cargar_modelo(backend=backend, int8=int8)
+
+
+def modelo_local(args, hilos_torch):
+    """Modelo para inferir en el proceso principal (con --hilos-torch se limitan sus hilos)."""
+    if args.hilos_torch:
+        # iniciar_worker carga sin datos de calibración: se exporta antes, como con el pool
+        exportar(YOLO_WEIGHTS, args.backend, args.int8, datos_calibracion=args.datos_calibracion or None)
+        iniciar_worker(hilos_torch, args.backend, args.int8)
+        return _yolo_worker
+    return cargar_modelo(backend=args.backend, int8=args.int8, datos_calibracion=args.datos_calibracion)
+
+
+def procesar_archivo_worker(archivo, file_date, args):
+    return procesar_archivo(_yolo_worker, archivo, file_date, args)
+
+
+# ------------------------
+# SERVICIO DE INFERENCIA
+# ------------------------
+OPCIONES_SERVICIO = ("extraccion", "hilos_exif", "batch_size", "areas_directas", "sin_indice", "salidas",
+                     "cada_anotada", "dedup", "distancia_dedup")
+
+
+def servir_modelo(args):
+    """
+    Modo --servir: carga el modelo una sola vez y atiende trabajos hasta que se
+    pare. Si best.pt cambia en disco, se recarga antes del siguiente trabajo.
+      - 'archivo': procesa un .7z de BASE_INPUT como en local (mismas salidas) y
+        devuelve su resumen y sus filas (Imagen, Pes, Vta).
+      - 'lote': imágenes [(bytes, filename)]; filtra por EXIF, infiere sin
+        escribir nada y devuelve filas (filename, pes, vta) y áreas por imagen.
+    """
+    comprobar_clave()  # antes de cargar el modelo
+    if args.hilos_torch:
+        import torch
+        torch.set_num_threads(args.hilos_torch)
+    modelo = {"yolo": cargar_modelo(backend=args.backend, int8=args.int8, datos_calibracion=args.datos_calibracion),
+              "mtime": os.path.getmtime(YOLO_WEIGHTS) if os.path.exists(YOLO_WEIGHTS) else None}
+
+    def actual():
+        if os.path.exists(YOLO_WEIGHTS) and os.path.getmtime(YOLO_WEIGHTS) != modelo["mtime"]:
+            print(f"[INFO] {YOLO_WEIGHTS} ha cambiado; se recarga el modelo", flush=True)
+            modelo["yolo"] = cargar_modelo(backend=args.backend, int8=args.int8,
+                                           datos_calibracion=args.datos_calibracion)
+            modelo["mtime"] = os.path.getmtime(YOLO_WEIGHTS)
+        return modelo["yolo"]
+
+    def atender(peticion):
+        if peticion["tipo"] == "archivo":
+            opciones = argparse.Namespace(workers=1, **peticion["opciones"])
+            fecha = datetime.date.fromisoformat(peticion["fecha"])
+            resumen = procesar_archivo(actual(), peticion["archivo"], fecha, opciones)
+            filas = []
+            if resumen is not None:
+                with open(resumen["fragmento"]) as fragmento:
+                    filas = [tuple(linea.rstrip("\n").split("\t")) for linea in fragmento]
+            return {"resumen": resumen, "filas": filas}
+        if peticion["tipo"] == "lote":
+            imagenes = peticion["imagenes"]
+            registros = escanear_imagenes(imagenes, peticion.get("hilos_exif", HILOS_EXIF))
+            lote = [(datos, filename, r["Pes"], r["Vta"])
+                    for (datos, filename), r in zip(imagenes, registros) if es_seleccionable(r)]
+            filas, areas = inferir_lote(actual(), lote, None, calcular_areas=True)
+            contar("imagenes_inferidas", len(filas))
+            return {"filas": filas, "areas": areas, "metricas": extraer()}
+        raise ValueError(f"Tipo de trabajo desconocido: {peticion['tipo']}")
+
+    servir(atender, args.puerto, info={"pesos": os.path.abspath(YOLO_WEIGHTS), "backend": args.backend,
+                                       "int8": args.int8})
+
+
+def procesar_en_servicio(pendientes, args, registrar_resumen):
+    """
+    Modo --cliente: envía los .7z pendientes al servicio de uno en uno.
+    Devuelve los que quedan por procesar en local: todos si el servicio no está
+    en marcha y los restantes si se cae a mitad.
+    """
+    try:
+        comprobar_clave()
+    except ClaveNoConfigurada as e:
+        print(f"[WARN] Sin clave para el servicio de inferencia ({e}); se infiere en este proceso")
+        return pendientes
+    info = estado(args.puerto)
+    if info is None:
+        print(f"[WARN] No hay servicio de inferencia en el puerto {args.puerto}; se infiere en este proceso")
+        return pendientes
+    print(f"[INFO] Usando el servicio de inferencia (pid {info['pid']}, activo desde {info['arranque']})")
+
+    opciones = {k: getattr(args, k) for k in OPCIONES_SERVICIO}
+    for i, (archivo, file_date) in enumerate(pendientes):
+        try:
+            respuesta = enviar({"tipo": "archivo", "archivo": archivo, "fecha": str(file_date),
+                                "opciones": opciones}, args.puerto)
+        except ServicioNoDisponible as e:
+            print(f"[WARN] El servicio de inferencia dejó de responder ({e}); "
+                  f"los {len(pendientes) - i} archivos restantes se infieren en este proceso")
+            return pendientes[i:]
+        except ErrorServicio as e:
+            print(f"[ERROR] El servicio no pudo procesar {archivo}: {e}")
+            continue
+        registrar_resumen(respuesta["resumen"])
+    return []
+
+
+# ------------------------
+# VERIFICACIÓN DEL BACKEND
+# ------------------------
+def verificar_backend(args):
+    """
+    Modo --verificar-backend: toma hasta --muestra imágenes seleccionables de
+    los .7z de las fechas elegidas, las pasa por best.pt y por el backend y
+    guarda el informe junto al artefacto (<artefacto>.verificacion.json).
+    Devuelve True si num_gambas queda dentro de --tolerancia.
+    """
+    if args.backend == "pytorch":
+        print("[WARN] --verificar-backend compara un backend exportado con best.pt; indica --backend onnx u openvino")
+        return False
+
+    lote = []
+    for archivo, _ in listar_archivos(args):
+        for datos, filename, pes, _ in seleccionar_en_memoria(os.path.join(BASE_INPUT, archivo), hilos=args.hilos_exif):
+            try:
+                lote.append((decodificar_imagen(datos), filename, pes))
+            except Exception as e:
+                print(f"Error decodificando imagen: {filename} -> {e}")
+            if len(lote) >= args.muestra:
+                break
+        if len(lote) >= args.muestra:
+            break
+
+    referencia = cargar_modelo()
+    candidato = cargar_modelo(backend=args.backend, int8=args.int8, datos_calibracion=args.datos_calibracion)
+    informe = comparar_modelos(referencia, candidato, lote, args.tolerancia, max(1, args.batch_size))
+    informe.update({"backend": args.backend, "int8": args.int8, "pesos": os.path.abspath(YOLO_WEIGHTS),
+                    "fecha": datetime.datetime.now().isoformat(timespec="seconds")})
+
+    ruta_informe = ruta_artefacto(YOLO_WEIGHTS, args.backend, args.int8) + ".verificacion.json"
+    with open(ruta_informe, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    variante = args.backend + (" INT8" if args.int8 else "")
+    if not informe["imagenes"]:
+        print(f"[ERROR] No hay imágenes seleccionables en las fechas indicadas para verificar {variante}")
+        return False
+    print(f"Verificación {variante} frente a best.pt ({informe['imagenes']} imágenes):")
+    print(f"  num_gambas: diferencia media {informe['num_gambas_dif_media']:.2%}, "
+          f"p95 {informe['num_gambas_dif_p95']:.2%}, máx {informe['num_gambas_dif_max']:.2%} "
+          f"({informe['imagenes_fuera_tolerancia']} imágenes fuera de {args.tolerancia:.2%})")
+    print(f"  conteos por clase iguales en {informe['conteos_iguales']:.1%} de las imágenes "
+          f"({informe['detecciones_distintas']} detecciones distintas)")
+    print(f"  IoU de máscaras: medio {informe['iou_medio']:.3f}, mínimo {informe['iou_min']:.3f}")
+    if informe["area_2_dif_media"] is not None:
+        print(f"  área total de clase 2: diferencia media {informe['area_2_dif_media']:.2%}")
+    print(f"[{'OK' if informe['ok'] else 'ERROR'}] {variante} {'dentro' if informe['ok'] else 'fuera'} "
+          f"de la tolerancia. Informe en {ruta_informe}")
+    return informe["ok"]
+
+
+# ------------------------
+# VIGILANCIA DE LA CARPETA DE ENTRADA
+# ------------------------
+ETAPAS_FECHA = ("2_calcular_areas_segmentos_gamba.py", "3_calculo_peso_medio_num_gamba.py",
+                "4b_combina_lonja_imagen.py")
+ETAPA_COMBINA = "4b_combina_lonja_imagen.py"
+# Entradas de lonja de la etapa 4b: si cambian se repite el cruce de las fechas afectadas
+LONJA_ENTRADAS = (os.path.join(BASE_COMBINADOS, "ARA.csv"), os.path.join(BASE, "data", "ventaslonja_parquet"))
+
+
+def fecha_de_archivo(archivo):
+    """Fecha de un OPMM_Subasta_<YYYY-MM-DD>*.7z, o None si el nombre no encaja."""
+    if not (archivo.startswith("OPMM_Subasta_") and archivo.endswith(".7z")):
+        return None
+    try:
+        return datetime.datetime.strptime(os.path.splitext(archivo)[0].split("_")[2], "%Y-%m-%d").date()
+    except (IndexError, ValueError):
+        return None
+
+
+def archivo_completo(ruta_7z):
+    """True si py7zr puede leer la cabecera del .7z, que se escribe al final: la copia ha terminado."""
+    try:
+        with py7zr.SevenZipFile(ruta_7z, mode="r") as z:
+            z.getnames()
+        return True
+    except Exception:
+        return False
+
+
+def archivos_listos(vistos, descartados, args):
+    """
+    Sondea BASE_INPUT y devuelve [(archivo, file_date)] de los .7z que ya se
+    pueden procesar: de YEAR en adelante y dentro de las fechas de los
+    argumentos (como en listar_archivos), con el mismo tamaño y mtime que en el
+    sondeo anterior, sin modificar desde hace --espera-estable s y con la
+    cabecera legible. `vistos` guarda (tamaño, mtime) de cada archivo entre
+    sondeos; los de `descartados` (ilegibles o que fallaron con esa misma
+    firma) no se reintentan.
+    """
+    listos = []
+    ahora = time.time()
+    for archivo in sorted(os.listdir(BASE_INPUT)):
+        file_date = fecha_de_archivo(archivo)
+        # Desde YEAR y no solo YEAR: el servicio sigue en marcha al cambiar de año
+        if file_date is None or file_date.year < YEAR or not get_date(file_date, args):
+            continue
+        try:
+            stat = os.stat(os.path.join(BASE_INPUT, archivo))
+        except OSError:
+            continue  # borrado o renombrado entre listdir y stat
+        firma = (stat.st_size, stat.st_mtime)
+        anterior, vistos[archivo] = vistos.get(archivo), firma
+        if anterior != firma or ahora - stat.st_mtime < args.espera_estable or descartados.get(archivo) == firma:
+            continue
+        if archivo_completo(os.path.join(BASE_INPUT, archivo)):
+            listos.append((archivo, file_date))
+        else:
+            print(f"[WARN] {archivo} lleva {args.espera_estable} s sin cambios pero no se puede abrir; "
+                  f"se ignora hasta que cambie", flush=True)
+            descartados[archivo] = firma
+    return listos
+
+
+def lanzar_etapas_fecha(fechas, areas_directas=False, etapas=ETAPAS_FECHA):
+    """
+    Ejecuta `etapas` (por defecto 2, 3 y 4b) solo para `fechas` (--fecha), cada
+    una en su proceso y en orden. La 2 se salta si la etapa 1 ya escribió las
+    áreas. Si una falla no se lanzan las siguientes. Devuelve True si todas
+    terminan bien.
+    """
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    fechas = [str(f) for f in fechas]
+    for script in etapas:
+        if areas_directas and script.startswith("2_"):
+            continue
+        t0 = time.perf_counter()
+        proceso = subprocess.run([sys.executable, os.path.join(directorio, script), "--fecha", *fechas],
+                                 cwd=directorio)
+        if proceso.returncode != 0:
+            print(f"[ERROR] {script} --fecha {' '.join(fechas)} terminó con código {proceso.returncode}; "
+                  f"no se lanzan las etapas siguientes", flush=True)
+            return False
+        print(f"[OK] {script} --fecha {' '.join(fechas)} en {time.perf_counter() - t0:.1f} s", flush=True)
+    return True
+
+
+def firma_lonja():
+    """
+    (tamaño, mtime) de ARA.csv y del parquet de la lonja (el más reciente de sus
+    ficheros de datos; el catálogo y los temporales, que empiezan por '_' o '.',
+    no cuentan, igual que al leerlo).
+    """
+    firmas = []
+    for ruta in LONJA_ENTRADAS:
+        if os.path.isdir(ruta):
+            stats = [os.stat(os.path.join(raiz, f)) for raiz, _, ficheros in os.walk(ruta) for f in ficheros
+                     if not f.startswith(("_", "."))]
+            firmas.append((sum(st.st_size for st in stats), max((st.st_mtime for st in stats), default=0.0)))
+        elif os.path.isfile(ruta):
+            stat = os.stat(ruta)
+            firmas.append((stat.st_size, stat.st_mtime))
+        else:
+            firmas.append(None)
+    return tuple(firmas)
+
+
+def fechas_por_combinar(desde_mtime):
+    """
+    Fechas (de YEAR en adelante) con resultados_procesados de la etapa 3 cuyo
+    DATOS_GAMBA_<fecha>.csv no existe o es anterior a `desde_mtime` (la última
+    modificación de la lonja): las que hay que volver a cruzar.
+    """
+    fechas = []
+    if not os.path.isdir(BASE_COMBINADOS):
+        return fechas
+    for fname in sorted(os.listdir(BASE_COMBINADOS)):
+        if not (fname.startswith("resultados_procesados_") and fname.endswith(".csv")):
+            continue
+        fecha_str = fname[len("resultados_procesados_"):-len(".csv")]
+        try:
+            if datetime.datetime.strptime(fecha_str, "%Y-%m-%d").year < YEAR:
+                continue
+        except ValueError:
+            continue
+        salida = os.path.join(BASE_COMBINADOS, "DATOS_GAMBA", f"DATOS_GAMBA_{fecha_str}.csv")
+        if not os.path.isfile(salida) or os.path.getmtime(salida) < desde_mtime:
+            fechas.append(fecha_str)
+    return fechas
+
+
+def vigilar(args):
+    """
+    Modo --vigilar: en lugar de esperar a la ejecución semanal, procesa cada
+    OPMM_Subasta_*.7z en cuanto llega. Cada --intervalo s sondea BASE_INPUT
+    (sondeo y no inotify: la carpeta está en Windows y así vale también para
+    unidades de red); un .7z nuevo o modificado se infiere cuando lleva
+    --espera-estable s sin cambiar y su cabecera se puede leer, y a
+    continuación se lanzan las etapas 2, 3 y 4b para su fecha. Si alguna
+    falla, la fecha queda pendiente y se reintenta en el sondeo siguiente.
+    Cuando cambia la lonja (ARA.csv o su parquet) se repite la 4b de las fechas
+    sin cruzar o cruzadas con la lonja anterior. Los archivos que ya están en
+    el manifiesto sin cambios no se repiten. Ctrl+C para salir.
+    """
+    print(f"[INFO] Vigilando {BASE_INPUT} cada {args.intervalo} s "
+          f"(un .7z se procesa tras {args.espera_estable} s sin cambios)", flush=True)
+    yolo = None
+    if not args.cliente:
+        # Se carga una vez para todo el tiempo que esté vigilando
+        yolo = modelo_local(args, args.hilos_torch or (os.cpu_count() or 1))
+    vistos, descartados = {}, {}
+    fechas_pendientes = {}  # fecha -> inicio, con la inferencia hecha y las etapas 2-4b por terminar
+    lonja = firma_lonja()
+    try:
+        while True:
+            manifiesto = cargar_catalogo(MANIFIESTO)
+            for archivo, file_date in archivos_listos(vistos, descartados, args):
+                if ya_procesado(manifiesto, archivo):
+                    continue
+                t0 = time.perf_counter()
+                print(f"[INFO] Nuevo archivo listo: {archivo}", flush=True)
+                with Metricas("1_inferencia", extraccion=args.extraccion, batch=args.batch_size,
+                              backend=args.backend + ("_int8" if args.int8 else ""), encadenado=args.encadenado,
+                              salidas=args.salidas, dedup=args.dedup, vigilar=True):
+                    inferir(args, [(archivo, file_date)], yolo)
+                manifiesto = cargar_catalogo(MANIFIESTO)
+                if not ya_procesado(manifiesto, archivo):
+                    print(f"[ERROR] No se pudo procesar {archivo}; no se reintenta hasta que cambie", flush=True)
+                    descartados[archivo] = vistos[archivo]
+                    continue
+                fechas_pendientes.setdefault(file_date, t0)
+
+            for file_date, t0 in sorted(fechas_pendientes.items()):
+                if lanzar_etapas_fecha([file_date], args.areas_directas):
+                    del fechas_pendientes[file_date]
+                    print(f"[OK] {file_date} procesada de principio a fin en {time.perf_counter() - t0:.1f} s",
+                          flush=True)
+                else:
+                    print(f"[ERROR] Las etapas 2-4b de {file_date} han fallado; se reintentan en el siguiente "
+                          f"sondeo", flush=True)
+
+            nueva_lonja = firma_lonja()
+            if nueva_lonja != lonja:
+                desde_mtime = max((f[1] for f in nueva_lonja if f is not None), default=0.0)
+                fechas = fechas_por_combinar(desde_mtime)
+                print(f"[INFO] La lonja ha cambiado; se vuelven a cruzar {len(fechas)} fechas", flush=True)
+                if not fechas or lanzar_etapas_fecha(fechas, etapas=(ETAPA_COMBINA,)):
+                    lonja = nueva_lonja
+            time.sleep(max(1, args.intervalo))
+    except KeyboardInterrupt:
+        if fechas_pendientes:
+            print(f"[WARN] Fechas con las etapas 2-4b sin terminar: "
+                  f"{', '.join(str(f) for f in sorted(fechas_pendientes))}")
+        print("[INFO] Vigilancia detenida.")
+
+
+# ------------------------
+# MAIN
+# ------------------------
+def listar_archivos(args):
+    """Devuelve [(archivo, file_date)] de los .7z del año a procesar, ordenados por nombre."""
+    pendientes = []
+    print("-> Archivo en carpeta de entrada:", os.listdir(BASE_INPUT))
+    for archivo in sorted(os.listdir(BASE_INPUT)):
+
+        if not (archivo.startswith(f"OPMM_Subasta_{YEAR}") and archivo.endswith(".7z")):
+            print(f" - Se salta {archivo}")
+            continue
+
+        # Parsear fecha del archivo
+        nombre_sin_ext, _ = os.path.splitext(archivo)
+        partes = nombre_sin_ext.split("_")
+        if len(partes) < 3:
+            print(f"Error en {archivo} con split() -> partes = {partes}")
+            continue
+
+        try:
+            fecha = partes[2]
+            file_date = datetime.datetime.strptime(fecha, "%Y-%m-%d").date()
+        except (IndexError, ValueError) as e:
+            print(f"¡No se ha parseado la fecha de {archivo} -> {e}")
+            continue
+
+        if not get_date(file_date, args):
+            print(f"{archivo} - (fecha {file_date}) fuera de rango {args.initial_date} -- {args.final_date}")
+            continue
+
+        pendientes.append((archivo, file_date))
+    return pendientes
+
+
+def main():
+    args = parser_arguments()
+    if args.parar_servicio:
+        try:
+            enviar({"tipo": "parar"}, args.puerto)
+            print("Servicio de inferencia detenido.")
+        except ServicioNoDisponible as e:
+            print(f"No hay servicio de inferencia en el puerto {args.puerto} ({e}).")
+        return
+    if args.servir:
+        try:
+            servir_modelo(args)
+        except ClaveNoConfigurada as e:
+            print(f"[ERROR] No se arranca el servicio de inferencia: {e}")
+            raise SystemExit(1)
+        return
+    if args.solo_indice:
+        indexar(args)
+        return
+    if args.verificar_backend:
+        if not verificar_backend(args):
+            raise SystemExit(1)
+        return
+    if args.vigilar:
+        vigilar(args)
+        return
+    with Metricas("1_inferencia", extraccion=args.extraccion, workers=args.workers, batch=args.batch_size,
+                  backend=args.backend + ("_int8" if args.int8 else ""), encadenado=args.encadenado,
+                  salidas=args.salidas, dedup=args.dedup):
+        inferir(args)
+
+
+def inferir(args, archivos=None, yolo=None):
+    """
+    Infiere los .7z pendientes: los de las fechas de los argumentos o, si se da,
+    la lista `archivos` [(archivo, file_date)]. `yolo` evita cargar el modelo
+    otra vez (modo --vigilar).
+    """
+    # Preparar directorios
+    try:
+        os.makedirs(BASE_RESULTS, exist_ok=True)
+    except Exception as e:
+        print(f"No se pudo crear o acceder a {BASE_RESULTS}: {e}")
+
+    # Saltar lo que ya está en el manifiesto y no ha cambiado (salvo --force)
+    manifiesto = cargar_catalogo(MANIFIESTO)
+    pendientes, repetidos = [], False
+    for archivo, file_date in listar_archivos(args) if archivos is None else archivos:
+        if not args.force and ya_procesado(manifiesto, archivo):
+            print(f"{archivo} ya procesado y sin cambios; se salta (usa --force para repetir)")
+            contar("archivos_sin_cambios")
+            continue
+        if archivo in manifiesto:
+            # Fuera del manifiesto hasta que el reproceso termine bien (registrar_resumen lo vuelve a añadir)
+            limpiar_salidas_previas(manifiesto.pop(archivo))
+            repetidos = True
+        pendientes.append((archivo, file_date))
+    if repetidos:
+        guardar_catalogo(manifiesto, MANIFIESTO)
+
+    # Si se repite algún archivo hay que reconstruir la tabla; si todos son nuevos basta con añadir,
+    # siempre que la tabla actual salga de los fragmentos (no la de una versión sin manifiesto)
+    reconstruir = not os.path.isfile(OUTPUT_TXT) or repetidos
+    if not reconstruir and not tabla_desde_fragmentos(OUTPUT_TXT):
+        anterior = OUTPUT_TXT + ".anterior"
+        print(f"[WARN] {OUTPUT_TXT} no se generó a partir de los fragmentos; se reconstruye desde el "
+              f"manifiesto y la tabla actual se conserva en {anterior}")
+        shutil.copyfile(OUTPUT_TXT, anterior)
+        reconstruir = True
+
+    resumenes = []
+
+    def registrar_resumen(resumen):
+        if resumen is None:
+            return
+        combinar(resumen["metricas"])
+        contar("archivos_procesados")
+        registrar(manifiesto, resumen["archivo"], resumen["huella"], fecha=resumen["fecha"],
+                  fragmento=resumen["fragmento"], resultados=resumen["resultados"],
+                  imagenes=resumen["inferidas"])
+        guardar_catalogo(manifiesto, MANIFIESTO)
+        resumenes.append(resumen)
+
+    locales = procesar_en_servicio(pendientes, args, registrar_resumen) if pendientes and args.cliente else pendientes
+    workers = 1 if args.encadenado else max(1, min(args.workers, len(locales)))
+    hilos_torch = args.hilos_torch or max(1, (os.cpu_count() or 1) // workers)
+
+    if not pendientes:
+        print("No hay archivos nuevos o modificados que procesar.")
+    elif not locales:
+        print(f"{len(pendientes)} archivos procesados por el servicio de inferencia")
+    elif workers == 1:
+        if yolo is None:
+            yolo = modelo_local(args, hilos_torch)
+        if args.encadenado:
+            inferir_encadenado(yolo, locales, args, registrar_resumen)
+        else:
+            for archivo, file_date in locales:
+                registrar_resumen(procesar_archivo(yolo, archivo, file_date, args))
+    else:
+        print(f"Procesando {len(locales)} archivos con {workers} workers ({hilos_torch} hilos torch cada uno)")
+        # Exportar antes de lanzar los workers para que no lo hagan todos a la vez
+        exportar(YOLO_WEIGHTS, args.backend, args.int8, datos_calibracion=args.datos_calibracion or None)
+        with ProcessPoolExecutor(max_workers=workers, initializer=iniciar_worker,
+                                 initargs=(hilos_torch, args.backend, args.int8)) as pool:
+            futuros = [pool.submit(procesar_archivo_worker, archivo, file_date, args)
+                       for archivo, file_date in locales]
+            for futuro in as_completed(futuros):
+                registrar_resumen(futuro.result())
+
+    # Tabla de resultados: los fragmentos se unen en orden de nombre (fecha),
+    # independientemente del worker que los generó
+    if reconstruir:
+        combinar_fragmentos(sorted(a for a in manifiesto if os.path.isfile(ruta_fragmento(a))), OUTPUT_TXT)
+    else:
+        combinar_fragmentos(sorted(r["archivo"] for r in resumenes), OUTPUT_TXT, modo="a")
 
+    total_inferidas = sum(r["inferidas"] for r in resumenes)
+    total_reutilizadas = sum(r.get("reutilizadas", 0) for r in resumenes)
+    t_extraccion = sum(r["t_extraccion"] for r in resumenes)
+    t_inferencia = sum(r["t_inferencia"] for r in resumenes)
+    print(f"Archivos procesados: {len(resumenes)} de {len(pendientes)} pendientes")
+    print(f"Extracción y filtrado EXIF ({args.extraccion}): {t_extraccion:.1f} s")
+    if total_inferidas > total_reutilizadas:
+        inferidas = total_inferidas - total_reutilizadas
+        print(f"Imágenes inferidas: {inferidas} en {t_inferencia:.1f} s "
+              f"({inferidas / t_inferencia:.2f} img/s por proceso, batch={max(1, args.batch_size)})")
+    if args.dedup:
+        print(f"Inferencias evitadas por fotos repetidas (--dedup): {total_reutilizadas}")
     print(f"Inferencia finalizada. Resultados en: {OUTPUT_TXT}")
 
 
@@ -1,25 +1,49 @@
 #!/usr/bin/env python3
 
 import os
+import time
+import argparse
 import cv2
 import numpy as np
 from datetime import datetime
 import shutil
 
+from areas_gamba import (IMAGE_WIDTH, IMAGE_HEIGHT, INDICE_MASCARAS, leer_etiquetas, areas_poligonos,
+                         tamano_imagen, escribir_areas_txt, escribir_areas_parquet, leer_indice_mascaras,
+                         leer_mascaras, leer_tamanos)
+from metricas import Metricas, contar, observar
+
 # -------------------------
 # CONFIGURACIÓN
 # -------------------------
 BASE = "C:\\Users\\UIB\\Desktop\\REMAR-automatizacion"
 INFERENCE_DIR = os.path.join(BASE, "INFERENCE")
 RESULTS_DIR = os.path.join(BASE, "AREAS")
+PARQUET_SUBDIR = "areas_parquet"  # dentro de RESULTS_DIR: fecha=YYYY-MM-DD/areas.parquet
 TEMP_DIR = os.path.join(BASE, "TEMP")
 
-IMAGE_WIDTH, IMAGE_HEIGHT = 640, 640
+
+# -------------------------
+# ARGUMENTOS
+# -------------------------
+def parser_arguments():
+    parser = argparse.ArgumentParser("Áreas de segmentos de gamba")
+    parser.add_argument('--escala', choices=["referencia", "real"], default="referencia",
+                        help="referencia: rejilla 640x640 con vértices enteros (la del modelo área->peso); "
+                             "real: tamaño real de cada imagen, sin redondear")
+    parser.add_argument('--formato', choices=["txt", "parquet", "ambos"], default="txt",
+                        help="txt: areas_resultados_<fecha>.txt; parquet: tabla particionada por fecha en "
+                             "AREAS/areas_parquet (columnas image, class_id, area)")
+    parser.add_argument('--fecha', nargs="+", default=None,
+                        help="Procesa solo los subdirectorios de estas fechas (YYYY-MM-DD)")
+    return parser.parse_args()
 
 
 # -------------------------
 # FUNCIONES AUXILIARES
 # -------------------------
+# Implementación polígono a polígono; process_directory usa el motor vectorizado
+# de areas_gamba, que da el mismo resultado con escala="referencia".
 def convertir_txt_a_pixel(entrada, ancho_imagen, alto_imagen):
     with open(entrada, 'r') as file:
         lineas = file.readlines()
@@ -51,14 +75,6 @@ def calculate_areas(poligonos):
     return identificadores, areas
 
 
-def save_areas_to_file_txt(image_name, identifiers, areas, output_path):
-    with open(output_path, 'a') as file:
-        file.write(f"Imagen: {image_name}\n")
-        for identifier, area in zip(identifiers, areas):
-            file.write(f"Identificador: {identifier}, Area: {area}\n")
-        file.write("\n")
-
-
 def extract_datetime(filename):
     try:
         date_str = "_".join(filename.split("_")[2:6])
@@ -71,9 +87,86 @@ def extract_datetime(filename):
 # -------------------------
 # PROCESAMIENTO PRINCIPAL
 # -------------------------
-def process_directory(root_path, output_path):
+def tamanos_reales(subdir_path, label_files):
+    """
+    Tamaño original de cada imagen: el de tamanos.tsv de la etapa 1 o, en
+    resultados anteriores a ese fichero, el de la imagen anotada guardada junto
+    a labels/. Si alguna imagen no tiene ninguno de los dos lanza ValueError:
+    suponer 640x640 mezclaría escalas dentro de la misma fecha.
+    """
+    registrados = leer_tamanos(subdir_path)
+    imagenes = {os.path.splitext(f)[0]: f for f in os.listdir(subdir_path)
+                if f.lower().endswith((".jpg", ".jpeg", ".png"))}
+    tamanos, sin_tamano = [], []
+    for label_file in label_files:
+        nombre = os.path.splitext(label_file)[0]
+        if nombre in registrados:
+            tamanos.append(registrados[nombre])
+        elif nombre in imagenes:
+            tamanos.append(tamano_imagen(os.path.join(subdir_path, imagenes[nombre])))
+        else:
+            sin_tamano.append(label_file)
+    if sin_tamano:
+        raise ValueError(f"{len(sin_tamano)} de {len(label_files)} etiquetas sin tamaño de imagen conocido "
+                         f"(ni en tamanos.tsv ni imagen anotada), p. ej. {sin_tamano[0]}")
+    return np.array(tamanos, dtype=np.float64).reshape(-1, 2)
+
+
+def areas_por_etiqueta(subdir_path, labels_path, label_files, escala="referencia"):
+    """
+    Parsea todas las etiquetas del subdirectorio de una vez y calcula todas las
+    áreas en una pasada. Devuelve [(label_file, identificadores, areas)] en el
+    orden de label_files (también las etiquetas sin polígonos válidos).
+    """
+    rutas = [os.path.join(labels_path, f) for f in label_files]
+    coords, offsets, clases, fichero = leer_etiquetas(rutas)
+
+    if escala == "real":
+        tamanos = tamanos_reales(subdir_path, label_files)[fichero]
+        areas = areas_poligonos(coords, offsets, tamanos[:, 0], tamanos[:, 1])
+    else:
+        areas = areas_poligonos(coords, offsets, IMAGE_WIDTH, IMAGE_HEIGHT, truncar=True)
+
+    # Los polígonos están ordenados por fichero: límites de cada fichero
+    limites = np.searchsorted(fichero, np.arange(len(label_files) + 1))
+    return [
+        (label_file, clases[inicio:fin].tolist(), areas[inicio:fin].tolist())
+        for label_file, inicio, fin in zip(label_files, limites[:-1], limites[1:])
+    ]
+
+
+def areas_por_almacen(subdir_path, escala="referencia"):
+    """
+    Como areas_por_etiqueta, pero leyendo el almacén de máscaras de la etapa 1
+    (--salidas mascaras). Devuelve también los nombres de etiqueta equivalentes.
+    """
+    nombres = [
+        n for n in sorted(leer_indice_mascaras(subdir_path), key=extract_datetime)
+        if n.startswith("OPMM_Subasta_")
+    ]
+    coords, offsets, clases, fichero, tamanos = leer_mascaras(subdir_path, nombres)
+
+    if escala == "real":
+        areas = areas_poligonos(coords, offsets, tamanos[fichero, 0], tamanos[fichero, 1])
+    else:
+        areas = areas_poligonos(coords, offsets, IMAGE_WIDTH, IMAGE_HEIGHT, truncar=True)
+
+    label_files = [f"{n}.txt" for n in nombres]
+    limites = np.searchsorted(fichero, np.arange(len(nombres) + 1))
+    bloques = [
+        (label_file, clases[inicio:fin].tolist(), areas[inicio:fin].tolist())
+        for label_file, inicio, fin in zip(label_files, limites[:-1], limites[1:])
+    ]
+    return label_files, bloques
+
+
+def process_directory(root_path, output_path, escala="referencia", formato="txt", fechas=None):
+    """Calcula las áreas de cada subdirectorio de resultados. Devuelve los subdirectorios que fallaron."""
     os.makedirs(output_path, exist_ok=True)
     os.makedirs(TEMP_DIR, exist_ok=True)
+    fechas_iniciadas = set()
+    fallidos = []
+    bloques_por_fecha = {}  # para parquet: una partición por fecha con todos sus subdirectorios
 
     for subdir in sorted(os.listdir(root_path)):
         subdir_path = os.path.join(root_path, subdir)
@@ -81,7 +174,10 @@ def process_directory(root_path, output_path):
             continue
 
         labels_path = os.path.join(subdir_path, "labels")
-        if not os.path.exists(labels_path):
+        # El almacén manda si existe: al repetir una fecha con --salidas mascaras la etapa 1
+        # borra las etiquetas anteriores, pero puede quedar labels/ (vacío o de otra versión)
+        almacen = os.path.isfile(os.path.join(subdir_path, INDICE_MASCARAS))
+        if not os.path.exists(labels_path) and not almacen:
             print(f"No hay etiquetas en {subdir_path}")
             continue
 
@@ -91,30 +187,71 @@ def process_directory(root_path, output_path):
             datetime.strptime(fecha, "%Y-%m-%d")
             fecha_subdir = fecha
         except Exception as e:
-            archivos_labels = sorted([f for f in os.listdir(labels_path) if f.endswith(".txt")])
+            if almacen:
+                archivos_labels = sorted(f"{n}.txt" for n in leer_indice_mascaras(subdir_path))
+            else:
+                archivos_labels = sorted([f for f in os.listdir(labels_path) if f.endswith(".txt")])
             if archivos_labels:
                 dt = extract_datetime(archivos_labels[0])
                 fecha_subdir = dt.date().isoformat()
             else:
                 print(f"No se pudo determinar fecha para {subdir_path}; no hay .txt: {e}")
                 continue
+        if fechas and fecha_subdir not in fechas:
+            continue
+
+        t0 = time.perf_counter()
+        if almacen:
+            label_files, bloques = areas_por_almacen(subdir_path, escala)
+        else:
+            label_files = [
+                f for f in sorted(os.listdir(labels_path), key=extract_datetime)
+                if f.endswith(".txt") and f.startswith("OPMM_Subasta_")
+            ]
+            try:
+                bloques = areas_por_etiqueta(subdir_path, labels_path, label_files, escala)
+            except ValueError as e:
+                print(f"[ERROR] {subdir_path}: no se calculan las áreas a escala real: {e}. "
+                      f"Vuelve a inferir la fecha o usa --escala referencia")
+                contar("subdirectorios_sin_tamano")
+                fallidos.append(subdir_path)
+                continue
+        if label_files:
+            # Todo el subdirectorio se calcula de una vez: latencia media por etiqueta
+            observar("areas_etiqueta", (time.perf_counter() - t0) / len(label_files), len(label_files))
+        contar("subdirectorios")
+        contar("etiquetas", len(label_files))
+        contar("poligonos", sum(len(identificadores) for _, identificadores, _ in bloques))
+
+        if formato in ("txt", "ambos"):
+            output_txt = os.path.join(output_path, f"areas_resultados_{fecha_subdir}.txt")
+            # Se rehace el fichero de la fecha en cada ejecución (puede haber varios
+            # subdirectorios por fecha, que sí se acumulan dentro de la misma ejecución)
+            if fecha_subdir not in fechas_iniciadas:
+                fechas_iniciadas.add(fecha_subdir)
+                if os.path.exists(output_txt):
+                    os.remove(output_txt)
+            escribir_areas_txt(bloques, output_txt)
 
-        output_txt = os.path.join(output_path, f"areas_resultados_{fecha_subdir}.txt")
-        label_files = sorted(os.listdir(labels_path), key=extract_datetime)
+        if formato in ("parquet", "ambos"):
+            bloques_por_fecha.setdefault(fecha_subdir, []).extend(bloques)
 
-        for label_file in label_files:
-            if label_file.endswith(".txt") and label_file.startswith("OPMM_Subasta_"):
-                label_file_path = os.path.join(labels_path, label_file)
-                poligonos = convertir_txt_a_pixel(label_file_path, IMAGE_WIDTH, IMAGE_HEIGHT)
-                identifiers, areas = calculate_areas(poligonos)
-                save_areas_to_file_txt(label_file, identifiers, areas, output_txt)
+    for fecha, bloques in sorted(bloques_por_fecha.items()):
+        ruta = escribir_areas_parquet(bloques, os.path.join(output_path, PARQUET_SUBDIR), fecha)
+        print(f"[{fecha}] Áreas en parquet: {ruta}")
 
     shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    return fallidos
 
 
 # -------------------------
 # MAIN
 # -------------------------
 if __name__ == "__main__":
-    process_directory(INFERENCE_DIR, RESULTS_DIR)
+    args = parser_arguments()
+    with Metricas("2_areas", escala=args.escala, formato=args.formato):
+        fallidos = process_directory(INFERENCE_DIR, RESULTS_DIR, args.escala, args.formato, args.fecha)
     print(f"Análisis de áreas completado. Resultados guardados en: {RESULTS_DIR}")
+    if fallidos:
+        print(f"[ERROR] {len(fallidos)} subdirectorios sin áreas: {', '.join(fallidos)}")
+        raise SystemExit(1)
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 
+from areas_gamba import pq, leer_areas_txt, leer_areas_parquet, ruta_particion, peso_desde_area
+from metricas import Metricas, contar, medir, extraer, combinar
+
 # ------------------------
 # CONFIGURACIÓN
 # ------------------------
@@ -12,182 +17,201 @@ import pandas as pd
 # Carpeta principal donde tienes AREAS/, INFERENCE/, TEMP/ y RESULTS/
 BASE_DIR = r"C:\Users\UIB\Desktop\REMAR-automatizacion"
 AREAS_DIR = os.path.join(BASE_DIR, "AREAS")       # contiene areas_resultados_YYYY-MM-DD.txt
+PARQUET_DIR = os.path.join(AREAS_DIR, "areas_parquet")  # alternativa columnar: fecha=YYYY-MM-DD/areas.parquet
 INFERENCE_DIR = os.path.join(BASE_DIR, "INFERENCE")   # contiene un único resultados_metadatos.txt
 TEMP_DIR = os.path.join(AREAS_DIR, "TEMP")        # para guardar los archivos pesos_individuales_por_imagen_<fecha>.txt
 RESULTS_DIR = os.path.join(BASE_DIR, "RESULTS")     # para guardar resultados_procesados_<fecha>.csv
+ARCHIVO_METADATOS = os.path.join(INFERENCE_DIR, "resultados_metadatos.txt")
 
-# Asegurarse de que existan TEMP_DIR y RESULTS_DIR
-os.makedirs(TEMP_DIR, exist_ok=True)
-os.makedirs(RESULTS_DIR, exist_ok=True)
 
-# Parámetros del modelo (idénticos a los de scripts anteriores)
-SLO_HAT = 1.496995
-INT_HAT = -8.178205
+def parser_arguments():
+    parser = argparse.ArgumentParser("Peso medio y número de gambas")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos en paralelo (una fecha por tarea)")
+    parser.add_argument('--fecha', nargs="+", default=None,
+                        help="Procesa solo estas fechas (YYYY-MM-DD)")
+    return parser.parse_args()
 
 
-def procesar_fecha(fecha_str):
+def cargar_metadatos(archivo_metadatos):
+    """
+    Lee una sola vez INFERENCE/resultados_metadatos.txt, lo tipa y lo indexa por
+    fecha: devuelve {'YYYY-MM-DD': DataFrame(Imagen, Pes, Vta)}, con Imagen sin
+    extensión y Pes como float. Devuelve None si no se puede leer.
     """
-    Dada una fecha 'YYYY-MM-DD', busca:
-      - AREAS/areas_resultados_<fecha_str>.txt
-      - INFERENCE/resultados_metadatos.txt (fichero único con todas las fechas)
+    if not os.path.isfile(archivo_metadatos):
+        print(f"ERROR: no existe el fichero global de metadatos:\n  {archivo_metadatos}")
+        return None
 
-    Filtra en ese metadatos solo las filas cuya 'Imagen' contenga fecha_str,
-    y genera:
-      - TEMP/pesos_individuales_por_imagen_<fecha_str>.txt
-      - RESULTS/resultados_procesados_<fecha_str>.csv
+    try:
+        df_meta_full = pd.read_csv(
+            archivo_metadatos,
+            sep='\t',
+            names=['Imagen', 'Pes', 'Vta'],
+            dtype={'Imagen': str, 'Pes': str, 'Vta': str},
+            encoding='cp1252'
+        )
+    except Exception as e:
+        print(f"ERROR al leer metadatos '{archivo_metadatos}': {e}")
+        return None
+
+    # Fecha contenida en el nombre, p. ej. "OPMM_Subasta_2025-05-30_04_55_15.945_Imedea.jpg"
+    # (la cabecera y las filas sin fecha quedan fuera)
+    df_meta_full['Fecha'] = df_meta_full['Imagen'].str.extract(r'(\d{4}-\d{2}-\d{2})', expand=False)
+    df_meta_full = df_meta_full[df_meta_full['Fecha'].notna()].copy()
+
+    # Quitar extensión (.jpg, .png, etc.) de la columna Imagen
+    df_meta_full['Imagen'] = df_meta_full['Imagen'].map(lambda x: os.path.splitext(x.strip())[0])
+
+    # Convertir 'Pes' a float (reemplazar coma por punto)
+    df_meta_full['Pes'] = pd.to_numeric(
+        df_meta_full['Pes'].str.replace(",", ".", regex=False),
+        errors='coerce'
+    ).fillna(0)
+
+    return {
+        fecha: grupo[['Imagen', 'Pes', 'Vta']].reset_index(drop=True)
+        for fecha, grupo in df_meta_full.groupby('Fecha', sort=True)
+    }
+
+
+def leer_areas(fecha_str):
+    """
+    Tabla larga (Bloque, Imagen, Identificador, Area) de las áreas de la fecha.
+    Se usa la partición parquet si existe y no es más antigua que el .txt
+    (p. ej. si la etapa 1 reescribió el .txt con --areas-directas); si no, el .txt.
+    Devuelve None si no hay ninguna de las dos.
     """
-    # 1) Rutas de entrada y salida
     archivo_datos = os.path.join(AREAS_DIR, f"areas_resultados_{fecha_str}.txt")
-    if not os.path.isfile(archivo_datos):
+    archivo_parquet = ruta_particion(PARQUET_DIR, fecha_str)
+    hay_txt = os.path.isfile(archivo_datos)
+
+    if pq is not None and os.path.isfile(archivo_parquet) and (
+        not hay_txt or os.path.getmtime(archivo_parquet) >= os.path.getmtime(archivo_datos)
+    ):
+        try:
+            return leer_areas_parquet(PARQUET_DIR, fecha_str)
+        except Exception as e:
+            print(f"[{fecha_str}] WARNING: no se pudo leer '{archivo_parquet}' ({e}); se usa el .txt")
+
+    if not hay_txt:
         print(f"[{fecha_str}] ERROR: no existe el archivo de áreas:\n  {archivo_datos}")
-        return
+        return None
+    return leer_areas_txt(archivo_datos, fecha_str)
 
-    # Usamos el único fichero de metadatos global
-    archivo_metadatos = os.path.join(INFERENCE_DIR, "resultados_metadatos.txt")
-    if not os.path.isfile(archivo_metadatos):
-        print(f"[{fecha_str}] ERROR: no existe el fichero global de metadatos:\n  {archivo_metadatos}")
-        return
 
+def resumen_por_imagen(df_areas):
+    """
+    A partir de la tabla larga (Bloque, Imagen, Identificador, Area) calcula, en
+    una sola agrupación por bloque 'Imagen:', las columnas Imagen, Num_ID_0_2,
+    Num_ID_2, Area_Media_2 y Peso_Medio_2. Devuelve también los pesos
+    individuales de la clase 2, en el orden del fichero de áreas.
+
+    Los resultados son idénticos bit a bit a los del recorrido línea a línea:
+    bincount acumula en orden (como area_sum_2 += area) y el peso medio se
+    calcula con np.mean sobre los pesos de cada imagen (np.mean suma por
+    parejas, así que una suma agrupada como reduceat no daría lo mismo).
+    """
+    # Un grupo nuevo cada vez que cambia el bloque
+    bloque = df_areas['Bloque'].to_numpy()
+    grupo = np.cumsum(np.r_[True, bloque[1:] != bloque[:-1]]) - 1 if len(bloque) else bloque
+    n_grupos = int(grupo[-1]) + 1 if len(grupo) else 0
+    primera_fila = np.flatnonzero(np.r_[True, np.diff(grupo) != 0]) if len(grupo) else grupo
+
+    clase = df_areas['Identificador'].fillna(-1).to_numpy(dtype=np.int64)
+    area = df_areas['Area'].to_numpy(dtype=np.float64)
+    es_2 = clase == 2
+    es_0_2 = es_2 | (clase == 0)
+
+    num_id_0_2 = np.bincount(grupo[es_0_2], minlength=n_grupos)
+    num_id_2 = np.bincount(grupo[es_2], minlength=n_grupos)
+    area_sum_2 = np.bincount(grupo[es_2], weights=area[es_2], minlength=n_grupos)
+
+    pesos = peso_desde_area(area[es_2])
+    con_2 = num_id_2 > 0
+    peso_medio_2 = np.zeros(n_grupos, dtype=np.float64)
+    if pesos.size:
+        fines = np.cumsum(num_id_2)
+        peso_medio_2[con_2] = [np.mean(pesos[fin - n:fin]) for fin, n in zip(fines[con_2], num_id_2[con_2])]
+
+    divisor = np.where(con_2, num_id_2, 1)
+    df_datos = pd.DataFrame({
+        'Imagen': df_areas['Imagen'].to_numpy()[primera_fila],
+        'Num_ID_0_2': num_id_0_2,
+        'Num_ID_2': num_id_2,
+        'Area_Media_2': np.where(con_2, area_sum_2 / divisor, 0),
+        'Peso_Medio_2': peso_medio_2,
+    })
+    return df_datos, pesos
+
+
+def texto_pesos_individuales(imagenes, num_id_2, pesos):
+    """Contenido de pesos_individuales_por_imagen_<fecha>.txt: 'Imagen: X' y un peso por línea."""
+    lineas_pesos = [f"{p}\n" for p in pesos.tolist()]
+    fines = np.cumsum(num_id_2).tolist()
+    partes = []
+    inicio = 0
+    for img, fin in zip(imagenes, fines):
+        partes.append(f"Imagen: {img}\n")
+        partes.extend(lineas_pesos[inicio:fin])
+        inicio = fin
+    return "".join(partes)
+
+
+def procesar_fecha(fecha_str, df_metadatos):
+    """
+    Dada una fecha 'YYYY-MM-DD', lee:
+      - AREAS/areas_resultados_<fecha_str>.txt (o su partición en AREAS/areas_parquet)
+    y la cruza con df_metadatos, las filas de INFERENCE/resultados_metadatos.txt
+    de esa fecha (ver cargar_metadatos). Genera:
+      - TEMP/pesos_individuales_por_imagen_<fecha_str>.txt
+      - RESULTS/resultados_procesados_<fecha_str>.csv
+    """
+    # 1) Rutas de entrada y salida
     output_pesos_ind = os.path.join(TEMP_DIR, f"pesos_individuales_por_imagen_{fecha_str}.txt")
     archivo_resultados_procesados = os.path.join(RESULTS_DIR, f"resultados_procesados_{fecha_str}.csv")
 
     # -------------------------------------------------------------------------
-    # 2) Leer y procesar el fichero de ÁREAS
+    # 2) Leer y procesar las ÁREAS
     # -------------------------------------------------------------------------
-    # El formato de areas_resultados_<fecha>.txt es:
+    # Tabla larga con una fila por polígono (Identificador/Area) y una fila con
+    # Identificador nulo para las imágenes sin detecciones. Viene de
+    # areas_resultados_<fecha>.txt:
     #   Imagen: OPMM_Subasta_<fecha>_HH_MM_SS._Imedea.txt
     #   Identificador: <clase>, Area: <valor>
-    #   … (varias líneas de Identificador/Area)
-    #   (vacío)
-    #   Imagen: OPMM_Subasta_<fecha>_…_Imedea.txt
-    #   Identificador: …
     #   …
-    with open(archivo_datos, 'r', encoding="utf-8") as f:
-        lines = f.readlines()
-
-    imagenes = []
-    identificador_0_2_list = []
-    identificador_2_list = []
-    area_media_2_list = []
-    pesos_individuales_por_imagen = []
-
-    imagen_actual = None
-    num_id_0_2 = 0
-    num_id_2 = 0
-    area_sum_2 = 0
-    pesos_temp = []
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            # salto de línea, seguimos
-            continue
+    # o de la partición parquet de la fecha (columnas image, class_id, area).
+    df_areas = leer_areas(fecha_str)
+    if df_areas is None:
+        return
 
-        if line.startswith("Imagen:"):
-            # Si ya teníamos una imagen activa, la “cerramos”
-            if imagen_actual is not None:
-                base = os.path.splitext(imagen_actual)[0]  # quita ".txt"
-                imagenes.append(base)
-                identificador_0_2_list.append(num_id_0_2)
-                identificador_2_list.append(num_id_2)
-                area_media_2_list.append(area_sum_2 / num_id_2 if num_id_2 > 0 else 0)
-                pesos_individuales_por_imagen.append(pesos_temp)
-
-            # Arrancamos nuevo bloque con el nombre completo del .txt
-            imagen_actual = line.split(":", 1)[1].strip()
-            num_id_0_2 = 0
-            num_id_2 = 0
-            area_sum_2 = 0
-            pesos_temp = []
-
-        elif line.startswith("Identificador:"):
-            parts = line.split(",")
-            try:
-                identificador = int(parts[0].split(":", 1)[1].strip())
-                area = float(parts[1].split(":", 1)[1].strip())
-            except Exception as e:
-                print(f"[{fecha_str}] WARNING: no pude parsear línea '{line}' → {e}")
-                continue
-
-            if identificador in (0, 2):
-                num_id_0_2 += 1
-            if identificador == 2:
-                num_id_2 += 1
-                area_sum_2 += area
-                peso = np.exp(np.log(area) * SLO_HAT + INT_HAT)
-                pesos_temp.append(peso)
-
-    # Cerrar último bloque si queda
-    if imagen_actual is not None:
-        base = os.path.splitext(imagen_actual)[0]
-        imagenes.append(base)
-        identificador_0_2_list.append(num_id_0_2)
-        identificador_2_list.append(num_id_2)
-        area_media_2_list.append(area_sum_2 / num_id_2 if num_id_2 > 0 else 0)
-        pesos_individuales_por_imagen.append(pesos_temp)
-
-    # 3) Construir DataFrame con resultados de áreas y pesos
-    peso_medio_2_list = [np.mean(p) if p else 0 for p in pesos_individuales_por_imagen]
+    # 3) Resumen por imagen (conteos, área media y peso medio de la clase 2)
+    df_datos, pesos = resumen_por_imagen(df_areas)
+    contar("imagenes", len(df_datos))
+    contar("poligonos", int(df_areas['Identificador'].notna().sum()))
 
-    df_datos = pd.DataFrame({
-        'Imagen': imagenes,
-        'Num_ID_0_2': identificador_0_2_list,
-        'Num_ID_2': identificador_2_list,
-        'Area_Media_2': area_media_2_list,
-        'Peso_Medio_2': peso_medio_2_list
-    })
-
-    # 4) Guardar pesos individuales en TEMP_DIR
+    # 4) Guardar pesos individuales en TEMP_DIR (una sola escritura)
     try:
         with open(output_pesos_ind, 'w', encoding="utf-8") as f_out:
-            for img, lista_pesos in zip(imagenes, pesos_individuales_por_imagen):
-                f_out.write(f"Imagen: {img}\n")
-                for p in lista_pesos:
-                    f_out.write(f"{p}\n")
+            f_out.write(texto_pesos_individuales(df_datos['Imagen'].tolist(), df_datos['Num_ID_2'].to_numpy(), pesos))
         print(f"[{fecha_str}] Pesos individuales escritos en:\n  {output_pesos_ind}")
     except Exception as e:
         print(f"[{fecha_str}] ERROR al escribir '{output_pesos_ind}': {e}")
 
     # -------------------------------------------------------------------------
-    # 5) Leer METADATOS desde INFERENCE/resultados_metadatos.txt y filtrar
+    # 5) METADATOS de la fecha (ya cargados y tipados una sola vez en main)
     # -------------------------------------------------------------------------
-    try:
-        df_meta_full = pd.read_csv(
-            archivo_metadatos,
-            sep='\t',
-            names=['Imagen', 'Pes', 'Vta'],
-            dtype={'Imagen': str, 'Pes': str, 'Vta': str},
-            encoding='cp1252'
-        )
-    except Exception as e:
-        print(f"[{fecha_str}] ERROR al leer metadatos '{archivo_metadatos}': {e}")
+    if df_metadatos is None or df_metadatos.empty:
+        print(f"[{fecha_str}] ADVERTENCIA: no se encontraron metadatos para esta fecha en '{ARCHIVO_METADATOS}'")
         return
 
-    # Filtrar solo aquellas filas cuya columna 'Imagen' contenga la fecha actual
-    # Ejemplo: "OPMM_Subasta_2025-05-30_04_55_15.945_Imedea.jpg"
-    df_metadatos = df_meta_full[df_meta_full['Imagen'].str.contains(fecha_str, na=False)].copy()
-
-    if df_metadatos.empty:
-        print(f"[{fecha_str}] ADVERTENCIA: no se encontraron metadatos para esta fecha en '{archivo_metadatos}'")
-        return
-
-    # Quitar extensión (.jpg, .png, etc.) de la columna Imagen
-    df_metadatos['Imagen'] = df_metadatos['Imagen'].apply(lambda x: os.path.splitext(x.strip())[0])
-
-    # Convertir 'Pes' a float (reemplazar coma por punto)
-    df_metadatos['Pes'] = (
-        df_metadatos['Pes']
-        .str.replace(",", ".", regex=False)
-        .astype(float, errors='ignore')
-        .fillna(0)
-    )
-
     # -------------------------------------------------------------------------
     # 6) Merge entre df_datos (áreas/pesos) y df_metadatos filtrado (Pes/Vta)
     # -------------------------------------------------------------------------
 
     df_final = df_datos.merge(df_metadatos, on='Imagen', how='inner')
     print(f"[{fecha_str}] Filas tras merge: {len(df_final)}")
+    contar("filas_merge", len(df_final))
 
     # Excluir las imágenes sin detecciones de clase 2
     df_final = df_final[df_final['Num_ID_2'] > 0]
@@ -213,29 +237,72 @@ def procesar_fecha(fecha_str):
 
     try:
         df_agrupado.to_csv(archivo_resultados_procesados, index=False)
+        contar("filas_resultado", len(df_agrupado))
         print(f"[{fecha_str}] CSV generado correctamente en:\n  {archivo_resultados_procesados}")
     except Exception as e:
         print(f"[{fecha_str}] ERROR al escribir '{archivo_resultados_procesados}': {e}")
 
 
+def procesar_fecha_medida(fecha_str, df_metadatos):
+    """procesar_fecha midiendo su duración; devuelve las métricas del proceso (también desde un worker)."""
+    with medir("fecha"):
+        procesar_fecha(fecha_str, df_metadatos)
+    contar("fechas")
+    return extraer()
+
+
 def main():
     """
-    Recorre todos los archivos en AREAS_DIR.
-    Si el nombre coincide con 'areas_resultados_YYYY-MM-DD.txt',
-    extrae la fecha y llama a procesar_fecha().
+    Recorre todos los archivos en AREAS_DIR y las particiones de PARQUET_DIR.
+    Si el nombre coincide con 'areas_resultados_YYYY-MM-DD.txt' o
+    'fecha=YYYY-MM-DD', extrae la fecha y llama a procesar_fecha() con los
+    metadatos de esa fecha. Con --workers > 1 las fechas se procesan en paralelo
+    y con --fecha solo se procesan las fechas indicadas.
     """
-    for fname in sorted(os.listdir(AREAS_DIR)):
-        if not (fname.startswith("areas_resultados_") and fname.endswith(".txt")):
-            continue
+    args = parser_arguments()
+    with Metricas("3_peso", workers=args.workers):
+        procesar_fechas(args)
+
+
+def procesar_fechas(args):
+    # Asegurarse de que existan TEMP_DIR y RESULTS_DIR
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
 
-        fecha_str = fname[len("areas_resultados_"):-len(".txt")]
+    metadatos_por_fecha = cargar_metadatos(ARCHIVO_METADATOS)
+    if metadatos_por_fecha is None:
+        return
+
+    candidatas = {}
+    for fname in os.listdir(AREAS_DIR):
+        if fname.startswith("areas_resultados_") and fname.endswith(".txt"):
+            candidatas[fname[len("areas_resultados_"):-len(".txt")]] = fname
+    if os.path.isdir(PARQUET_DIR):
+        for fname in os.listdir(PARQUET_DIR):
+            if fname.startswith("fecha="):
+                candidatas.setdefault(fname[len("fecha="):], fname)
+
+    fechas = []
+    for fecha_str, fname in sorted(candidatas.items()):
         try:
             datetime.datetime.strptime(fecha_str, "%Y-%m-%d")
         except ValueError:
             print(f"Ignorando '{fname}': '{fecha_str}' no tiene formato YYYY-MM-DD")
             continue
-
-        procesar_fecha(fecha_str)
+        if args.fecha and fecha_str not in args.fecha:
+            continue
+        fechas.append(fecha_str)
+
+    workers = max(1, min(args.workers, len(fechas)))
+    if workers == 1:
+        for fecha_str in fechas:
+            combinar(procesar_fecha_medida(fecha_str, metadatos_por_fecha.get(fecha_str)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = [pool.submit(procesar_fecha_medida, fecha_str, metadatos_por_fecha.get(fecha_str))
+                       for fecha_str in fechas]
+            for futuro in futuros:
+                combinar(futuro.result())
 
 
 if __name__ == "__main__":
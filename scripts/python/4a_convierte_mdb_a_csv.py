@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
 import warnings
 import pyodbc
 import pandas as pd
 
+from catalogo import huella, sin_cambios, cargar_catalogo, guardar_catalogo, registrar
+from lonja_parquet import (pa, escribir_lonja_parquet, borrar_lonja_parquet, nombre_origen, cargar_catalogo_lonja,
+                           guardar_catalogo_lonja, origen_vigente, registrar_origen, quitar_origenes_desaparecidos)
+from metricas import Metricas, contar, medir
+
 # ------------------------
 # CONFIGURACIÓN
 # ------------------------
@@ -15,6 +21,16 @@ RAW_DATA_DIR = r"C:\Users\UIB\Desktop\REMAR-automatizacion\data\raw_data"
 # Ruta al CSV que utilizará el script de merge (anteriormente “LONJA_FILE”)
 LONJA_CSV = r"C:\Users\UIB\Desktop\REMAR-automatizacion\RESULTS\ARA.csv"
 
+# Dataset parquet particionado por día (fecha=YYYY-MM-DD/) con las mismas ventas; es
+# el mismo que escribe read_mdb_files.py (con su catálogo dentro) y lo que lee 4b si existe
+LONJA_PARQUET = r"C:\Users\UIB\Desktop\REMAR-automatizacion\data\ventaslonja_parquet"
+
+# Catálogo de los .mdb ya volcados en ARA.csv (huella y filas de cada uno)
+CATALOGO_ARA = os.path.join(os.path.dirname(LONJA_CSV), "catalogo_ara.json")
+
+# Formato fijo de FECHA: al añadir por partes, todas deben escribirse igual
+FECHA_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 # ------------------------
 # FUNCIONES AUXILIARES
 # ------------------------
@@ -32,51 +48,157 @@ def get_mdb_files(directory):
     return mdb_files
 
 
-def process_and_combine_mdb(raw_dir, output_csv):
+def leer_mdb(mdb):
     """
-    Lee todos los archivos .mdb encontrados en raw_dir, extrae la tabla DATOS
-    y los concatena en un único DataFrame. Luego guarda ese DataFrame en output_csv.
+    Lee la tabla DATOS de un .mdb. Devuelve el DataFrame (vacío si no tiene
+    registros) o None si no se pudo leer.
     """
-    mdb_files = get_mdb_files(raw_dir)
-    if not mdb_files:
-        print(f"[WARN] No se encontraron archivos .mdb en {raw_dir}.")
-        return
+    try:
+        conn_str = r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + mdb
+        conn = pyodbc.connect(conn_str, autocommit=True)
+        query = "SELECT * FROM DATOS"
+        df = pd.read_sql(query, conn)
+        conn.close()
+    except Exception as e:
+        print(f"[ERROR] No se pudo procesar {os.path.basename(mdb)}: {e}")
+        return None
+
+    if df.empty:
+        print(f"[WARN] El archivo {os.path.basename(mdb)} no contiene registros en la tabla DATOS. Se omite.")
+        return df
+
+    if 'FECHA' in df.columns:
+        df['FECHA'] = pd.to_datetime(df['FECHA'])
+    return df
 
-    df_list = []
-    for mdb in sorted(mdb_files):
-        try:
-            conn_str = r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + mdb
-            conn = pyodbc.connect(conn_str, autocommit=True)
-            query = "SELECT * FROM DATOS"
-            df = pd.read_sql(query, conn)
-            conn.close()
 
-            if df.empty:
-                print(f"[WARN] El archivo {os.path.basename(mdb)} no contiene registros en la tabla DATOS. Se omite.")
-                continue
+def cabecera_csv(path):
+    with open(path, encoding="utf-8") as f:
+        return f.readline().rstrip("\r\n").split(",")
 
-            if 'FECHA' in df.columns:
-                df['FECHA'] = pd.to_datetime(df['FECHA'])
 
-            df_list.append(df)
+def process_and_combine_mdb(raw_dir, output_csv=None, parquet_dir=None, catalogo_csv=CATALOGO_ARA, forzar=False):
+    """
+    Lee los archivos .mdb de raw_dir, extrae la tabla DATOS y los vuelca en un
+    único CSV (output_csv) y/o en el dataset parquet particionado por día
+    (parquet_dir, un fichero por .mdb y día).
+
+    Es incremental y cada salida lleva su propio catálogo con la huella
+    (tamaño, mtime, sha256) y las filas de cada .mdb ya volcado:
+      - CSV: las filas de los .mdb nuevos se añaden al final; si alguno ya
+        volcado cambió o desapareció se regenera el CSV completo.
+      - parquet: el catálogo del dataset, compartido con read_mdb_files.py. Un
+        .mdb nuevo o modificado (re)escribe solo sus ficheros y uno
+        desaparecido los borra.
+    Cada .mdb pendiente se lee una sola vez aunque lo necesiten las dos salidas.
+    """
+    mdb_files = sorted(os.path.abspath(m) for m in get_mdb_files(raw_dir))
+    if not mdb_files:
+        print(f"[WARN] No se encontraron archivos .mdb en {raw_dir}.")
+        return
 
-        except Exception as e:
-            print(f"[ERROR] No se pudo procesar {os.path.basename(mdb)}: {e}")
-            continue
+    pendientes_csv, pendientes_parquet = set(), set()
+    reconstruir_csv = False
+
+    if output_csv is not None:
+        cat_csv = cargar_catalogo(catalogo_csv)
+        modificados = [m for m in mdb_files if m in cat_csv and not sin_cambios(cat_csv[m], m)]
+        desaparecidos = set(cat_csv) - set(mdb_files)
+        reconstruir_csv = forzar or not os.path.isfile(output_csv) or bool(modificados or desaparecidos)
+        if reconstruir_csv:
+            if modificados or desaparecidos:
+                print(f"[INFO] CSV: {len(modificados)} archivos .mdb modificados y {len(desaparecidos)} "
+                      f"desaparecidos: se regenera {os.path.basename(output_csv)}")
+            cat_csv = {}
+            pendientes_csv = set(mdb_files)
+        else:
+            pendientes_csv = {m for m in mdb_files if m not in cat_csv}
+            print(f"[INFO] CSV: {len(pendientes_csv)} archivos .mdb nuevos, "
+                  f"{len(mdb_files) - len(pendientes_csv)} sin cambios")
+
+    if parquet_dir is not None:
+        if forzar:
+            borrar_lonja_parquet(parquet_dir)
+        cat_parquet = cargar_catalogo_lonja(parquet_dir)
+        quitar_origenes_desaparecidos(cat_parquet, parquet_dir, mdb_files)
+        pendientes_parquet = {m for m in mdb_files if not origen_vigente(cat_parquet, parquet_dir, m)}
+        print(f"[INFO] Parquet: {len(pendientes_parquet)} archivos .mdb nuevos o modificados, "
+              f"{len(mdb_files) - len(pendientes_parquet)} sin cambios")
 
+    df_list = []
+    for mdb in sorted(pendientes_csv | pendientes_parquet):
+        huella_mdb = huella(mdb)
+        with medir("lectura_mdb"):
+            df = leer_mdb(mdb)
+        if df is None:
+            contar("mdb_con_error")
+            continue  # no se registra: se reintentará en la próxima ejecución
+        contar("mdb_leidos")
+        contar("filas_leidas", len(df))
+
+        if mdb in pendientes_parquet:
+            ficheros = escribir_lonja_parquet(df, parquet_dir, nombre_origen(mdb)) if not df.empty else []
+            registrar_origen(cat_parquet, parquet_dir, mdb, huella_mdb, ficheros, len(df))
+        if mdb in pendientes_csv:
+            registrar(cat_csv, mdb, huella_mdb, filas=len(df))
+            if not df.empty:
+                df_list.append(df)
+
+    if parquet_dir is not None:
+        guardar_catalogo_lonja(cat_parquet, parquet_dir)
+        if pendientes_parquet:
+            print(f"[OK] Dataset parquet actualizado en: {parquet_dir}")
+
+    if output_csv is None:
+        return
     if not df_list:
-        print("[WARN] Ningún archivo .mdb generó datos válidos.")
+        if reconstruir_csv:
+            print("[WARN] Ningún archivo .mdb generó datos válidos.")
+        else:
+            print(f"[OK] {os.path.basename(output_csv)} ya está al día.")
+        guardar_catalogo(cat_csv, catalogo_csv)
         return
 
     # Concatenar todos los DataFrames en uno solo
     df_combined = pd.concat(df_list, ignore_index=True)
-    df_combined.to_csv(output_csv, index=False)
-    print(f"[OK] CSV combinado guardado en: {output_csv}")
+
+    if reconstruir_csv:
+        df_combined.to_csv(output_csv, index=False, date_format=FECHA_FORMAT)
+        print(f"[OK] CSV combinado guardado en: {output_csv}")
+    elif cabecera_csv(output_csv) != list(df_combined.columns):
+        print("[WARN] Las columnas de los .mdb nuevos no coinciden con las del CSV; se regenera completo.")
+        return process_and_combine_mdb(raw_dir, output_csv, None, catalogo_csv, forzar=True)
+    else:
+        df_combined.to_csv(output_csv, mode="a", header=False, index=False, date_format=FECHA_FORMAT)
+        print(f"[OK] {len(df_combined)} filas nuevas añadidas a: {output_csv}")
+
+    guardar_catalogo(cat_csv, catalogo_csv)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Combina los .mdb de lonja en ARA.csv")
+    parser.add_argument('--formato', choices=["parquet", "csv", "ambos"], default="parquet",
+                        help="parquet: dataset particionado por día (LONJA_PARQUET; sin pyarrow se "
+                             "escribe ARA.csv); csv: ARA.csv (p. ej. para abrirlo en Excel); ambos")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenera las salidas completas aunque no haya cambios en el catálogo")
+    args = parser.parse_args()
+
     # Suprimir warnings de pandas sobre DBAPI
     warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
 
-    # Procesar y combinar todos los .mdb en un único CSV
-    process_and_combine_mdb(RAW_DATA_DIR, LONJA_CSV)
+    # pyarrow es opcional: sin él se escribe ARA.csv (que es lo que lee 4b en ese caso)
+    escribir_csv = args.formato in ("csv", "ambos")
+    escribir_parquet = args.formato in ("parquet", "ambos")
+    if escribir_parquet and pa is None:
+        print("[WARN] pyarrow no está instalado: no se escribe el dataset parquet, solo ARA.csv")
+        escribir_parquet, escribir_csv = False, True
+
+    # Procesar y combinar los .mdb nuevos (o todos si hubo cambios)
+    with Metricas("4a_lonja", formato=args.formato):
+        process_and_combine_mdb(
+            RAW_DATA_DIR,
+            output_csv=LONJA_CSV if escribir_csv else None,
+            parquet_dir=LONJA_PARQUET if escribir_parquet else None,
+            forzar=args.force,
+        )
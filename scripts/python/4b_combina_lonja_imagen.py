@@ -2,9 +2,13 @@
 
 import os
 import csv
+import argparse
 import pandas as pd
 import datetime
 
+from lonja_parquet import pq, leer_lonja
+from metricas import Metricas, contar, medir
+
 # ------------------------
 # CONFIGURACIÓN
 # ------------------------
@@ -13,30 +17,72 @@ import datetime
 BASE_DIR = r"C:\Users\UIB\Desktop\REMAR-automatizacion"
 RESULTS_DIR = os.path.join(BASE_DIR, "RESULTS")          # contiene archivos resultados_procesados_YYYY-MM-DD.csv
 LONJA_FILE = os.path.join(RESULTS_DIR, "ARA.csv")              # fichero anual con todas las fechas
+LONJA_PARQUET = os.path.join(BASE_DIR, "data", "ventaslonja_parquet")  # dataset de lonja por día (4a y read_mdb_files); preferido si existe
 FILTRADO_LONJA = os.path.join(RESULTS_DIR, "archivo_lonja_filtrado.csv")
 DUPLICADOS_DIR = os.path.join(RESULTS_DIR, "duplicados")
 NO_MERGE_DIR = os.path.join(RESULTS_DIR, "no_merge")
 SALIDA_DIR = os.path.join(RESULTS_DIR, "DATOS_GAMBA")
 
-# Asegurarse de que existan los directorios de salida
-os.makedirs(RESULTS_DIR, exist_ok=True)
-os.makedirs(DUPLICADOS_DIR, exist_ok=True)
-os.makedirs(NO_MERGE_DIR, exist_ok=True)
-os.makedirs(SALIDA_DIR, exist_ok=True)
+
+# ------------------------
+# ARGUMENTOS
+# ------------------------
+def parser_arguments():
+    parser = argparse.ArgumentParser("Combina resultados de gamba con ventas de lonja")
+    parser.add_argument('--modo', choices=["global", "por_dia"], default="global",
+                        help="global: un único merge con todas las fechas y escritura por día; "
+                             "por_dia: un merge por cada resultados_procesados_<fecha>.csv")
+    parser.add_argument('--fecha', nargs="+", default=None,
+                        help="Combina solo estas fechas (YYYY-MM-DD); del parquet de la lonja solo se leen "
+                             "sus particiones")
+    return parser.parse_args()
 
 
 # ------------------------
 # FUNCIONES AUXILIARES
 # ------------------------
-def cargar_y_procesar_lonja(path):
+CLAVE_DEVOLUCION = ['PESONETO', 'IMPORTE', 'NUMVENTA']
+
+
+def indices_pares_devolucion(df):
+    """
+    Índices de las filas que forman pareja con una devolución (NUMENVAS == -1):
+    misma Fecha_sin_hora y mismos |PESONETO|, |IMPORTE| y |NUMVENTA|.
+
+    Equivale a comparar cada fila -1 con todas las demás filas del día, pero
+    agrupando por la clave en una sola pasada: en cuanto un grupo tiene al menos
+    dos filas y una de ellas es -1, se eliminan todas las filas del grupo. Las
+    filas con algún valor nulo en la clave no emparejan con nada.
     """
-    Carga el CSV de lonja (ARA.csv), filtra valores de NUMENVAS entre -1 y 1 (excluyendo 0),
-    convierte FECHA a datetime, genera columna Fecha_sin_hora, y elimina duplicados
-    con NUMENVAS = -1.
-    Devuelve el DataFrame filtrado y un CSV intermedio en FILTRADO_LONJA.
+    claves = pd.DataFrame({'Fecha_sin_hora': df['Fecha_sin_hora']}, index=df.index)
+    for col in CLAVE_DEVOLUCION:
+        claves[col] = df[col].abs()
+    claves['devolucion'] = df['NUMENVAS'] == -1
+
+    grupos = claves.groupby(['Fecha_sin_hora'] + CLAVE_DEVOLUCION, dropna=True, sort=False)['devolucion']
+    tamano = grupos.transform('size')
+    devoluciones = grupos.transform('sum')
+
+    # Las filas con clave nula quedan fuera de los grupos (NaN -> False)
+    eliminar = (tamano >= 2) & (devoluciones >= 1)
+    return set(df.index[eliminar.to_numpy()])
+
+
+def cargar_y_procesar_lonja(path, desde=None, hasta=None):
+    """
+    Carga la lonja: el dataset parquet de 4a si `path` es un directorio (solo
+    las particiones entre `desde` y `hasta`) o el CSV (ARA.csv). Filtra valores
+    de NUMENVAS entre -1 y 1 (excluyendo 0), convierte FECHA a datetime, genera
+    columna Fecha_sin_hora, y elimina duplicados con NUMENVAS = -1.
+    Devuelve el DataFrame filtrado y un CSV intermedio en FILTRADO_LONJA (solo
+    con la lonja completa, para no pisarlo con la de unos pocos días).
     """
-    df = pd.read_csv(path)
-    print(f"[INFO] Lonja: registros originales: {len(df)}")
+    if os.path.isdir(path):
+        df = leer_lonja(path, desde, hasta)
+    else:
+        df = pd.read_csv(path)
+    print(f"[INFO] Lonja: registros originales: {len(df)} ({os.path.basename(path)})")
+    contar("filas_lonja", len(df))
 
     # Filtrar NUMENVAS fuera de {-1, 0, 1} (se quedan los que son -1 o 1)
     df_filtrado = df[(df['NUMENVAS'] != 0) & (df['NUMENVAS'].abs() == 1)].copy()
@@ -47,102 +93,79 @@ def cargar_y_procesar_lonja(path):
     df_filtrado['Fecha_sin_hora'] = df_filtrado['FECHA'].dt.date
 
     # Eliminar pares duplicados con NUMENVAS == -1 (manteniendo sólo las filas “positivas”)
-    indices_a_eliminar = set()
-    for fecha, grupo in df_filtrado.groupby('Fecha_sin_hora'):
-        grupo = grupo.reset_index(drop=False)  # preservar índice original en columna “index”
-        for i, fila in grupo.iterrows():
-            if fila['NUMENVAS'] == -1:
-                for j, otra in grupo.iterrows():
-                    if i != j and (
-                        abs(fila['PESONETO']) == abs(otra['PESONETO']) and
-                        abs(fila['IMPORTE']) == abs(otra['IMPORTE']) and
-                        abs(fila['NUMVENTA']) == abs(otra['NUMVENTA'])
-                    ):
-                        indices_a_eliminar.update([fila['index'], otra['index']])
+    indices_a_eliminar = indices_pares_devolucion(df_filtrado)
     df_final = df_filtrado.drop(index=indices_a_eliminar)
     print(f"[INFO] Lonja: tras eliminar duplicados sospechosos: {len(df_final)}")
+    contar("filas_devolucion_eliminadas", len(indices_a_eliminar))
 
-    df_final.to_csv(FILTRADO_LONJA, index=False)
-    print(f"[INFO] Lonja filtrada guardada en: {FILTRADO_LONJA}")
+    if desde is None and hasta is None:
+        df_final.to_csv(FILTRADO_LONJA, index=False)
+        print(f"[INFO] Lonja filtrada guardada en: {FILTRADO_LONJA}")
     return df_final
 
 
-# ------------------------
-# CARGA Y PREPARACIÓN DE LONJA UNICA
-# ------------------------
-df_lonja_full = cargar_y_procesar_lonja(LONJA_FILE)
+def listar_resultados(results_dir):
+    """Devuelve [(fecha_str, date_obj, fname)] de los resultados_procesados_YYYY-MM-DD.csv."""
+    fechas = []
+    for fname in sorted(os.listdir(results_dir)):
+        if not (fname.startswith("resultados_procesados_") and fname.endswith(".csv")):
+            continue
 
-# ------------------------
-# PROCESAMIENTO POR DÍA
-# ------------------------
-# Buscamos todos los archivos resultados_procesados_YYYY-MM-DD.csv en RESULTS_DIR
-for fname in sorted(os.listdir(RESULTS_DIR)):
-    if not (fname.startswith("resultados_procesados_") and fname.endswith(".csv")):
-        continue
-
-    # Extraer 'YYYY-MM-DD' de 'resultados_procesados_YYYY-MM-DD.csv'
-    fecha_str = fname[len("resultados_procesados_") : -len(".csv")]
-    try:
-        date_obj = datetime.datetime.strptime(fecha_str, "%Y-%m-%d").date()
-    except ValueError:
-        print(f"[WARN] Ignorando '{fname}': '{fecha_str}' no es fecha válida")
-        continue
+        # Extraer 'YYYY-MM-DD' de 'resultados_procesados_YYYY-MM-DD.csv'
+        fecha_str = fname[len("resultados_procesados_") : -len(".csv")]
+        try:
+            date_obj = datetime.datetime.strptime(fecha_str, "%Y-%m-%d").date()
+        except ValueError:
+            print(f"[WARN] Ignorando '{fname}': '{fecha_str}' no es fecha válida")
+            continue
+        fechas.append((fecha_str, date_obj, fname))
+    return fechas
 
-    print(f"\n[INFO] Procesando fecha: {fecha_str}")
 
-    archivo_resultados = os.path.join(RESULTS_DIR, fname)
-    df_resultados = pd.read_csv(archivo_resultados)
-
-    # Extraer fecha de la columna Imagen y filtrar filas válidas
+def filtrar_por_fecha_imagen(df_resultados, date_obj):
+    """Añade la columna Fecha (extraída de Imagen) y deja solo las filas de date_obj."""
     df_resultados['Fecha'] = pd.to_datetime(
         df_resultados['Imagen'].str.extract(r'(\d{4}-\d{2}-\d{2})')[0], errors='coerce'
     ).dt.date
-    df_resultados = df_resultados[df_resultados['Fecha'].notna()]
-    df_resultados = df_resultados[df_resultados['Fecha'] == date_obj]
+    # date_obj puede ser una fecha o una Serie alineada (una fecha por fila)
+    return df_resultados[df_resultados['Fecha'].notna() & (df_resultados['Fecha'] == date_obj)]
 
-    if df_resultados.empty:
-        print(f"[WARN] No hay resultados para {fecha_str} en {fname}")
-        continue
 
-    # Filtrar lonja para esa fecha y sólo NUMENVAS == 1
-    df_lonja = df_lonja_full[df_lonja_full['Fecha_sin_hora'] == date_obj].copy()
-    df_lonja = df_lonja[df_lonja['NUMENVAS'] == 1]
+def depurar_merge(df_merged):
+    df_merged = df_merged.rename(columns={'FECHA': 'FECHA_LONJA'})
+    return df_merged.drop_duplicates()
 
-    if df_lonja.empty:
-        print(f"[WARN] No hay registros de lonja con NUMENVAS=1 para {fecha_str}")
-        continue
-
-    # ------------------------
-    # MERGE RESULTADOS <-> LONJA
-    # ------------------------
-    df_merged = pd.merge(
-        df_resultados,
-        df_lonja,
-        left_on=['Fecha', 'Vta', 'Pes'],
-        right_on=['Fecha_sin_hora', 'NUMVENTA', 'PESONETO'],
-        how='inner'
-    ).drop(columns=['Fecha'])
 
-    if df_merged.empty:
-        print(f"[WARN] Merge vacío para {fecha_str}")
-        continue
+def restaurar_tipos(df, tipos):
+    """Devuelve a cada columna el tipo que tenía en su fichero de origen (concat puede promocionarlo)."""
+    for col, tipo in tipos.items():
+        if col in df.columns and df[col].dtype != tipo:
+            df[col] = df[col].astype(tipo)
+    return df
 
-    df_merged.rename(columns={'FECHA': 'FECHA_LONJA'}, inplace=True)
-    df_merged = df_merged.drop_duplicates()
 
+def escribir_salidas_fecha(fecha_str, df_resultados, df_merged):
+    """
+    Escritor de una partición (fecha): DATOS_GAMBA_<fecha>.csv,
+    duplicados_<fecha>.csv y no_merge_<fecha>.csv.
+    df_merged debe tener el índice del merge de esa fecha (0..n-1 antes de depurar).
+    """
     # Guardar CSV diario
     salida_diaria = os.path.join(SALIDA_DIR, f"DATOS_GAMBA_{fecha_str}.csv")
     df_merged.to_csv(salida_diaria, index=False, quoting=csv.QUOTE_ALL)
     print(f"[OK] Archivo generado: {salida_diaria}")
+    contar("fechas_combinadas")
+    contar("filas_merge", len(df_merged))
 
     # ------------------------
     # DUPLICADOS
     # ------------------------
-    dup = df_merged[df_merged.duplicated(subset=['Imagen'], keep=False)]
+    dup = df_merged[df_merged.duplicated(subset=['Imagen'], keep=False)].copy()
     if not dup.empty:
         dup['Posicion'] = dup.index + 1
         archivo_dup = os.path.join(DUPLICADOS_DIR, f"duplicados_{fecha_str}.csv")
         dup.to_csv(archivo_dup, index=False, quoting=csv.QUOTE_ALL)
+        contar("filas_duplicadas", len(dup))
         print(f"[WARN] Duplicados para {fecha_str} guardados en: {archivo_dup}")
     else:
         print(f"[OK] No se encontraron duplicados en 'Imagen' para {fecha_str}")
@@ -158,6 +181,144 @@ for fname in sorted(os.listdir(RESULTS_DIR)):
         df_no_merge = df_resultados[df_resultados['Imagen'].isin(imgs_sin_merge)]
         archivo_no_merge = os.path.join(NO_MERGE_DIR, f"no_merge_{fecha_str}.csv")
         df_no_merge.to_csv(archivo_no_merge, index=False)
+        contar("imagenes_sin_merge", len(df_no_merge))
         print(f"[INFO] Imágenes no mergeadas para {fecha_str}: {len(df_no_merge)} -> {archivo_no_merge}")
     else:
         print(f"[OK] Todas las imágenes fueron mergeadas correctamente para {fecha_str}")
+
+
+# ------------------------
+# PROCESAMIENTO POR DÍA
+# ------------------------
+def procesar_fecha(df_lonja_full, fecha_str, date_obj, fname):
+    print(f"\n[INFO] Procesando fecha: {fecha_str}")
+
+    archivo_resultados = os.path.join(RESULTS_DIR, fname)
+    df_resultados = filtrar_por_fecha_imagen(pd.read_csv(archivo_resultados), date_obj)
+
+    if df_resultados.empty:
+        print(f"[WARN] No hay resultados para {fecha_str} en {fname}")
+        return
+
+    # Filtrar lonja para esa fecha y sólo NUMENVAS == 1
+    df_lonja = df_lonja_full[df_lonja_full['Fecha_sin_hora'] == date_obj].copy()
+    df_lonja = df_lonja[df_lonja['NUMENVAS'] == 1]
+
+    if df_lonja.empty:
+        print(f"[WARN] No hay registros de lonja con NUMENVAS=1 para {fecha_str}")
+        return
+
+    # ------------------------
+    # MERGE RESULTADOS <-> LONJA
+    # ------------------------
+    df_merged = pd.merge(
+        df_resultados,
+        df_lonja,
+        left_on=['Fecha', 'Vta', 'Pes'],
+        right_on=['Fecha_sin_hora', 'NUMVENTA', 'PESONETO'],
+        how='inner'
+    ).drop(columns=['Fecha'])
+
+    if df_merged.empty:
+        print(f"[WARN] Merge vacío para {fecha_str}")
+        return
+
+    with medir("salidas_fecha"):
+        escribir_salidas_fecha(fecha_str, df_resultados, depurar_merge(df_merged))
+
+
+# ------------------------
+# PROCESAMIENTO GLOBAL (todas las fechas en una pasada)
+# ------------------------
+def procesar_todas(df_lonja_full, fechas):
+    """
+    Concatena todos los resultados_procesados_<fecha>.csv, hace un único merge
+    por (fecha, Vta, Pes) contra la lonja con NUMENVAS == 1 y escribe las
+    salidas de cada fecha con escribir_salidas_fecha. Las salidas son las mismas
+    que procesando día a día.
+    """
+    frames, tipos = [], {}
+    for fecha_str, date_obj, fname in fechas:
+        df = pd.read_csv(os.path.join(RESULTS_DIR, fname))
+        tipos[fecha_str] = df.dtypes.to_dict()
+        df['_fecha_archivo'] = date_obj
+        frames.append(df)
+    if not frames:
+        return
+
+    df_todos = pd.concat(frames, ignore_index=True)
+    df_todos = filtrar_por_fecha_imagen(df_todos, df_todos['_fecha_archivo'])
+    resultados_por_fecha = dict(list(df_todos.groupby('_fecha_archivo', sort=False)))
+
+    df_lonja = df_lonja_full[df_lonja_full['NUMENVAS'] == 1]
+    fechas_lonja = set(df_lonja['Fecha_sin_hora'])
+
+    df_merged_todos = pd.merge(
+        df_todos,
+        df_lonja,
+        left_on=['Fecha', 'Vta', 'Pes'],
+        right_on=['Fecha_sin_hora', 'NUMVENTA', 'PESONETO'],
+        how='inner'
+    )
+    merged_por_fecha = dict(list(df_merged_todos.groupby('_fecha_archivo', sort=False)))
+
+    for fecha_str, date_obj, fname in fechas:
+        print(f"\n[INFO] Procesando fecha: {fecha_str}")
+
+        df_resultados = resultados_por_fecha.get(date_obj)
+        if df_resultados is None:
+            print(f"[WARN] No hay resultados para {fecha_str} en {fname}")
+            continue
+        if date_obj not in fechas_lonja:
+            print(f"[WARN] No hay registros de lonja con NUMENVAS=1 para {fecha_str}")
+            continue
+        df_merged = merged_por_fecha.get(date_obj)
+        if df_merged is None:
+            print(f"[WARN] Merge vacío para {fecha_str}")
+            continue
+
+        df_resultados = restaurar_tipos(df_resultados.drop(columns=['_fecha_archivo']), tipos[fecha_str])
+        df_merged = df_merged.drop(columns=['Fecha', '_fecha_archivo']).reset_index(drop=True)
+        df_merged = restaurar_tipos(df_merged, tipos[fecha_str])
+        with medir("salidas_fecha"):
+            escribir_salidas_fecha(fecha_str, df_resultados, depurar_merge(df_merged))
+
+
+# ------------------------
+# MAIN
+# ------------------------
+def main():
+    args = parser_arguments()
+    with Metricas("4b_combina", modo=args.modo):
+        combinar_lonja(args)
+
+
+def combinar_lonja(args):
+    # Asegurarse de que existan los directorios de salida
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    os.makedirs(DUPLICADOS_DIR, exist_ok=True)
+    os.makedirs(NO_MERGE_DIR, exist_ok=True)
+    os.makedirs(SALIDA_DIR, exist_ok=True)
+
+    # Carga y preparación de la lonja única (parquet particionado si existe y hay pyarrow)
+    lonja = LONJA_PARQUET if os.path.isdir(LONJA_PARQUET) and pq is not None else LONJA_FILE
+
+    # Buscamos todos los archivos resultados_procesados_YYYY-MM-DD.csv en RESULTS_DIR
+    fechas = listar_resultados(RESULTS_DIR)
+    if args.fecha:
+        fechas = [(fecha_str, date_obj, fname) for fecha_str, date_obj, fname in fechas if fecha_str in args.fecha]
+        if not fechas:
+            print(f"[WARN] No hay resultados_procesados de {', '.join(args.fecha)} en {RESULTS_DIR}")
+            return
+        df_lonja_full = cargar_y_procesar_lonja(lonja, fechas[0][0], fechas[-1][0])
+    else:
+        df_lonja_full = cargar_y_procesar_lonja(lonja)
+    if args.modo == "global":
+        procesar_todas(df_lonja_full, fechas)
+    else:
+        for fecha_str, date_obj, fname in fechas:
+            procesar_fecha(df_lonja_full, fecha_str, date_obj, fname)
+
+
+if __name__ == "__main__":
+    main()
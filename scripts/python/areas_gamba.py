@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+Cálculo de áreas de los polígonos de segmentación de gamba y escritura del
+fichero areas_resultados_<fecha>.txt que consume la etapa 3.
+
+Las áreas se expresan por defecto sobre la rejilla de referencia
+IMAGE_WIDTH x IMAGE_HEIGHT (640x640), la misma con la que se ajustó el modelo
+área -> peso. El motor vectorizado admite además el tamaño real de cada imagen.
+
+Además del texto 'Imagen: ... / Identificador: X, Area: Y' se puede guardar una
+tabla columnar (Parquet) particionada por fecha, con columnas image, class_id y
+area (una fila sin class_id/area para las imágenes sin polígonos válidos).
+
+La etapa 1 puede guardar, en lugar de un labels/<imagen>.txt por imagen, un
+almacén binario por fecha (mascaras.bin + índice mascaras.idx) con los
+polígonos en float32; leer_mascaras lo devuelve con los mismos arrays que
+leer_etiquetas. Con labels/ guarda el tamaño original de cada imagen en
+tamanos.tsv para las áreas a escala real.
+"""
+
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo hace falta para el formato parquet
+    pa = pq = None
+
+ESQUEMA_AREAS = pa.schema([
+    ("image", pa.string()),
+    ("class_id", pa.int32()),
+    ("area", pa.float64()),
+]) if pa is not None else None
+
+IMAGE_WIDTH, IMAGE_HEIGHT = 640, 640
+
+# Modelo alométrico área (rejilla de referencia) -> peso (g) de la etapa 3
+SLO_HAT = 1.496995
+INT_HAT = -8.178205
+
+
+# -------------------------
+# AREAS
+# -------------------------
+def area_poligono(xy):
+    """Área (fórmula del lazo) de un polígono dado como array (n, 2) de floats."""
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+
+def peso_desde_area(area):
+    """Modelo alométrico área -> peso (g): exp(log(area) * SLO_HAT + INT_HAT)."""
+    return np.exp(np.log(area) * SLO_HAT + INT_HAT)
+
+
+def areas_desde_resultado(resultado, ancho=IMAGE_WIDTH, alto=IMAGE_HEIGHT):
+    """
+    Áreas de las máscaras de un `Results` de ultralytics, directamente desde los
+    polígonos normalizados (masks.xyn) y sin redondear a píxeles enteros.
+    Devuelve (identificadores, areas) con el mismo criterio que la etapa 2:
+    se descartan polígonos con menos de 2 puntos.
+    """
+    if resultado.masks is None or resultado.boxes is None:
+        return [], []
+
+    clases = resultado.boxes.cls.tolist()
+    identificadores, areas = [], []
+    for clase_objeto, xyn in zip(clases, resultado.masks.xyn):
+        if len(xyn) < 2:
+            continue
+        puntos = np.asarray(xyn, dtype=np.float64) * (ancho, alto)
+        identificadores.append(int(clase_objeto))
+        areas.append(area_poligono(puntos))
+    return identificadores, areas
+
+
+# -------------------------
+# MOTOR VECTORIZADO
+# -------------------------
+def leer_etiquetas(rutas):
+    """
+    Parsea de una vez una lista de ficheros de etiquetas YOLO-seg
+    ('clase x1 y1 x2 y2 ... [conf]') a arrays planos:
+      - coords: (N, 2) coordenadas normalizadas de todos los polígonos seguidos
+      - offsets: (P + 1,) inicio de cada polígono en coords
+      - clases: (P,) clase de cada polígono
+      - fichero: (P,) índice en `rutas` del fichero de cada polígono
+    Igual que convertir_txt_a_pixel, las líneas con menos de 6 valores se
+    descartan y, si el número de valores es par (hay confianza), se ignora el último.
+    """
+    valores, longitudes, clases, fichero = [], [], [], []
+    for i, ruta in enumerate(rutas):
+        with open(ruta, 'r') as file:
+            lineas = file.read().splitlines()
+        for linea in lineas:
+            partes = linea.strip().split(' ')
+            if len(partes) < 6:
+                print(f"Error: coordenadas insuficientes: {linea}")
+                continue
+            n_puntos = (len(partes) - 1) // 2
+            clases.append(partes[0])
+            valores.extend(partes[1:1 + 2 * n_puntos])
+            longitudes.append(n_puntos)
+            fichero.append(i)
+
+    coords = np.array(valores, dtype=np.float64).reshape(-1, 2)
+    offsets = np.zeros(len(longitudes) + 1, dtype=np.int64)
+    np.cumsum(longitudes, out=offsets[1:])
+    return coords, offsets, np.array(clases, dtype=np.int64), np.array(fichero, dtype=np.int64)
+
+
+def areas_poligonos(coords, offsets, anchos, altos, truncar=False):
+    """
+    Áreas de todos los polígonos en una sola pasada vectorizada (fórmula del lazo).
+    anchos/altos: escalares o arrays (P,) con el tamaño de la imagen de cada polígono.
+    Con truncar=True los vértices se pasan a píxeles enteros como en
+    convertir_txt_a_pixel (resultado idéntico a cv2.contourArea).
+    """
+    n_poligonos = len(offsets) - 1
+    areas = np.zeros(n_poligonos, dtype=np.float64)
+    longitudes = np.diff(offsets)
+    # Los polígonos sin vértices tienen área 0 y no entran en reduceat (con inicios
+    # repetidos devolvería el vértice siguiente y con un inicio final se saldría del array)
+    validos = longitudes > 0
+    if not validos.any():
+        return areas
+
+    escala_x = np.repeat(np.broadcast_to(np.asarray(anchos, dtype=np.float64), (n_poligonos,)), longitudes)
+    escala_y = np.repeat(np.broadcast_to(np.asarray(altos, dtype=np.float64), (n_poligonos,)), longitudes)
+    x = coords[:, 0] * escala_x
+    y = coords[:, 1] * escala_y
+    if truncar:
+        x, y = np.trunc(x), np.trunc(y)
+
+    # Vértice siguiente dentro de cada polígono (el último enlaza con el primero)
+    inicios, finales = offsets[:-1][validos], offsets[1:][validos]
+    siguiente = np.arange(1, len(x) + 1)
+    siguiente[finales - 1] = inicios
+    cruz = x * y[siguiente] - x[siguiente] * y
+    areas[validos] = 0.5 * np.abs(np.add.reduceat(cruz, inicios))
+    return areas
+
+
+def tamano_imagen(ruta_imagen, por_defecto=(IMAGE_WIDTH, IMAGE_HEIGHT)):
+    """Ancho y alto leyendo solo la cabecera de la imagen; por_defecto si no existe."""
+    if not os.path.isfile(ruta_imagen):
+        return por_defecto
+    from PIL import Image
+
+    with Image.open(ruta_imagen) as img:
+        return img.size
+
+
+# -------------------------
+# ALMACÉN DE MÁSCARAS
+# -------------------------
+ALMACEN_MASCARAS = "mascaras.bin"   # polígonos empaquetados de todas las imágenes del directorio
+INDICE_MASCARAS = "mascaras.idx"    # imagen, offset, bytes, polígonos, ancho, alto (TSV)
+TAMANOS_IMAGENES = "tamanos.tsv"    # imagen, ancho, alto de cada imagen inferida (salidas con labels/)
+CABECERA_POLIGONO = struct.Struct("<BfI")  # clase, confianza, número de vértices
+
+
+def empaquetar_poligonos(clases, confianzas, poligonos):
+    """
+    Bytes de los polígonos de una imagen: cabecera + vértices normalizados
+    (float32 x, y) por polígono. Como en labels/ (leer_etiquetas) y en
+    areas_desde_resultado, se descartan los polígonos con menos de 2 puntos.
+    Devuelve (bytes, polígonos guardados).
+    """
+    partes, n_poligonos = [], 0
+    for clase, confianza, xyn in zip(clases, confianzas, poligonos):
+        xy = np.ascontiguousarray(xyn, dtype="<f4").reshape(-1, 2)
+        if len(xy) < 2:
+            continue
+        partes.append(CABECERA_POLIGONO.pack(int(clase), float(confianza), len(xy)))
+        partes.append(xy.tobytes())
+        n_poligonos += 1
+    return b"".join(partes), n_poligonos
+
+
+def escribir_mascaras(directorio, bloques):
+    """
+    Añade al almacén del directorio los polígonos de varias imágenes.
+    bloques: [(imagen, clases, confianzas, poligonos, (ancho, alto) o None)].
+    """
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, ALMACEN_MASCARAS), "ab") as almacen, \
+            open(os.path.join(directorio, INDICE_MASCARAS), "a", encoding="utf-8") as indice:
+        for imagen, clases, confianzas, poligonos, tamano in bloques:
+            datos, n_poligonos = empaquetar_poligonos(clases, confianzas, poligonos)
+            ancho, alto = tamano or (IMAGE_WIDTH, IMAGE_HEIGHT)
+            indice.write(f"{imagen}\t{almacen.tell()}\t{len(datos)}\t{n_poligonos}\t{ancho}\t{alto}\n")
+            almacen.write(datos)
+
+
+def leer_indice_mascaras(directorio):
+    """{imagen: (offset, bytes, poligonos, ancho, alto)}; si una imagen se repite vale la última entrada."""
+    indice = {}
+    ruta = os.path.join(directorio, INDICE_MASCARAS)
+    if not os.path.isfile(ruta):
+        return indice
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            partes = linea.rstrip("\n").split("\t")
+            if len(partes) != 6:
+                continue
+            indice[partes[0]] = tuple(int(v) for v in partes[1:])
+    return indice
+
+
+def leer_mascaras(directorio, imagenes=None):
+    """
+    Lee del almacén los polígonos de `imagenes` (por defecto todas, en el orden
+    del índice) con los mismos arrays que leer_etiquetas, más el tamaño de cada
+    imagen: coords, offsets, clases, fichero, tamanos (I, 2).
+    """
+    indice = leer_indice_mascaras(directorio)
+    imagenes = list(indice) if imagenes is None else imagenes
+    coords, longitudes, clases, fichero = [], [], [], []
+    with open(os.path.join(directorio, ALMACEN_MASCARAS), "rb") as almacen:
+        for i, imagen in enumerate(imagenes):
+            offset, n_bytes, n_poligonos = indice[imagen][:3]
+            almacen.seek(offset)
+            datos = almacen.read(n_bytes)
+            posicion = 0
+            for _ in range(n_poligonos):
+                clase, _, n_puntos = CABECERA_POLIGONO.unpack_from(datos, posicion)
+                posicion += CABECERA_POLIGONO.size
+                poligono = np.frombuffer(datos, dtype="<f4", count=2 * n_puntos, offset=posicion)
+                posicion += 8 * n_puntos
+                if n_puntos < 2:
+                    continue  # almacenes escritos antes de descartarlos en empaquetar_poligonos
+                coords.append(poligono)
+                clases.append(clase)
+                longitudes.append(n_puntos)
+                fichero.append(i)
+
+    coords = (np.concatenate(coords) if coords else np.zeros(0)).astype(np.float64).reshape(-1, 2)
+    offsets = np.zeros(len(longitudes) + 1, dtype=np.int64)
+    np.cumsum(longitudes, out=offsets[1:])
+    tamanos = np.array([indice[imagen][3:] for imagen in imagenes], dtype=np.float64).reshape(-1, 2)
+    return coords, offsets, np.array(clases, dtype=np.int64), np.array(fichero, dtype=np.int64), tamanos
+
+
+def escribir_tamanos(directorio, tamanos):
+    """Añade a tamanos.tsv el tamaño original de varias imágenes: [(imagen, (ancho, alto))]."""
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, TAMANOS_IMAGENES), "a", encoding="utf-8") as f:
+        f.write("".join(f"{imagen}\t{ancho}\t{alto}\n" for imagen, (ancho, alto) in tamanos))
+
+
+def leer_tamanos(directorio):
+    """{imagen: (ancho, alto)} de tamanos.tsv; si una imagen se repite vale la última entrada."""
+    tamanos = {}
+    ruta = os.path.join(directorio, TAMANOS_IMAGENES)
+    if not os.path.isfile(ruta):
+        return tamanos
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            partes = linea.rstrip("\n").split("\t")
+            if len(partes) == 3:
+                tamanos[partes[0]] = (int(partes[1]), int(partes[2]))
+    return tamanos
+
+
+def borrar_mascaras(directorio):
+    """Borra el almacén de máscaras y el registro de tamaños de un directorio de resultados."""
+    for nombre in (ALMACEN_MASCARAS, INDICE_MASCARAS, TAMANOS_IMAGENES):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+# -------------------------
+# SALIDA
+# -------------------------
+def save_areas_to_file_txt(image_name, identifiers, areas, output_path):
+    with open(output_path, 'a') as file:
+        file.write(f"Imagen: {image_name}\n")
+        for identifier, area in zip(identifiers, areas):
+            file.write(f"Identificador: {identifier}, Area: {area}\n")
+        file.write("\n")
+
+
+def escribir_areas_txt(bloques, output_path):
+    """Como save_areas_to_file_txt para muchas imágenes abriendo el fichero una sola vez.
+    bloques: iterable de (image_name, identifiers, areas)."""
+    partes = []
+    for image_name, identifiers, areas in bloques:
+        partes.append(f"Imagen: {image_name}\n")
+        partes.extend(f"Identificador: {identifier}, Area: {area}\n" for identifier, area in zip(identifiers, areas))
+        partes.append("\n")
+    with open(output_path, 'a') as file:
+        file.write("".join(partes))
+
+
+def leer_areas_txt(ruta, etiqueta=""):
+    """
+    Lee un areas_resultados_<fecha>.txt como tabla larga con columnas
+    Bloque (orden del bloque 'Imagen:'), Imagen (sin '.txt'), Identificador y
+    Area. Las imágenes sin detecciones quedan como una fila con Identificador nulo.
+    """
+    bloques, imagenes, identificadores, areas = [], [], [], []
+    bloque, imagen_actual, filas_bloque = -1, None, 0
+
+    def cerrar_bloque():
+        if imagen_actual is not None and filas_bloque == 0:
+            bloques.append(bloque)
+            imagenes.append(imagen_actual)
+            identificadores.append(None)
+            areas.append(np.nan)
+
+    with open(ruta, 'r', encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            if line.startswith("Imagen:"):
+                cerrar_bloque()
+                bloque += 1
+                imagen_actual = os.path.splitext(line.split(":", 1)[1].strip())[0]
+                filas_bloque = 0
+
+            elif line.startswith("Identificador:") and imagen_actual is not None:
+                parts = line.split(",")
+                try:
+                    identificador = int(parts[0].split(":", 1)[1].strip())
+                    area = float(parts[1].split(":", 1)[1].strip())
+                except Exception as e:
+                    print(f"[{etiqueta}] WARNING: no pude parsear línea '{line}' → {e}")
+                    continue
+                bloques.append(bloque)
+                imagenes.append(imagen_actual)
+                identificadores.append(identificador)
+                areas.append(area)
+                filas_bloque += 1
+    cerrar_bloque()
+
+    return pd.DataFrame({
+        'Bloque': bloques,
+        'Imagen': imagenes,
+        'Identificador': pd.array(identificadores, dtype="Int64"),
+        'Area': np.array(areas, dtype=np.float64),
+    })
+
+
+# -------------------------
+# PARQUET (particionado por fecha)
+# -------------------------
+def ruta_particion(directorio, fecha):
+    return os.path.join(directorio, f"fecha={fecha}", "areas.parquet")
+
+
+def escribir_areas_parquet(bloques, directorio, fecha):
+    """
+    Escribe (sobrescribe) la partición de `fecha` con todas sus filas.
+    bloques: iterable de (image_name, identifiers, areas), como escribir_areas_txt.
+    """
+    if pq is None:
+        raise ImportError("El formato parquet necesita pyarrow (pip install pyarrow)")
+
+    imagenes, clases, areas = [], [], []
+    for image_name, identifiers, areas_img in bloques:
+        nombre = os.path.splitext(image_name)[0]
+        if len(identifiers) == 0:
+            imagenes.append(nombre)
+            clases.append(None)
+            areas.append(None)
+            continue
+        imagenes.extend([nombre] * len(identifiers))
+        clases.extend(int(c) for c in identifiers)
+        areas.extend(float(a) for a in areas_img)
+
+    tabla = pa.table({"image": imagenes, "class_id": clases, "area": areas}, schema=ESQUEMA_AREAS)
+    ruta = ruta_particion(directorio, fecha)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    pq.write_table(tabla, ruta)
+    return ruta
+
+
+def leer_areas_parquet(directorio, fecha):
+    """Lee la partición de `fecha` con las mismas columnas que leer_areas_txt."""
+    if pq is None:
+        raise ImportError("El formato parquet necesita pyarrow (pip install pyarrow)")
+
+    df = pq.read_table(ruta_particion(directorio, fecha)).to_pandas()
+    return pd.DataFrame({
+        'Bloque': pd.factorize(df['image'])[0],
+        'Imagen': df['image'],
+        'Identificador': df['class_id'].astype("Int64"),
+        'Area': df['area'].astype(np.float64),
+    })
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+Backends de inferencia de la etapa 1 y verificación de precisión.
+
+El modelo de segmentación se entrena y guarda como best.pt (PyTorch). Para la
+CPU de la lonja se puede exportar una vez a ONNX u OpenVINO IR, opcionalmente
+cuantizado a INT8, y ultralytics carga el artefacto con la misma interfaz
+(predict -> Results con masks.xyn y boxes.cls). Los artefactos se guardan junto
+a los pesos y se reutilizan mientras sean más recientes que best.pt:
+
+    pytorch           best.pt
+    onnx              best.onnx
+    onnx + int8       best_int8.onnx            (cuantización dinámica de onnxruntime)
+    openvino          best_openvino_model/
+    openvino + int8   best_int8_openvino_model/ (cuantización NNCF de ultralytics)
+
+comparar_modelos() pasa la misma muestra de imágenes por best.pt y por el
+backend y compara número de detecciones por clase, máscaras (IoU), áreas de la
+clase 2 y la estimación de num_gambas de la etapa 3.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from areas_gamba import IMAGE_WIDTH, IMAGE_HEIGHT, areas_desde_resultado, peso_desde_area
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+TOLERANCIA_NUM_GAMBAS = 0.02  # diferencia relativa media admitida en num_gambas por imagen
+
+
+# ------------------------
+# EXPORTACIÓN Y CACHÉ
+# ------------------------
+def ruta_artefacto(pesos, backend, int8=False):
+    """Ruta del modelo exportado para `backend` junto a los pesos .pt."""
+    base = os.path.splitext(pesos)[0] + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return f"{base}.onnx"
+    if backend == "openvino":
+        return f"{base}_openvino_model"
+    return pesos
+
+
+def artefacto_vigente(ruta, pesos):
+    """El artefacto existe y es posterior a los pesos (si best.pt cambia hay que exportar de nuevo)."""
+    return os.path.exists(ruta) and (not os.path.exists(pesos) or os.path.getmtime(ruta) >= os.path.getmtime(pesos))
+
+
+def mover(origen, destino):
+    if os.path.abspath(str(origen)) == os.path.abspath(destino):
+        return
+    if os.path.isdir(destino):
+        shutil.rmtree(destino)
+    elif os.path.exists(destino):
+        os.remove(destino)
+    shutil.move(str(origen), destino)
+
+
+def exportar(pesos, backend, int8=False, imgsz=IMAGE_WIDTH, datos_calibracion=None):
+    """
+    Devuelve la ruta del modelo exportado, exportándolo solo si no existe o
+    está desfasado respecto a `pesos`. `datos_calibracion` es el .yaml del
+    dataset para calibrar la cuantización INT8 de OpenVINO (si no se da,
+    ultralytics usa su dataset por defecto).
+    """
+    if backend == "pytorch":
+        return pesos
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+
+    destino = ruta_artefacto(pesos, backend, int8)
+    if artefacto_vigente(destino, pesos):
+        return destino
+
+    from ultralytics import YOLO
+
+    print(f"[INFO] Exportando {pesos} a {backend}{' INT8' if int8 else ''} -> {destino}", flush=True)
+    if backend == "onnx":
+        # ONNX FP32 con lote dinámico; la variante INT8 se cuantiza a partir de ella
+        fp32 = ruta_artefacto(pesos, "onnx")
+        if not artefacto_vigente(fp32, pesos):
+            mover(YOLO(pesos).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True), fp32)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32, destino, weight_type=QuantType.QUInt8)
+    else:
+        opciones = {"format": "openvino", "imgsz": imgsz, "dynamic": True, "int8": int8}
+        if int8 and datos_calibracion:
+            opciones["data"] = datos_calibracion
+        mover(YOLO(pesos).export(**opciones), destino)
+    return destino
+
+
+def cargar(pesos, backend="pytorch", int8=False, datos_calibracion=None):
+    """Modelo listo para predict(): exporta (o reutiliza) el artefacto del backend y lo carga."""
+    from ultralytics import YOLO
+
+    if backend == "pytorch":
+        if int8:
+            print("[WARN] --int8 solo se aplica a los backends onnx y openvino; se usa best.pt", flush=True)
+        return YOLO(pesos)
+    return YOLO(exportar(pesos, backend, int8, datos_calibracion=datos_calibracion), task="segment")
+
+
+# ------------------------
+# VERIFICACIÓN DE PRECISIÓN
+# ------------------------
+def mascara(resultado, ancho=IMAGE_WIDTH, alto=IMAGE_HEIGHT):
+    """Unión de las máscaras de un resultado rasterizada en la rejilla de referencia (bool alto x ancho)."""
+    from PIL import Image, ImageDraw
+
+    imagen = Image.new("1", (ancho, alto), 0)
+    if resultado.masks is not None:
+        dibujo = ImageDraw.Draw(imagen)
+        for xyn in resultado.masks.xyn:
+            if len(xyn) >= 2:
+                dibujo.polygon([(float(x) * ancho, float(y) * alto) for x, y in xyn], fill=1)
+    return np.array(imagen, dtype=bool)
+
+
+def iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def num_gambas(areas_2, pes):
+    """Estimación de la etapa 3: Pes / peso medio (kg) de las detecciones de clase 2; None sin clase 2."""
+    if not areas_2:
+        return None
+    return pes / (float(np.mean(peso_desde_area(np.asarray(areas_2)))) / 1000)
+
+
+def diferencia_relativa(a, b):
+    return abs(a - b) / abs(a) if a else (0.0 if not b else float("inf"))
+
+
+def comparar_imagen(ref, candidato, pes):
+    """Métricas de una imagen entre el resultado de referencia (.pt) y el del backend."""
+    ids_ref, areas_ref = areas_desde_resultado(ref)
+    ids_can, areas_can = areas_desde_resultado(candidato)
+    areas_2_ref = [a for i, a in zip(ids_ref, areas_ref) if i == 2]
+    areas_2_can = [a for i, a in zip(ids_can, areas_can) if i == 2]
+    conteo_ref = np.bincount(ids_ref, minlength=3)[:3] if ids_ref else np.zeros(3, dtype=int)
+    conteo_can = np.bincount(ids_can, minlength=3)[:3] if ids_can else np.zeros(3, dtype=int)
+
+    gambas_ref, gambas_can = num_gambas(areas_2_ref, pes), num_gambas(areas_2_can, pes)
+    if gambas_ref is None or gambas_can is None:
+        # Que un modelo vea clase 2 y el otro no cambia la estimación por completo
+        dif_gambas = 0.0 if gambas_ref is None and gambas_can is None else float("inf")
+    else:
+        dif_gambas = diferencia_relativa(gambas_ref, gambas_can)
+
+    return {
+        "conteos_iguales": bool((conteo_ref == conteo_can).all()),
+        "dif_conteo": int(np.abs(conteo_ref - conteo_can).sum()),
+        "iou": iou(mascara(ref), mascara(candidato)),
+        "dif_area_2": diferencia_relativa(sum(areas_2_ref), sum(areas_2_can)),
+        "dif_num_gambas": dif_gambas,
+    }
+
+
+def comparar_modelos(referencia, candidato, lote, tolerancia=TOLERANCIA_NUM_GAMBAS, batch_size=8):
+    """
+    Pasa `lote` [(imagen, filename, pes)] por los dos modelos y resume las
+    diferencias. La verificación se da por buena si la diferencia relativa
+    media de num_gambas por imagen no supera `tolerancia`.
+    """
+    por_imagen = []
+    for i in range(0, len(lote), batch_size):
+        trozo = lote[i:i + batch_size]
+        imagenes = [imagen for imagen, _, _ in trozo]
+        res_ref = referencia.predict(imagenes, batch=len(imagenes), save=False, verbose=False)
+        res_can = candidato.predict(imagenes, batch=len(imagenes), save=False, verbose=False)
+        for (_, filename, pes), ref, can in zip(trozo, res_ref, res_can):
+            por_imagen.append({"imagen": filename, **comparar_imagen(ref, can, float(pes))})
+
+    if not por_imagen:
+        return {"imagenes": 0, "ok": False, "motivo": "muestra vacía"}
+
+    dif_gambas = np.array([m["dif_num_gambas"] for m in por_imagen])
+    ious = np.array([m["iou"] for m in por_imagen])
+    dif_area = np.array([m["dif_area_2"] for m in por_imagen])
+    media_gambas = float(np.mean(dif_gambas))
+    return {
+        "imagenes": len(por_imagen),
+        "tolerancia_num_gambas": tolerancia,
+        "ok": media_gambas <= tolerancia,
+        "num_gambas_dif_media": media_gambas,
+        "num_gambas_dif_p95": float(np.percentile(dif_gambas, 95)),
+        "num_gambas_dif_max": float(np.max(dif_gambas)),
+        "imagenes_fuera_tolerancia": int((dif_gambas > tolerancia).sum()),
+        "conteos_iguales": float(np.mean([m["conteos_iguales"] for m in por_imagen])),
+        "detecciones_distintas": int(sum(m["dif_conteo"] for m in por_imagen)),
+        "iou_medio": float(np.mean(ious)),
+        "iou_min": float(np.min(ious)),
+        "area_2_dif_media": float(np.mean(dif_area[np.isfinite(dif_area)])) if np.isfinite(dif_area).any() else None,
+        "por_imagen": por_imagen,
+    }
@@ -0,0 +1 @@
+"""Benchmarks y generadores de datos sintéticos de las etapas Python (ver bench_pipeline.py)."""
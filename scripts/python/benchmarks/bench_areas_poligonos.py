@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark del cálculo de áreas de la etapa 2: implementación polígono a polígono
+(convertir_txt_a_pixel + calculate_areas) frente al motor vectorizado de
+areas_gamba (leer_etiquetas + areas_poligonos), sobre etiquetas sintéticas.
+
+Uso (desde scripts/python):
+    python benchmarks/bench_areas_poligonos.py --poligonos 100000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+
+import numpy as np
+
+DIR_SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_SCRIPTS)
+
+from areas_gamba import IMAGE_WIDTH, IMAGE_HEIGHT, leer_etiquetas, areas_poligonos  # noqa: E402
+from benchmarks.generadores import generar_etiquetas  # noqa: E402
+
+
+def cargar_etapa2():
+    ruta = os.path.join(DIR_SCRIPTS, "2_calcular_areas_segmentos_gamba.py")
+    spec = importlib.util.spec_from_file_location("etapa2", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark áreas de polígonos")
+    parser.add_argument("--poligonos", type=int, default=100_000)
+    parser.add_argument("--por-fichero", type=int, default=50)
+    args = parser.parse_args()
+
+    etapa2 = cargar_etapa2()
+    directorio = tempfile.mkdtemp(prefix="bench_areas_")
+    try:
+        rutas = generar_etiquetas(directorio, args.poligonos, args.por_fichero)
+
+        t0 = time.perf_counter()
+        areas_antes = []
+        for ruta in rutas:
+            poligonos = etapa2.convertir_txt_a_pixel(ruta, IMAGE_WIDTH, IMAGE_HEIGHT)
+            areas_antes.extend(etapa2.calculate_areas(poligonos)[1])
+        t_antes = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        coords, offsets, _, _ = leer_etiquetas(rutas)
+        t_parseo = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        areas_ahora = areas_poligonos(coords, offsets, IMAGE_WIDTH, IMAGE_HEIGHT, truncar=True)
+        t_areas = time.perf_counter() - t0
+
+        iguales = np.array_equal(np.array(areas_antes), areas_ahora)
+        print(f"Polígonos: {len(areas_ahora)} en {len(rutas)} ficheros")
+        print(f"convertir_txt_a_pixel + calculate_areas: {t_antes:.3f} s")
+        print(f"leer_etiquetas + areas_poligonos:        {t_parseo + t_areas:.3f} s "
+              f"(parseo {t_parseo:.3f} s, áreas {t_areas:.3f} s)")
+        print(f"Aceleración: x{t_antes / (t_parseo + t_areas):.1f}; resultados idénticos: {iguales}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks de las cadenas de gamba y lonja sobre datos sintéticos (ver
+generadores.py), sin datos reales de subasta ni pesos de YOLO: la red se
+sustituye por yolo_simulado.
+
+Mide:
+  - get_metadatos:              parseo del payload OPMM
+  - etapa1_seleccion_memoria:   lectura del .7z y filtro EXIF en memoria
+  - etapa1_procesar_archivo:    extracción, filtro EXIF, inferencia (simulada) y fragmento
+  - etapa2_poligono_a_poligono: convertir_txt_a_pixel + calculate_areas
+  - etapa2_vectorizado:         areas_por_etiqueta (motor de areas_gamba)
+  - etapa3_procesar_fecha:      cargar_metadatos + procesar_fecha de todas las fechas
+  - lonja_carga:                cargar_y_procesar_lonja (ARA.csv de un año)
+  - etapa4b_merge:              procesar_todas (merge de todas las fechas y salidas)
+
+Cada benchmark se repite --repeticiones veces y se guarda el mejor tiempo y la
+mediana en un JSON con el commit, para comparar entre commits. Al terminar se
+compara con el resultado anterior de la misma carpeta.
+
+Uso (desde scripts/python):
+    python benchmarks/bench_pipeline.py --dias 20 --imagenes 300
+    python benchmarks/bench_pipeline.py --solo lonja_carga etapa4b_merge
+"""
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tempfile
+import importlib.util
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+DIR_SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if DIR_SCRIPTS not in sys.path:
+    sys.path.insert(0, DIR_SCRIPTS)
+
+from benchmarks import generadores as gen  # noqa: E402
+from benchmarks import yolo_simulado  # noqa: E402
+
+SALIDA_DEFECTO = os.path.join(DIR_SCRIPTS, "..", "..", "logs", "benchmarks")
+
+
+def cargar_etapa(fichero, nombre):
+    ruta = os.path.join(DIR_SCRIPTS, fichero)
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def version_codigo():
+    """Commit corto de HEAD (con '+' si hay cambios sin commitear) o 'desconocido'."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIR_SCRIPTS,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        sucio = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "."], cwd=DIR_SCRIPTS).returncode != 0
+        return commit + ("+" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+# ------------------------
+# DATOS
+# ------------------------
+def preparar_datos(directorio, args):
+    """Genera un escenario coherente de --dias días en `directorio` y devuelve sus rutas."""
+    fechas = gen.fechas_consecutivas(f"{args.anio}-03-01", args.dias)
+    registros = {f: gen.imagenes_dia(f, args.imagenes, args.tasa_ara, args.semilla) for f in fechas}
+    datos = SimpleNamespace(fechas=fechas, registros=registros, dir=directorio)
+
+    datos.areas = os.path.join(directorio, "AREAS")
+    datos.results = os.path.join(directorio, "RESULTS")
+    datos.metadatos = gen.generar_metadatos(os.path.join(directorio, "INFERENCE", "resultados_metadatos.txt"),
+                                            registros)
+    for fecha in fechas:
+        gen.generar_areas_resultados(datos.areas, fecha, registros[fecha], semilla=args.semilla)
+        gen.generar_resultados_procesados(datos.results, fecha, registros[fecha], semilla=args.semilla)
+    datos.lonja = os.path.join(datos.results, "ARA.csv")
+    datos.filas_lonja = gen.generar_lonja_csv(datos.lonja, args.anio, args.ventas_dia, args.tasa_devolucion,
+                                              registros, semilla=args.semilla)
+
+    datos.dir_7z = os.path.join(directorio, "img_lonja")
+    datos.archivo_7z = os.path.basename(gen.generar_7z(datos.dir_7z, fechas[0], registros[fechas[0]]))
+
+    datos.labels = os.path.join(directorio, "labels")
+    datos.etiquetas = gen.generar_etiquetas(datos.labels, args.poligonos, 12, args.semilla)
+    return datos
+
+
+# ------------------------
+# BENCHMARKS
+# Cada uno prepara lo que necesita (fuera del tiempo medido) y devuelve
+# (elementos, unidad, función a medir).
+# ------------------------
+def bench_get_metadatos(datos, args):
+    from metadatos_opmm import get_metadatos, cumple_criterios
+
+    payloads = [gen.payload_opmm(r) for f in datos.fechas for r in datos.registros[f]] * 20
+
+    def ejecutar():
+        for payload in payloads:
+            cumple_criterios(get_metadatos(payload))
+    return len(payloads), "payloads", ejecutar
+
+
+def bench_etapa1_seleccion_memoria(datos, args):
+    etapa1 = cargar_etapa("1_inference_gamba_args.py", "bench_etapa1")
+    ruta = os.path.join(datos.dir_7z, datos.archivo_7z)
+    return args.imagenes, "imágenes", lambda: etapa1.seleccionar_en_memoria(ruta, None, args.hilos_exif)
+
+
+def bench_etapa1_procesar_archivo(datos, args):
+    etapa1 = cargar_etapa("1_inference_gamba_args.py", "bench_etapa1")
+    base = os.path.join(datos.dir, "INFERENCE_etapa1")
+    etapa1.BASE_INPUT = datos.dir_7z
+    etapa1.BASE_RESULTS = base
+    etapa1.BASE_TEMPORAL = os.path.join(base, "temporal")
+    etapa1.DIR_FRAGMENTOS = os.path.join(base, "fragmentos_metadatos")
+    etapa1.BASE_AREAS = os.path.join(datos.dir, "AREAS_etapa1")
+    opciones = argparse.Namespace(workers=1, extraccion=args.extraccion, hilos_exif=args.hilos_exif,
+                                  batch_size=8, areas_directas=False, sin_indice=True, salidas=args.salidas,
+                                  cada_anotada=etapa1.CADA_ANOTADA, dedup=False,
+                                  distancia_dedup=etapa1.DISTANCIA_DUPLICADO)
+    yolo = etapa1.cargar_modelo("simulado.pt")
+    fecha = datetime.date.fromisoformat(datos.fechas[0])
+
+    def ejecutar():
+        shutil.rmtree(base, ignore_errors=True)
+        etapa1.procesar_archivo(yolo, datos.archivo_7z, fecha, opciones)
+    return args.imagenes, "imágenes", ejecutar
+
+
+def bench_etapa2_poligono_a_poligono(datos, args):
+    from areas_gamba import IMAGE_WIDTH, IMAGE_HEIGHT
+    etapa2 = cargar_etapa("2_calcular_areas_segmentos_gamba.py", "bench_etapa2")
+
+    def ejecutar():
+        for ruta in datos.etiquetas:
+            etapa2.calculate_areas(etapa2.convertir_txt_a_pixel(ruta, IMAGE_WIDTH, IMAGE_HEIGHT))
+    return args.poligonos, "polígonos", ejecutar
+
+
+def bench_etapa2_vectorizado(datos, args):
+    etapa2 = cargar_etapa("2_calcular_areas_segmentos_gamba.py", "bench_etapa2")
+    ficheros = [os.path.basename(r) for r in datos.etiquetas]
+    return args.poligonos, "polígonos", lambda: etapa2.areas_por_etiqueta(datos.labels, datos.labels, ficheros)
+
+
+def bench_etapa3_procesar_fecha(datos, args):
+    etapa3 = cargar_etapa("3_calculo_peso_medio_num_gamba.py", "bench_etapa3")
+    etapa3.AREAS_DIR = datos.areas
+    etapa3.PARQUET_DIR = os.path.join(datos.areas, "areas_parquet")
+    etapa3.TEMP_DIR = os.path.join(datos.areas, "TEMP")
+    etapa3.RESULTS_DIR = os.path.join(datos.dir, "RESULTS_etapa3")
+    etapa3.ARCHIVO_METADATOS = datos.metadatos
+    os.makedirs(etapa3.TEMP_DIR, exist_ok=True)
+    os.makedirs(etapa3.RESULTS_DIR, exist_ok=True)
+    imagenes = sum(len(gen.seleccionables(datos.registros[f])) for f in datos.fechas)
+
+    def ejecutar():
+        metadatos = etapa3.cargar_metadatos(datos.metadatos)
+        for fecha in datos.fechas:
+            etapa3.procesar_fecha(fecha, metadatos.get(fecha))
+    return imagenes, "imágenes", ejecutar
+
+
+def cargar_etapa4b(datos):
+    etapa4b = cargar_etapa("4b_combina_lonja_imagen.py", "bench_etapa4b")
+    salida = os.path.join(datos.dir, "RESULTS_4b")
+    etapa4b.RESULTS_DIR = datos.results
+    etapa4b.FILTRADO_LONJA = os.path.join(salida, "archivo_lonja_filtrado.csv")
+    etapa4b.DUPLICADOS_DIR = os.path.join(salida, "duplicados")
+    etapa4b.NO_MERGE_DIR = os.path.join(salida, "no_merge")
+    etapa4b.SALIDA_DIR = os.path.join(salida, "DATOS_GAMBA")
+    for carpeta in (etapa4b.DUPLICADOS_DIR, etapa4b.NO_MERGE_DIR, etapa4b.SALIDA_DIR):
+        os.makedirs(carpeta, exist_ok=True)
+    return etapa4b
+
+
+def bench_lonja_carga(datos, args):
+    etapa4b = cargar_etapa4b(datos)
+    return datos.filas_lonja, "filas", lambda: etapa4b.cargar_y_procesar_lonja(datos.lonja)
+
+
+def bench_etapa4b_merge(datos, args):
+    etapa4b = cargar_etapa4b(datos)
+    with redirect_stdout(io.StringIO()):
+        df_lonja = etapa4b.cargar_y_procesar_lonja(datos.lonja)
+    fechas = etapa4b.listar_resultados(datos.results)
+    imagenes = sum(len(gen.seleccionables(datos.registros[f])) for f in datos.fechas)
+    return imagenes, "imágenes", lambda: etapa4b.procesar_todas(df_lonja, fechas)
+
+
+BENCHMARKS = {
+    "get_metadatos": bench_get_metadatos,
+    "etapa1_seleccion_memoria": bench_etapa1_seleccion_memoria,
+    "etapa1_procesar_archivo": bench_etapa1_procesar_archivo,
+    "etapa2_poligono_a_poligono": bench_etapa2_poligono_a_poligono,
+    "etapa2_vectorizado": bench_etapa2_vectorizado,
+    "etapa3_procesar_fecha": bench_etapa3_procesar_fecha,
+    "lonja_carga": bench_lonja_carga,
+    "etapa4b_merge": bench_etapa4b_merge,
+}
+
+
+# ------------------------
+# EJECUCIÓN Y RESULTADOS
+# ------------------------
+def medir(ejecutar, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        with redirect_stdout(io.StringIO()):  # los prints de las etapas no cuentan
+            t0 = time.perf_counter()
+            ejecutar()
+            tiempos.append(time.perf_counter() - t0)
+    return tiempos
+
+
+def resultado_anterior(salida, actual):
+    previos = sorted(p for p in glob.glob(os.path.join(salida, "bench_*.json")) if os.path.abspath(p) != actual)
+    if not previos:
+        return None, None
+    with open(previos[-1], encoding="utf-8") as f:
+        return previos[-1], json.load(f)
+
+
+def comparar(resultados, anterior):
+    previos = {r["nombre"]: r for r in anterior["resultados"]}
+    print(f"\nComparación con {anterior['commit']} ({anterior['fecha']}):")
+    for r in resultados:
+        p = previos.get(r["nombre"])
+        if p is None or p["elementos"] != r["elementos"]:
+            print(f"  {r['nombre']:<28} (sin referencia comparable)")
+            continue
+        print(f"  {r['nombre']:<28} {p['mejor_s']:9.3f} s -> {r['mejor_s']:9.3f} s  (x{p['mejor_s'] / r['mejor_s']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmarks de gamba y lonja con datos sintéticos")
+    parser.add_argument("--solo", nargs="+", choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument("--dias", type=int, default=20, help="Días con imágenes (etapas 3 y 4b)")
+    parser.add_argument("--imagenes", type=int, default=300, help="Imágenes por día (y en el .7z)")
+    parser.add_argument("--tasa-ara", type=float, default=0.3, help="Fracción de imágenes ARA/Caj 001/Ord 1")
+    parser.add_argument("--ventas-dia", type=int, default=200, help="Ventas de lonja por día, aparte de las imágenes")
+    parser.add_argument("--tasa-devolucion", type=float, default=0.02)
+    parser.add_argument("--poligonos", type=int, default=50_000, help="Polígonos para la etapa 2")
+    parser.add_argument("--anio", type=int, default=2025)
+    parser.add_argument("--extraccion", choices=["disco", "memoria"], default="memoria")
+    parser.add_argument("--hilos-exif", type=int, default=8)
+    parser.add_argument("--salidas", choices=["completo", "etiquetas", "muestra", "mascaras"], default="completo",
+                        help="Política de salidas de la etapa 1")
+    parser.add_argument("--latencia-yolo", type=float, default=0.0, help="s por imagen de la inferencia simulada")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", default=SALIDA_DEFECTO, help="Carpeta de los JSON de resultados")
+    args = parser.parse_args()
+
+    yolo_simulado.instalar(latencia=args.latencia_yolo)
+    directorio = tempfile.mkdtemp(prefix="bench_remar_")
+    resultados = []
+    try:
+        t0 = time.perf_counter()
+        datos = preparar_datos(directorio, args)
+        print(f"Datos sintéticos generados en {time.perf_counter() - t0:.1f} s "
+              f"({args.dias} días x {args.imagenes} imágenes, {datos.filas_lonja} filas de lonja)")
+
+        for nombre in args.solo or BENCHMARKS:
+            with redirect_stdout(io.StringIO()):
+                elementos, unidad, ejecutar = BENCHMARKS[nombre](datos, args)
+            tiempos = medir(ejecutar, max(1, args.repeticiones))
+            mejor = min(tiempos)
+            resultados.append({
+                "nombre": nombre, "elementos": elementos, "unidad": unidad,
+                "mejor_s": round(mejor, 6), "mediana_s": round(statistics.median(tiempos), 6),
+                "por_segundo": round(elementos / mejor, 1) if mejor > 0 else None,
+            })
+            print(f"{nombre:<28} {mejor:9.3f} s (mediana {statistics.median(tiempos):.3f} s)  "
+                  f"{elementos / mejor:12.1f} {unidad}/s")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    salida = os.path.abspath(args.salida)
+    os.makedirs(salida, exist_ok=True)
+    commit = version_codigo()
+    marca = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    ruta = os.path.join(salida, f"bench_{marca}_{commit.replace('+', '-sucio')}.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit, "fecha": marca, "host": platform.node(), "python": platform.python_version(),
+            "cpus": os.cpu_count(), "parametros": {k: v for k, v in vars(args).items() if k != "salida"},
+            "resultados": resultados,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en: {ruta}")
+
+    _, anterior = resultado_anterior(salida, ruta)
+    if anterior is not None:
+        comparar(resultados, anterior)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Generadores de datos sintéticos para los benchmarks de las cadenas de gamba y
+lonja. Todos parten de la misma lista de imágenes por día (imagenes_dia), así
+que las salidas encajan entre sí como en producción:
+
+    .7z con EXIF OPMM -> etiquetas YOLO -> areas_resultados_<fecha>.txt
+    + resultados_metadatos.txt -> resultados_procesados_<fecha>.csv
+    + ARA.csv (un año de ventas, con pares de devolución)
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+DIR_SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if DIR_SCRIPTS not in sys.path:
+    sys.path.insert(0, DIR_SCRIPTS)
+
+from areas_gamba import escribir_areas_txt  # noqa: E402
+from lonja_parquet import COLUMNAS_LONJA  # noqa: E402
+
+TAG_IMAGE_DESCRIPTION = 0x010E  # campo ASCII de IFD0 donde va el payload OPMM
+PESOS_CAJA = [2.5, 3.0, 4.25, 5.0, 6.5, 7.25, 8.0]
+
+
+# ------------------------
+# IMÁGENES DE UN DÍA
+# ------------------------
+def imagenes_dia(fecha, n, tasa_ara=0.3, semilla=0):
+    """
+    Lista de registros {Imagen, FAO, Caj, Ord, Pes, Vta} de un día de subasta.
+    Una fracción `tasa_ara` cumple los criterios (FAO ARA, Caj 001, Ord 1); el
+    resto falla alguno de los tres. Imagen es el nombre sin extensión.
+    """
+    rng = np.random.default_rng([semilla, int(str(fecha).replace("-", ""))])
+    segundos = np.sort(rng.choice(4 * 3600, n, replace=False)) + 4 * 3600
+    registros = []
+    for i, s in enumerate(segundos):
+        seleccionable = rng.random() < tasa_ara
+        fallo = int(rng.integers(0, 3))
+        registros.append({
+            "Imagen": f"OPMM_Subasta_{fecha}_{s // 3600:02d}_{s // 60 % 60:02d}_{s % 60:02d}.{i % 1000:03d}_Imedea",
+            "FAO": "ARA" if seleccionable or fallo != 0 else str(rng.choice(["MUT", "HKE", "ARS"])),
+            "Caj": "001" if seleccionable or fallo != 1 else f"{int(rng.integers(2, 9)):03d}",
+            "Ord": "1" if seleccionable or fallo != 2 else "2",
+            "Pes": float(rng.choice(PESOS_CAJA)),
+            "Vta": int(i + 1),
+        })
+    return registros
+
+
+def seleccionables(registros):
+    return [r for r in registros if r["FAO"] == "ARA" and r["Caj"] == "001" and r["Ord"] == "1"]
+
+
+def payload_opmm(registro):
+    pes = f"{registro['Pes']:g}".replace(".", ",")
+    return (f"FAO:{registro['FAO']}*Caj:{registro['Caj']}*Ord:{registro['Ord']}"
+            f"*Pes:{pes}*Vta:{registro['Vta']}*Emb:SINTETICO")
+
+
+# ------------------------
+# ARCHIVOS .7z CON EXIF OPMM
+# ------------------------
+def jpeg_opmm(payload, tamano=(96, 64), color=(120, 80, 60)):
+    """JPEG pequeño con el payload OPMM en ImageDescription (IFD0)."""
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[TAG_IMAGE_DESCRIPTION] = payload
+    buffer = io.BytesIO()
+    Image.new("RGB", tamano, color).save(buffer, "JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def generar_7z(directorio, fecha, registros, tamano=(96, 64)):
+    """Escribe OPMM_Subasta_<fecha>.7z con una imagen por registro. Devuelve la ruta."""
+    import py7zr
+
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"OPMM_Subasta_{fecha}.7z")
+    with py7zr.SevenZipFile(ruta, mode="w") as z:
+        for registro in registros:
+            z.writestr(jpeg_opmm(payload_opmm(registro), tamano), f"{fecha}/{registro['Imagen']}.jpg")
+    return ruta
+
+
+# ------------------------
+# ETIQUETAS Y ÁREAS
+# ------------------------
+def poligono_aleatorio(rng):
+    """Polígono estrellado de 20-60 vértices en coordenadas normalizadas."""
+    n = int(rng.integers(20, 61))
+    angulos = np.sort(rng.uniform(0, 2 * np.pi, n))
+    radios = rng.uniform(0.01, 0.08, n)
+    centro = rng.uniform(0.1, 0.9, 2)
+    return np.clip(centro + np.c_[radios * np.cos(angulos), radios * np.sin(angulos)], 0, 1)
+
+
+def linea_etiqueta(rng, clase=None):
+    xy = poligono_aleatorio(rng)
+    clase = int(rng.integers(0, 3)) if clase is None else clase
+    valores = " ".join(f"{v:g}" for v in xy.reshape(-1))
+    return f"{clase} {valores} {rng.uniform(0.25, 1):g}"
+
+
+def generar_etiquetas(directorio, n_poligonos, por_fichero, semilla=0, nombres=None):
+    """
+    Ficheros de etiquetas YOLO-seg ('clase x1 y1 ... conf'), `por_fichero`
+    polígonos en cada uno. Con `nombres` (sin extensión) se usa un fichero por
+    nombre; si no, nombres OPMM correlativos. Devuelve las rutas.
+    """
+    rng = np.random.default_rng(semilla)
+    os.makedirs(directorio, exist_ok=True)
+    if nombres is None:
+        nombres = [f"OPMM_Subasta_2025-01-01_00_00_{i:06d}.000_Imedea"
+                   for i in range(0, n_poligonos, por_fichero)]
+    rutas = []
+    for k, nombre in enumerate(nombres):
+        cuantos = min(por_fichero, n_poligonos - k * por_fichero)
+        if cuantos <= 0:
+            break
+        ruta = os.path.join(directorio, f"{nombre}.txt")
+        with open(ruta, "w") as f:
+            f.write("\n".join(linea_etiqueta(rng) for _ in range(cuantos)) + "\n")
+        rutas.append(ruta)
+    return rutas
+
+
+def generar_areas_resultados(directorio, fecha, registros, poligonos_medios=12, semilla=0):
+    """
+    AREAS/areas_resultados_<fecha>.txt con el formato de la etapa 2 para las
+    imágenes seleccionables del día (clases 0-2, áreas en píxeles de la rejilla
+    640x640). Devuelve la ruta.
+    """
+    rng = np.random.default_rng([semilla, int(str(fecha).replace("-", ""))])
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"areas_resultados_{fecha}.txt")
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    bloques = []
+    for registro in seleccionables(registros):
+        n = int(rng.poisson(poligonos_medios))
+        clases = rng.choice(3, n, p=[0.2, 0.2, 0.6]).tolist()
+        areas = np.round(rng.lognormal(5.5, 0.5, n), 1).tolist()
+        bloques.append((f"{registro['Imagen']}.txt", clases, areas))
+    escribir_areas_txt(bloques, ruta)
+    return ruta
+
+
+def generar_metadatos(ruta, registros_por_fecha):
+    """INFERENCE/resultados_metadatos.txt (Imagen, Pes, Vta) de las imágenes seleccionables."""
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, "w", encoding="cp1252") as f:
+        f.write("Imagen\tPes\tVta\n")
+        for fecha in sorted(registros_por_fecha):
+            for r in seleccionables(registros_por_fecha[fecha]):
+                f.write(f"{r['Imagen']}.jpg\t{r['Pes']:g}\t{r['Vta']}\n")
+    return ruta
+
+
+def generar_resultados_procesados(directorio, fecha, registros, semilla=0):
+    """RESULTS/resultados_procesados_<fecha>.csv como lo escribe la etapa 3."""
+    rng = np.random.default_rng([semilla, int(str(fecha).replace("-", "")), 3])
+    filas = seleccionables(registros)
+    n = len(filas)
+    num_id_2 = rng.integers(1, 15, n)
+    peso_medio = rng.uniform(8, 25, n)
+    pes = np.array([r["Pes"] for r in filas], dtype=float)
+    df = pd.DataFrame({
+        "Imagen": [r["Imagen"] for r in filas],
+        "Num_ID_0_2": num_id_2 + rng.integers(0, 6, n),
+        "Num_ID_2": num_id_2,
+        "Area_media_2": rng.uniform(100, 600, n),
+        "Peso_Medio_2": peso_medio,
+        "Pes": pes,
+        "Vta": [r["Vta"] for r in filas],
+        "num_gambas": pes / (peso_medio / 1000),
+    })
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"resultados_procesados_{fecha}.csv")
+    df.to_csv(ruta, index=False)
+    return ruta
+
+
+# ------------------------
+# LONJA (ARA.csv)
+# ------------------------
+def generar_lonja_csv(ruta, anio=2025, ventas_dia=200, tasa_devolucion=0.02, registros_por_fecha=None,
+                      semilla=0):
+    """
+    Un año de ventas al estilo ARA.csv (COLUMNAS_LONJA, FECHA con hora). Cada
+    día tiene `ventas_dia` ventas más, si se pasan, las de las imágenes
+    seleccionables de ese día (mismo NUMVENTA y PESONETO, para que 4b las cruce).
+    Una fracción `tasa_devolucion` de ventas lleva su par de devolución
+    (NUMENVAS -1, importes en negativo) y hay un 1 % de filas con NUMENVAS 0.
+    Devuelve el número de filas.
+    """
+    rng = np.random.default_rng(semilla)
+    registros_por_fecha = registros_por_fecha or {}
+    partes = []
+    for dia in pd.date_range(f"{anio}-01-01", f"{anio}-12-31", freq="D"):
+        fecha = dia.strftime("%Y-%m-%d")
+        de_imagenes = seleccionables(registros_por_fecha.get(fecha, []))
+        n_extra = ventas_dia
+        n = n_extra + len(de_imagenes)
+
+        numventa = np.concatenate([[r["Vta"] for r in de_imagenes],
+                                   len(registros_por_fecha.get(fecha, [])) + 1 + np.arange(n_extra)])
+        peso = np.concatenate([[r["Pes"] for r in de_imagenes], rng.choice(PESOS_CAJA, n_extra)])
+        precio = np.round(rng.uniform(20, 90, n), 2)
+        segundos = np.sort(rng.integers(5 * 3600, 9 * 3600, n))
+        numenvas = np.where(rng.random(n) < 0.01, 0, 1)
+        df = pd.DataFrame({
+            "FECHA": dia + pd.to_timedelta(segundos, unit="s"),
+            "NEMBARCACION": [f"EMBARCACION {k}" for k in rng.integers(1, 60, n)],
+            "NIF": [f"B{k:08d}" for k in rng.integers(0, 10 ** 8, n)],
+            "CONCEPTO": "GAMBA ROJA",
+            "NUMENVAS": numenvas,
+            "PESONETO": peso,
+            "PRECIOUNID": precio,
+            "IMPORTE": np.round(peso * precio, 2),
+            "CODCLIENTE": rng.integers(1, 400, n),
+            "CODCENSO": rng.integers(1000, 1100, n),
+            "NUMVENTA": numventa.astype(np.int64),
+        })
+
+        # Pares de devolución: la fila original y su copia en negativo
+        devueltas = df[(rng.random(n) < tasa_devolucion) & (df["NUMENVAS"] == 1)].copy()
+        devueltas["NUMENVAS"] = -1
+        devueltas[["PESONETO", "IMPORTE"]] = -devueltas[["PESONETO", "IMPORTE"]]
+        devueltas["FECHA"] = devueltas["FECHA"] + pd.Timedelta(minutes=30)
+        partes.extend([df, devueltas])
+
+    lonja = pd.concat(partes, ignore_index=True)[COLUMNAS_LONJA]
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    lonja.to_csv(ruta, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    return len(lonja)
+
+
+def fechas_consecutivas(desde, dias):
+    return [d.strftime("%Y-%m-%d") for d in pd.date_range(desde, periods=dias, freq="D")]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Sustituto de ultralytics.YOLO para medir la etapa 1 sin GPU ni pesos: predict()
+devuelve para cada imagen unas máscaras sintéticas con la misma interfaz que
+usan 1_inference_gamba_args.py y areas_gamba (masks.xyn, boxes.cls, boxes.conf,
+orig_shape, save_txt, save). Con `latencia` (s por imagen) simula el coste de la red.
+
+    from benchmarks import yolo_simulado
+    yolo_simulado.instalar()          # antes de importar la etapa 1
+"""
+
+import os
+import sys
+import time
+import types
+
+import numpy as np
+
+from benchmarks.generadores import poligono_aleatorio
+
+
+class ListaTensor(list):
+    """Lista con tolist(), como los tensores de ultralytics."""
+
+    def tolist(self):
+        return list(self)
+
+
+class ResultadoSimulado:
+    def __init__(self, rng, poligonos_medios=12, orig_shape=(640, 640)):
+        n = int(rng.poisson(poligonos_medios))
+        self.xyn = [poligono_aleatorio(rng) for _ in range(n)]
+        self.conf = rng.uniform(0.25, 1, n)
+        self.orig_shape = orig_shape
+        self.masks = types.SimpleNamespace(xyn=self.xyn) if n else None
+        self.boxes = types.SimpleNamespace(cls=ListaTensor(float(c) for c in rng.choice(3, n, p=[0.2, 0.2, 0.6])),
+                                           conf=ListaTensor(float(c) for c in self.conf))
+
+    def save_txt(self, ruta, save_conf=False):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "a") as f:
+            for clase, xy, conf in zip(self.boxes.cls, self.xyn, self.conf):
+                valores = " ".join(f"{v:g}" for v in xy.reshape(-1))
+                f.write(f"{int(clase)} {valores}" + (f" {conf:g}" if save_conf else "") + "\n")
+
+    def save(self, filename=None):
+        with open(filename, "wb") as f:
+            f.write(b"\xff\xd8\xff\xd9")  # JPEG vacío: solo se mide la escritura
+
+
+def forma(entrada):
+    """(alto, ancho) de la entrada de predict(): array, imagen PIL o ruta (sin leer: 640x640)."""
+    if hasattr(entrada, "shape"):
+        return tuple(entrada.shape[:2])
+    if hasattr(entrada, "size"):
+        return entrada.size[1], entrada.size[0]
+    return 640, 640
+
+
+class YOLO:
+    latencia = 0.0
+    poligonos_medios = 12
+
+    def __init__(self, pesos=None, semilla=0):
+        self.pesos = pesos
+        self.rng = np.random.default_rng(semilla)
+
+    def predict(self, entradas, batch=1, save=False, **kwargs):
+        if self.latencia:
+            time.sleep(self.latencia * len(entradas))
+        return [ResultadoSimulado(self.rng, self.poligonos_medios, forma(entrada)) for entrada in entradas]
+
+
+def instalar(latencia=0.0, poligonos_medios=12):
+    """Registra este módulo como `ultralytics` para que `from ultralytics import YOLO` use el simulado."""
+    YOLO.latencia = latencia
+    YOLO.poligonos_medios = poligonos_medios
+    modulo = types.ModuleType("ultralytics")
+    modulo.YOLO = YOLO
+    sys.modules["ultralytics"] = modulo
+    return YOLO
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Catálogo persistente (JSON) de ficheros de entrada ya procesados.
+
+Cada entrada guarda la huella del fichero fuente (tamaño, mtime y sha256) junto
+con lo que el script quiera recordar de su salida. Sirve para que las
+ejecuciones periódicas solo reprocesen lo nuevo o lo modificado.
+"""
+
+import os
+import json
+import hashlib
+import datetime
+
+
+def calcular_hash(ruta, bloque=1 << 20):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            sha.update(trozo)
+    return sha.hexdigest()
+
+
+def huella(ruta):
+    """Tamaño, mtime y sha256 del fichero."""
+    st = os.stat(ruta)
+    return {
+        "tamano": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": calcular_hash(ruta),
+    }
+
+
+def sin_cambios(entrada, ruta):
+    """
+    True si `ruta` coincide con la huella guardada en `entrada`. Si tamaño y
+    mtime coinciden no se recalcula el hash; si solo cambió el mtime se compara
+    el sha256 (p. ej. el fichero se volvió a copiar con el mismo contenido).
+    """
+    if not entrada or not os.path.isfile(ruta):
+        return False
+    st = os.stat(ruta)
+    if st.st_size != entrada.get("tamano"):
+        return False
+    if st.st_mtime == entrada.get("mtime"):
+        return True
+    return calcular_hash(ruta) == entrada.get("sha256")
+
+
+def cargar_catalogo(ruta):
+    if not os.path.isfile(ruta):
+        return {}
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] No se pudo leer el catálogo {ruta}; se empieza de cero: {e}")
+        return {}
+
+
+def guardar_catalogo(catalogo, ruta):
+    """Escritura atómica: un fallo a mitad no deja el catálogo corrupto."""
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(catalogo, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def registrar(catalogo, clave, huella_fuente, **salida):
+    """Guarda en el catálogo la huella de la fuente y los datos de su salida."""
+    catalogo[clave] = {
+        **huella_fuente,
+        **salida,
+        "procesado": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    return catalogo[clave]
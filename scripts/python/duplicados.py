@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Detección de fotos repetidas de la misma caja antes de la inferencia (etapa 1).
+
+En la subasta se fotografía a veces la misma caja más de una vez. Para cada
+imagen seleccionable se calcula un dHash de 64 bits (gris 9x8, signo del
+gradiente horizontal) y se busca en la caché del día otra imagen con el mismo
+Pes y Vta cuyo hash esté a una distancia de Hamming <= distancia_max. Si la
+hay, se reutiliza su predicción en vez de volver a pasar la imagen por YOLO.
+
+La caché es un JSON por día (dhash.json en el directorio de resultados de la
+fecha) con el hash, Pes, Vta y la predicción compacta (clases, confianzas,
+polígonos normalizados y tamaño) de cada imagen inferida.
+"""
+
+import io
+import os
+import json
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DISTANCIA_DUPLICADO = 4  # bits distintos (de 64) para considerar dos fotos la misma
+NOMBRE_CACHE = "dhash.json"
+
+
+# ------------------------
+# dHash
+# ------------------------
+def dhash(fuente, tamano=8):
+    """dHash de una imagen (bytes o ruta) como entero de tamano*tamano bits."""
+    from PIL import Image
+
+    if isinstance(fuente, (bytes, bytearray)):
+        fuente = io.BytesIO(fuente)
+    with Image.open(fuente) as img:
+        # En JPEG, draft() decodifica ya reducido (1/2 .. 1/8): mucho más barato que la imagen completa
+        img.draft("L", (tamano * 8, tamano * 8))
+        gris = np.asarray(img.convert("L").resize((tamano + 1, tamano), Image.BILINEAR), dtype=np.int16)
+    bits = (gris[:, 1:] > gris[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def calcular_dhashes(fuentes, hilos=8):
+    """dHash de cada fuente en el mismo orden; None si la imagen no se puede leer."""
+    def seguro(fuente):
+        try:
+            return dhash(fuente)
+        except Exception as e:
+            print(f"[WARN] No se pudo calcular el dHash: {e}")
+            return None
+
+    fuentes = list(fuentes)
+    if hilos <= 1 or len(fuentes) <= 1:
+        return [seguro(f) for f in fuentes]
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        return list(pool.map(seguro, fuentes))
+
+
+def distancia(a, b):
+    return bin(a ^ b).count("1")
+
+
+# ------------------------
+# PREDICCIONES GUARDADAS
+# ------------------------
+class ListaValores(list):
+    """Lista con tolist(), como los tensores de ultralytics."""
+
+    def tolist(self):
+        return list(self)
+
+
+def prediccion_compacta(resultado):
+    """Lo necesario de un Results para rehacer etiquetas, áreas y máscaras."""
+    tiene_mascaras = resultado.masks is not None and resultado.boxes is not None
+    alto, ancho = getattr(resultado, "orig_shape", (0, 0))[:2]
+    return {
+        "clases": [int(c) for c in resultado.boxes.cls.tolist()] if tiene_mascaras else [],
+        "confianzas": [float(c) for c in resultado.boxes.conf.tolist()] if tiene_mascaras else [],
+        "poligonos": [np.asarray(xy, dtype=np.float64).tolist() for xy in resultado.masks.xyn] if tiene_mascaras else [],
+        "tamano": [int(ancho), int(alto)],
+    }
+
+
+class PrediccionGuardada:
+    """
+    Resultado reconstruido desde la caché, con la parte de la interfaz de
+    Results que usa la etapa 1 (masks.xyn, boxes.cls/conf, orig_shape,
+    save_txt). No hay imagen que anotar: save() no escribe nada.
+    """
+    reutilizado = True
+
+    def __init__(self, prediccion):
+        poligonos = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in prediccion["poligonos"]]
+        self.masks = types.SimpleNamespace(xyn=poligonos) if poligonos else None
+        self.boxes = types.SimpleNamespace(cls=ListaValores(float(c) for c in prediccion["clases"]),
+                                           conf=ListaValores(prediccion["confianzas"]))
+        ancho, alto = prediccion["tamano"]
+        self.orig_shape = (alto, ancho)
+
+    def save_txt(self, ruta, save_conf=False):
+        """Mismo formato que Results.save_txt para segmentación: 'clase x1 y1 ... [conf]' con %g."""
+        if self.masks is None:
+            return
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "a") as f:
+            for clase, xy, conf in zip(self.boxes.cls, self.masks.xyn, self.boxes.conf):
+                linea = (int(clase), *xy.reshape(-1).tolist()) + ((conf,) if save_conf else ())
+                f.write(("%g " * len(linea)).rstrip() % linea + "\n")
+
+    def save(self, filename=None):
+        pass
+
+
+# ------------------------
+# CACHÉ POR DÍA
+# ------------------------
+class CacheDuplicados:
+    """Hashes y predicciones de las imágenes ya inferidas de un día."""
+
+    def __init__(self, ruta, distancia_max=DISTANCIA_DUPLICADO):
+        self.ruta = ruta
+        self.distancia_max = distancia_max
+        self.imagenes = {}
+        if os.path.isfile(ruta):
+            try:
+                with open(ruta, encoding="utf-8") as f:
+                    self.imagenes = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] No se pudo leer la caché de duplicados {ruta}; se empieza de cero: {e}")
+        self.por_caja = {}
+        for filename, entrada in self.imagenes.items():
+            self.por_caja.setdefault((entrada["pes"], entrada["vta"]), []).append(filename)
+
+    def buscar(self, hash_img, pes, vta):
+        """Nombre de una imagen anterior con el mismo Pes/Vta y un hash cercano, o None."""
+        if hash_img is None:
+            return None
+        for filename in self.por_caja.get((str(pes), str(vta)), []):
+            if distancia(hash_img, self.imagenes[filename]["dhash"]) <= self.distancia_max:
+                return filename
+        return None
+
+    def anotar(self, filename, hash_img, pes, vta):
+        """Registra una imagen que se va a inferir (su predicción llega después con guardar_prediccion)."""
+        if hash_img is None:
+            return
+        self.imagenes[filename] = {"dhash": hash_img, "pes": str(pes), "vta": str(vta), "prediccion": None}
+        self.por_caja.setdefault((str(pes), str(vta)), []).append(filename)
+
+    def guardar_prediccion(self, filename, resultado):
+        if filename in self.imagenes:
+            self.imagenes[filename]["prediccion"] = prediccion_compacta(resultado)
+
+    def prediccion(self, filename):
+        """PrediccionGuardada de una imagen inferida, o None si su inferencia falló."""
+        entrada = self.imagenes.get(filename)
+        if entrada is None or entrada["prediccion"] is None:
+            return None
+        return PrediccionGuardada(entrada["prediccion"])
+
+    def guardar(self):
+        """Escritura atómica, como guardar_catalogo."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.imagenes, f)
+        os.replace(temporal, self.ruta)
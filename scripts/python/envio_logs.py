@@ -8,6 +8,8 @@ from datetime import date, timedelta
 from typing import Dict, List
 import pandas as pd
 
+from metricas import leer_metricas
+
 # =========================
 # Configuración
 # =========================
@@ -185,10 +187,39 @@ def tabla_embarcaciones(csv_boats: Path, log_boat: Path, max_rows: int = 20) ->
         f"{table}"
     )
 
+def resumen_metricas(logs_dir: Path, fecha_str: str, max_contadores: int = 6) -> str:
+    """
+    Resumen de rendimiento de las etapas Python del día a partir de los
+    metricas_<fecha>_*.jsonl (ver metricas.py): tiempo real y de CPU, pico de
+    memoria, contadores principales y p50/p95 de cada latencia.
+    Devuelve '' si ese día no hay métricas.
+    """
+    registros = leer_metricas(sorted(logs_dir.glob(f"metricas_{fecha_str}_*.jsonl")))
+    if not registros:
+        return ""
+
+    lineas = []
+    for r in sorted(registros, key=lambda r: r.get("inicio", "")):
+        rss = r.get("rss_pico_mb")
+        linea = (f"- {r.get('etapa', '?')} [{r.get('estado', '?')}] {r.get('inicio', '')[11:16]}: "
+                 f"{r.get('wall_s', 0):.1f} s, CPU {r.get('cpu_s', 0):.1f} s"
+                 + (f", RSS pico {rss:.0f} MB" if rss is not None else ""))
+        contadores = list(r.get("contadores", {}).items())[:max_contadores]
+        if contadores:
+            linea += "\n    " + ", ".join(f"{k}={v}" for k, v in contadores)
+        for nombre, h in r.get("latencias", {}).items():
+            if h.get("n"):
+                linea += (f"\n    {nombre}: n={h['n']}, p50 {h['p50_s'] * 1000:.1f} ms, "
+                          f"p95 {h['p95_s'] * 1000:.1f} ms, máx {h['max_s'] * 1000:.1f} ms")
+        if r.get("error"):
+            linea += f"\n    error: {r['error']}"
+        lineas.append(linea)
+    return "[RENDIMIENTO]\n" + "\n".join(lineas)
+
 # =========================
 # Construcción del cuerpo
 # =========================
-def cuerpo_error_critico(fecha_str: str, log_sp: Path, csv_sp: Path) -> str:
+def cuerpo_error_critico(fecha_str: str, log_sp: Path, csv_sp: Path, rendimiento: str = "") -> str:
     log_txt = leer_log_txt(log_sp).strip()
     especies = leer_csv_col(csv_sp, col="NUEVA_ESPECIE")
     especies_txt = "\n".join(f"- {e}" for e in especies) if especies else "No hay especies nuevas listadas."
@@ -199,6 +230,7 @@ def cuerpo_error_critico(fecha_str: str, log_sp: Path, csv_sp: Path) -> str:
         f"{log_txt}\n\n"
         "Especies detectadas:\n"
         f"{especies_txt}\n"
+        + (f"\n---\n\n{rendimiento}\n" if rendimiento else "")
     )
 
 def cuerpo_alertas(
@@ -206,6 +238,7 @@ def cuerpo_alertas(
     log_boat: Path,
     csv_boats: Path,
     logs_cv: List[Path],
+    rendimiento: str = "",
 ) -> str:
     partes: List[str] = []
 
@@ -221,10 +254,11 @@ def cuerpo_alertas(
     if cajas_verdes:
         partes.append("[CAJAS VERDES]\n" + "\n\n".join(cajas_verdes))
 
+    extra = f"\n\n---\n\n{rendimiento}\n" if rendimiento else ""
     if partes:
-        return header(fecha_str) + "\n\n---\n\n".join(partes) + footer()
+        return header(fecha_str) + "\n\n---\n\n".join(partes) + extra + footer()
     else:
-        return header(fecha_str) + "✅ No se detectaron errores ni advertencias.\n" + footer()
+        return header(fecha_str) + "✅ No se detectaron errores ni advertencias.\n" + extra + footer()
 
 # =========================
 # Main (componer y enviar)
@@ -259,10 +293,11 @@ def enviar_reporte(logs_dir: Path, fecha: date | None = None):
     message["To"] = ", ".join([e for e in EMAIL_RECEIVER.values() if e])
     message["Date"] = formatdate(localtime=True)
 
+    rendimiento = resumen_metricas(logs_dir, fecha_str)
     if hay_critico:
-        cuerpo = cuerpo_error_critico(fecha_str, log_sp, csv_sp)
+        cuerpo = cuerpo_error_critico(fecha_str, log_sp, csv_sp, rendimiento)
     else:
-        cuerpo = cuerpo_alertas(fecha_str, log_boat, csv_boats, logs_cv)
+        cuerpo = cuerpo_alertas(fecha_str, log_boat, csv_boats, logs_cv, rendimiento)
 
     message.set_content(cuerpo)
 
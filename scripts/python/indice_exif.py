@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+Índice SQLite de los metadatos OPMM de los miembros de cada .7z de la lonja.
+
+La primera vez que la etapa 1 escanea un archivo guarda, por cada miembro, su
+nombre, tamaño y el registro OPMM (FAO, Caj, Ord, Pes, Vta) junto con la huella
+del .7z. Mientras el archivo no cambie, las ejecuciones siguientes sacan del
+índice qué imágenes cumplen los criterios y solo extraen esas.
+
+También sirve para consultas sin abrir ningún .7z:
+
+    python indice_exif.py --por-dia --anio 2025       # cajas ARA seleccionables por día
+    python indice_exif.py --sql "SELECT fao, COUNT(*) FROM miembros GROUP BY fao"
+"""
+
+import os
+import sqlite3
+import argparse
+import datetime
+from contextlib import closing
+
+from catalogo import sin_cambios
+from metadatos_opmm import es_seleccionable
+
+BASE = "C:\\Users\\UIB\\Desktop\\REMAR-automatizacion"
+RUTA_INDICE = os.path.join(BASE, "INFERENCE", "indice_exif.sqlite")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    archivo   TEXT PRIMARY KEY,
+    fecha     TEXT,
+    tamano    INTEGER,
+    mtime     REAL,
+    sha256    TEXT,
+    miembros  INTEGER,
+    indexado  TEXT
+);
+CREATE TABLE IF NOT EXISTS miembros (
+    archivo        TEXT NOT NULL,
+    miembro        TEXT NOT NULL,
+    imagen         TEXT,
+    tamano         INTEGER,
+    con_exif       INTEGER,
+    fao            TEXT,
+    caj            TEXT,
+    ord            TEXT,
+    pes            TEXT,
+    vta            TEXT,
+    seleccionable  INTEGER,
+    PRIMARY KEY (archivo, miembro)
+);
+CREATE INDEX IF NOT EXISTS miembros_seleccionables ON miembros (archivo, seleccionable);
+CREATE INDEX IF NOT EXISTS archivos_fecha ON archivos (fecha);
+"""
+
+
+# ------------------------
+# CONEXIÓN
+# ------------------------
+def conectar(ruta=RUTA_INDICE):
+    """Abre (y crea si hace falta) el índice. Espera si otro proceso está escribiendo."""
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    conn = sqlite3.connect(ruta, timeout=30)
+    conn.executescript(ESQUEMA)
+    return conn
+
+
+# ------------------------
+# LECTURA Y ESCRITURA
+# ------------------------
+def archivo_vigente(ruta, archivo, ruta_7z):
+    """True si `archivo` está indexado y el .7z no ha cambiado desde entonces."""
+    with closing(conectar(ruta)) as conn:
+        fila = conn.execute("SELECT tamano, mtime, sha256 FROM archivos WHERE archivo = ?", (archivo,)).fetchone()
+    if fila is None:
+        return False
+    return sin_cambios(dict(zip(("tamano", "mtime", "sha256"), fila)), ruta_7z)
+
+
+def miembros_seleccionables(ruta, archivo):
+    """[(miembro, imagen, pes, vta)] de las imágenes del archivo que cumplen los criterios, por nombre."""
+    with closing(conectar(ruta)) as conn:
+        return conn.execute(
+            "SELECT miembro, imagen, pes, vta FROM miembros WHERE archivo = ? AND seleccionable = 1 "
+            "ORDER BY miembro", (archivo,)).fetchall()
+
+
+def guardar_archivo(ruta, archivo, fecha, huella_7z, miembros):
+    """
+    Sustituye la entrada de `archivo` por la huella actual y sus miembros
+    [(miembro, tamano, registro)], con registro el de escanear_imagen (o None).
+    """
+    filas = []
+    for miembro, tamano, registro in miembros:
+        seleccionable = es_seleccionable(registro)
+        registro = registro or {}
+        filas.append((archivo, miembro, os.path.basename(miembro), tamano, int(bool(registro)),
+                      registro.get("FAO"), registro.get("Caj"), registro.get("Ord"),
+                      registro.get("Pes"), registro.get("Vta"), int(seleccionable)))
+
+    with closing(conectar(ruta)) as conn, conn:
+        conn.execute("DELETE FROM miembros WHERE archivo = ?", (archivo,))
+        conn.executemany("INSERT INTO miembros VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", filas)
+        conn.execute("INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (archivo, str(fecha), huella_7z["tamano"], huella_7z["mtime"], huella_7z["sha256"],
+                      len(filas), datetime.datetime.now().isoformat(timespec="seconds")))
+
+
+# ------------------------
+# CONSULTAS
+# ------------------------
+def cajas_por_dia(ruta, anio=None):
+    """[(fecha, archivos, imagenes, seleccionables, kg)] de lo indexado, opcionalmente de un año."""
+    consulta = """
+        SELECT a.fecha, COUNT(DISTINCT a.archivo), COUNT(m.miembro), COALESCE(SUM(m.seleccionable), 0),
+               COALESCE(SUM(CASE WHEN m.seleccionable = 1 THEN CAST(m.pes AS REAL) END), 0)
+        FROM archivos a LEFT JOIN miembros m ON m.archivo = a.archivo
+        {filtro}
+        GROUP BY a.fecha ORDER BY a.fecha
+    """
+    with closing(conectar(ruta)) as conn:
+        if anio:
+            return conn.execute(consulta.format(filtro="WHERE a.fecha LIKE ?"), (f"{anio}-%",)).fetchall()
+        return conn.execute(consulta.format(filtro="")).fetchall()
+
+
+def parser_arguments():
+    parser = argparse.ArgumentParser("Índice EXIF de los .7z")
+    parser.add_argument('--indice', type=str, default=RUTA_INDICE,
+                        help="Fichero SQLite del índice")
+    parser.add_argument('--por-dia', action="store_true", default=False,
+                        help="Imágenes y cajas seleccionables (ARA, Caj 001, Ord 1) por día")
+    parser.add_argument('--anio', type=int, default=None,
+                        help="Limita --por-dia a un año")
+    parser.add_argument('--sql', type=str, default="",
+                        help="Consulta SQL libre sobre las tablas archivos y miembros")
+    return parser.parse_args()
+
+
+def main():
+    args = parser_arguments()
+    if not os.path.isfile(args.indice):
+        print(f"No existe el índice {args.indice}; se crea al ejecutar la etapa 1.")
+        return
+    if args.sql:
+        with closing(conectar(args.indice)) as conn:
+            cursor = conn.execute(args.sql)
+            print("\t".join(d[0] for d in cursor.description or []))
+            for fila in cursor:
+                print("\t".join(str(v) for v in fila))
+    if args.por_dia or not args.sql:
+        print("Fecha\tArchivos\tImagenes\tSeleccionables\tKg")
+        for fecha, archivos, imagenes, seleccionables, kg in cajas_por_dia(args.indice, args.anio):
+            print(f"{fecha}\t{archivos}\t{imagenes}\t{seleccionables}\t{kg:g}")
+
+
+# ------------------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Almacén columnar (Parquet) de las ventas de lonja, particionado por día:
+
+    <directorio>/fecha=YYYY-MM-DD/<origen>.parquet
+
+Todas las particiones tienen el mismo esquema fijo, con las columnas que espera
+01_data_cleaning_mallorca.R (expected_cols). Cada archivo de origen (.mdb)
+escribe su propio fichero dentro de la partición de cada día, de modo que
+reconvertir un origen solo reemplaza sus ficheros.
+
+Es un único dataset para las dos cadenas: lo escriben read_mdb_files.py
+(esfuerzo) y 4a_convierte_mdb_a_csv.py (gamba) a partir de los mismos .mdb, y
+el catálogo de lo ya volcado va dentro del propio dataset (_catalogo.json,
+una entrada por origen), así que lo que convierte uno no lo repite el otro.
+
+Para leer un rango de fechas (leer_lonja) se filtra por la columna de
+partición, así pyarrow solo abre las carpetas de esos días.
+"""
+
+import os
+import re
+import shutil
+
+import pandas as pd
+
+from catalogo import sin_cambios, cargar_catalogo, guardar_catalogo, registrar
+from metricas import contar
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo hace falta para el formato parquet
+    pa = ds = pq = None
+
+# Mismo orden que expected_cols en scripts/r/SSM/01_data_cleaning_mallorca.R
+COLUMNAS_LONJA = ["FECHA", "NEMBARCACION", "NIF", "CONCEPTO", "NUMENVAS",
+                  "PESONETO", "PRECIOUNID", "IMPORTE", "CODCLIENTE",
+                  "CODCENSO", "NUMVENTA"]
+
+ESQUEMA_LONJA = pa.schema([
+    ("FECHA", pa.timestamp("s")),
+    ("NEMBARCACION", pa.string()),
+    ("NIF", pa.string()),
+    ("CONCEPTO", pa.string()),
+    ("NUMENVAS", pa.int32()),
+    ("PESONETO", pa.float64()),
+    ("PRECIOUNID", pa.float64()),
+    ("IMPORTE", pa.float64()),
+    ("CODCLIENTE", pa.string()),  # códigos: se guardan tal cual, aunque no sean numéricos
+    ("CODCENSO", pa.string()),
+    ("NUMVENTA", pa.int64()),
+]) if pa is not None else None
+
+COLUMNA_PARTICION = "fecha"
+CATALOGO_LONJA = "_catalogo.json"  # dentro del dataset: al leer, pyarrow ignora los ficheros que empiezan por '_'
+
+
+def comprobar_pyarrow():
+    if pa is None:
+        raise ImportError("El formato parquet necesita pyarrow (pip install pyarrow)")
+
+
+def nombre_origen(ruta):
+    """Nombre de fichero estable para un origen: su nombre sin extensión, sin caracteres raros."""
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", base)
+
+
+def como_texto(valores):
+    """Columna como texto; los enteros que llegan como float (por tener nulos) sin el '.0'."""
+    if pd.api.types.is_float_dtype(valores) and (valores.dropna() % 1 == 0).all():
+        valores = valores.astype("Int64")
+    texto = valores.astype(object)
+    return texto.where(valores.isna(), texto.astype(str)).astype(object)
+
+
+def normalizar_lonja(df):
+    """
+    Ajusta un DataFrame de ventas al esquema fijo: añade como nulas las
+    columnas que falten, descarta las que sobran y convierte los tipos. Los
+    valores que no se pueden convertir quedan nulos y se avisa de cuántos hay.
+    """
+    df = df.copy()
+    for col in COLUMNAS_LONJA:
+        if col not in df.columns:
+            df[col] = None
+    df = df[COLUMNAS_LONJA]
+
+    for campo in ESQUEMA_LONJA:
+        valores = df[campo.name]
+        if pa.types.is_string(campo.type):
+            df[campo.name] = como_texto(valores)
+            continue
+        if campo.name == "FECHA":
+            df[campo.name] = pd.to_datetime(valores, errors="coerce")
+        else:
+            df[campo.name] = pd.to_numeric(valores, errors="coerce")
+        perdidos = valores.notna() & df[campo.name].isna()
+        if perdidos.any():
+            print(f"[WARN] Lonja: {int(perdidos.sum())} valores de {campo.name} no válidos se guardan como nulos "
+                  f"(p. ej. {valores[perdidos].iloc[0]!r})")
+            contar(f"valores_invalidos_{campo.name}", int(perdidos.sum()))
+    return df
+
+
+def ruta_particion(directorio, fecha):
+    return os.path.join(directorio, f"{COLUMNA_PARTICION}={fecha}")
+
+
+class EscritorParticiones:
+    """
+    Escritura por trozos de las ventas de un origen: cada trozo se reparte por
+    día y se añade al fichero <origen>.parquet de su partición. Los ficheros se
+    escriben como .<origen>.parquet.tmp (los lectores ignoran los que empiezan
+    por '.') y solo se renombran al cerrar, así un fallo a mitad no deja
+    particiones incompletas. Las filas sin FECHA válida no se guardan.
+    """
+
+    def __init__(self, directorio, origen):
+        comprobar_pyarrow()
+        self.directorio = directorio
+        self.origen = origen
+        self.escritores = {}
+
+    def temporal(self, fecha):
+        return os.path.join(ruta_particion(self.directorio, fecha), f".{self.origen}.parquet.tmp")
+
+    def escribir(self, df):
+        if df.empty:
+            return
+        df = normalizar_lonja(df)
+        dias = df["FECHA"].dt.strftime("%Y-%m-%d")
+        for fecha, parte in df.groupby(dias, sort=True):
+            escritor = self.escritores.get(fecha)
+            if escritor is None:
+                carpeta = ruta_particion(self.directorio, fecha)
+                os.makedirs(carpeta, exist_ok=True)
+                escritor = pq.ParquetWriter(self.temporal(fecha), ESQUEMA_LONJA)
+                self.escritores[fecha] = escritor
+            escritor.write_table(pa.Table.from_pandas(parte, schema=ESQUEMA_LONJA, preserve_index=False))
+
+    def cerrar(self):
+        """Cierra y publica los ficheros. Devuelve la lista de rutas escritas."""
+        rutas = []
+        for fecha, escritor in sorted(self.escritores.items()):
+            escritor.close()
+            ruta = os.path.join(ruta_particion(self.directorio, fecha), self.origen + ".parquet")
+            os.replace(self.temporal(fecha), ruta)
+            rutas.append(ruta)
+        self.escritores = {}
+        return rutas
+
+    def descartar(self):
+        for fecha, escritor in self.escritores.items():
+            escritor.close()
+            if os.path.exists(self.temporal(fecha)):
+                os.remove(self.temporal(fecha))
+        self.escritores = {}
+
+
+def escribir_lonja_parquet(df, directorio, origen):
+    """Escribe (sobrescribe) los ficheros de `origen` en las particiones de sus días."""
+    escritor = EscritorParticiones(directorio, origen)
+    try:
+        escritor.escribir(df)
+    except Exception:
+        escritor.descartar()
+        raise
+    return escritor.cerrar()
+
+
+def borrar_lonja_parquet(directorio):
+    shutil.rmtree(directorio, ignore_errors=True)
+
+
+# -------------------------
+# CATÁLOGO DEL DATASET
+# -------------------------
+def cargar_catalogo_lonja(directorio):
+    """{origen: huella del .mdb, ruta, filas y ficheros (relativos al dataset)} de lo ya volcado."""
+    return cargar_catalogo(os.path.join(directorio, CATALOGO_LONJA))
+
+
+def guardar_catalogo_lonja(catalogo, directorio):
+    guardar_catalogo(catalogo, os.path.join(directorio, CATALOGO_LONJA))
+
+
+def origen_vigente(catalogo, directorio, mdb):
+    """True si el .mdb ya está volcado tal como está ahora en disco y sus ficheros siguen en el dataset."""
+    entrada = catalogo.get(nombre_origen(mdb))
+    return (entrada is not None and
+            all(os.path.isfile(os.path.join(directorio, f)) for f in entrada.get("ficheros", [])) and
+            sin_cambios(entrada, mdb))
+
+
+def registrar_origen(catalogo, directorio, mdb, huella_mdb, ficheros, filas):
+    """
+    Apunta los ficheros recién escritos de un .mdb y borra los de su versión
+    anterior que ya no están (días que ya no tiene).
+    """
+    origen = nombre_origen(mdb)
+    relativos = [os.path.relpath(f, directorio) for f in ficheros]
+    for anterior in set(catalogo.get(origen, {}).get("ficheros", [])) - set(relativos):
+        ruta = os.path.join(directorio, anterior)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    registrar(catalogo, origen, huella_mdb, mdb=os.path.abspath(mdb), filas=filas, ficheros=relativos)
+
+
+def quitar_origenes_desaparecidos(catalogo, directorio, mdb_files):
+    """Borra del dataset (y del catálogo) los orígenes cuyo .mdb ya no está entre mdb_files."""
+    vigentes = {nombre_origen(m) for m in mdb_files}
+    for origen in sorted(set(catalogo) - vigentes):
+        for fichero in catalogo.pop(origen).get("ficheros", []):
+            ruta = os.path.join(directorio, fichero)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+def leer_lonja(directorio, desde=None, hasta=None, columnas=None):
+    """
+    Lee las ventas entre `desde` y `hasta` (incluidos; 'YYYY-MM-DD', date o
+    None para no acotar). El filtro se aplica sobre la partición, así que solo
+    se abren las carpetas de los días pedidos. Devuelve un DataFrame con
+    COLUMNAS_LONJA (o `columnas`).
+    """
+    comprobar_pyarrow()
+    columnas = columnas or COLUMNAS_LONJA
+    if not os.path.isdir(directorio):
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in columnas})
+
+    particiones = ds.partitioning(pa.schema([(COLUMNA_PARTICION, pa.string())]), flavor="hive")
+    dataset = ds.dataset(directorio, format="parquet", partitioning=particiones,
+                         schema=ESQUEMA_LONJA.append(pa.field(COLUMNA_PARTICION, pa.string())))
+
+    filtro = None
+    if desde is not None:
+        filtro = ds.field(COLUMNA_PARTICION) >= str(desde)
+    if hasta is not None:
+        condicion = ds.field(COLUMNA_PARTICION) <= str(hasta)
+        filtro = condicion if filtro is None else filtro & condicion
+
+    tabla = dataset.to_table(columns=columnas, filter=filtro)
+    return tabla.to_pandas()
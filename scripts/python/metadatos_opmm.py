@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+Lectura rápida de los metadatos OPMM que la lonja guarda en el EXIF de cada foto.
+
+Solo se lee el segmento APP1 (Exif) de la cabecera JPEG: no se abre la imagen
+con PIL ni se decodifica nada. El payload OPMM ('FAO:ARA*Caj:001*Ord:1*...')
+se parsea una sola vez por imagen y se devuelve un registro compacto:
+    {"Imagen", "FAO", "Caj", "Ord", "Pes", "Vta"}
+"""
+
+import io
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+HILOS_EXIF = 8
+
+# Tamaño en bytes de cada tipo TIFF
+TAMANO_TIPO_TIFF = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+TIPOS_TEXTO = (1, 2, 7)  # BYTE, ASCII, UNDEFINED
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+
+
+# ------------------------
+# PAYLOAD OPMM
+# ------------------------
+def get_metadatos(metadatos_raw):
+    metadatos = {}
+    for item in metadatos_raw.split("*"):
+        if ":" in item:
+            key, value = item.split(":")
+            metadatos[key.replace('\x00', '')] = value.replace('\x00', '')
+    return metadatos
+
+
+def cumple_criterios(metadatos):
+    return (
+        metadatos.get("FAO") == "ARA" and
+        metadatos.get("Caj") == "001" and
+        (metadatos.get("Ord") == "1" or "Ord" not in metadatos)
+    )
+
+
+def normalizar_valor(valor):
+    return valor.replace(",", ".").strip()
+
+
+# ------------------------
+# CABECERA JPEG / TIFF
+# ------------------------
+def leer_segmento_app1(f):
+    """
+    Recorre los marcadores JPEG de `f` (fichero binario) hasta encontrar el
+    APP1 'Exif'. Devuelve el bloque TIFF o None si se llega a los datos de
+    imagen (SOS) sin encontrarlo.
+    """
+    if f.read(2) != b"\xff\xd8":
+        raise ValueError("no es un JPEG")
+
+    while True:
+        marcador = f.read(2)
+        if len(marcador) < 2 or marcador[0] != 0xFF:
+            return None
+        tipo = marcador[1]
+        if tipo == 0xFF:  # relleno
+            f.seek(-1, io.SEEK_CUR)
+            continue
+        if tipo in (0xD9, 0xDA):  # EOI / SOS
+            return None
+        if 0xD0 <= tipo <= 0xD7 or tipo == 0x01:  # marcadores sin longitud
+            continue
+
+        longitud = struct.unpack(">H", f.read(2))[0]
+        if tipo == 0xE1:
+            datos = f.read(longitud - 2)
+            if datos.startswith(b"Exif\x00\x00"):
+                return datos[6:]
+        else:
+            f.seek(longitud - 2, io.SEEK_CUR)
+
+
+def valores_texto_tiff(tiff):
+    """Devuelve los valores BYTE/ASCII/UNDEFINED de IFD0, Exif IFD y GPS IFD."""
+    orden = "<" if tiff[:2] == b"II" else ">"
+    valores = []
+    pendientes = [struct.unpack(orden + "I", tiff[4:8])[0]]
+    visitados = set()
+
+    while pendientes:
+        offset = pendientes.pop(0)
+        if offset in visitados or offset + 2 > len(tiff):
+            continue
+        visitados.add(offset)
+
+        n_entradas = struct.unpack(orden + "H", tiff[offset:offset + 2])[0]
+        for i in range(n_entradas):
+            inicio = offset + 2 + 12 * i
+            entrada = tiff[inicio:inicio + 12]
+            if len(entrada) < 12:
+                break
+            tag, tipo, cuenta = struct.unpack(orden + "HHI", entrada[:8])
+
+            if tag in (TAG_EXIF_IFD, TAG_GPS_IFD):
+                pendientes.append(struct.unpack(orden + "I", entrada[8:12])[0])
+            elif tipo in TIPOS_TEXTO:
+                tamano = TAMANO_TIPO_TIFF[tipo] * cuenta
+                if tamano <= 4:
+                    valores.append(entrada[8:8 + tamano])
+                else:
+                    desde = struct.unpack(orden + "I", entrada[8:12])[0]
+                    valores.append(tiff[desde:desde + tamano])
+    return valores
+
+
+def valores_texto_pil(fuente):
+    """Alternativa para imágenes que no son JPEG: EXIF vía PIL (sin decodificar píxeles)."""
+    from PIL import Image
+
+    with Image.open(fuente) as img:
+        exifdata = img._getexif() if hasattr(img, "_getexif") else None
+    if not exifdata:
+        return []
+    return [v if isinstance(v, bytes) else str(v).encode("utf-8") for v in exifdata.values()]
+
+
+# ------------------------
+# ESCANER
+# ------------------------
+def escanear_imagen(fuente, filename=None):
+    """
+    Lee los metadatos OPMM de una imagen. `fuente` puede ser una ruta, unos
+    bytes o un fichero en memoria. Devuelve el registro compacto o None si la
+    imagen no tiene EXIF.
+    """
+    if filename is None:
+        filename = os.path.basename(fuente) if isinstance(fuente, str) else ""
+
+    if isinstance(fuente, (bytes, bytearray)):
+        fuente = io.BytesIO(fuente)
+
+    if isinstance(fuente, str):
+        with open(fuente, "rb") as f:
+            try:
+                tiff = leer_segmento_app1(f)
+                valores = valores_texto_tiff(tiff) if tiff else []
+            except ValueError:
+                valores = valores_texto_pil(fuente)
+    else:
+        posicion = fuente.tell()
+        try:
+            tiff = leer_segmento_app1(fuente)
+            valores = valores_texto_tiff(tiff) if tiff else []
+        except ValueError:
+            fuente.seek(posicion)
+            valores = valores_texto_pil(fuente)
+        fuente.seek(posicion)
+
+    if not valores:
+        return None
+
+    # Payload que cumple los criterios; si ninguno lo hace, el primero con FAO
+    elegido = None
+    for valor in valores:
+        metadatos = get_metadatos(valor.decode("utf-8", errors="ignore"))
+        metadatos.setdefault("Ord", "None")
+        if cumple_criterios(metadatos):
+            elegido = metadatos
+            break
+        if elegido is None and "FAO" in metadatos:
+            elegido = metadatos
+    elegido = elegido or {}
+
+    return {
+        "Imagen": filename,
+        "FAO": elegido.get("FAO"),
+        "Caj": elegido.get("Caj"),
+        "Ord": elegido.get("Ord"),
+        "Pes": normalizar_valor(elegido.get("Pes", "N/A")),
+        "Vta": normalizar_valor(elegido.get("Vta", "N/A")),
+    }
+
+
+def es_seleccionable(registro):
+    return registro is not None and cumple_criterios(registro)
+
+
+def escanear_imagen_seguro(fuente, filename):
+    """Como escanear_imagen, pero informa de los errores y de la falta de EXIF en vez de lanzar."""
+    try:
+        registro = escanear_imagen(fuente, filename)
+    except Exception as e:
+        print(f"Error procesando imagen: {filename} -> {e}")
+        return None
+    if registro is None:
+        print(f"No hay EXIF en {filename}; se salta")
+    return registro
+
+
+def escanear_imagenes(items, hilos=HILOS_EXIF):
+    """
+    Escanea en paralelo una lista de (fuente, filename) y devuelve los registros
+    en el mismo orden (None para las imágenes sin EXIF o ilegibles).
+    """
+    items = list(items)
+    if hilos <= 1 or len(items) <= 1:
+        return [escanear_imagen_seguro(fuente, filename) for fuente, filename in items]
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        return list(pool.map(lambda item: escanear_imagen_seguro(*item), items))
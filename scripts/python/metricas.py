@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+Métricas de rendimiento comunes a las etapas Python (1-4b y lectura de .mdb).
+
+Cada etapa envuelve su main en `with Metricas("<etapa>"):` y, donde haga falta,
+llama a las funciones del módulo:
+
+    contar("imagenes_inferidas", n)          # contadores
+    observar("inferencia_imagen", segundos)  # latencias por elemento (histograma)
+    with medir("fecha"): ...                 # observar() del tiempo de un bloque
+
+Al salir se añade una línea JSON al fichero de métricas de la ejecución con el
+tiempo real y de CPU (incluidos los procesos hijos ya terminados), el pico de
+memoria residente, los contadores y el resumen de cada histograma.
+
+El fichero es REMAR_METRICAS si está definida (pipeline.py la fija a
+LOGS_DIR/metricas_<marca>.jsonl para que todas las etapas de una ejecución
+escriban en el mismo) o logs/metricas_<marca>_<etapa>.jsonl si se lanza la
+etapa suelta.
+
+Los workers de un ProcessPoolExecutor acumulan en su propio registro: la
+función del worker devuelve extraer() con su resultado y el proceso principal
+lo suma con combinar().
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import datetime
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # opcional: solo se usa para el pico de memoria en Windows
+    psutil = None
+
+LOGS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "logs"))
+
+# Límites superiores (s) de los cubos de los histogramas; el último recoge el resto
+CUBOS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, 300]
+
+_lock = threading.Lock()
+_contadores = {}
+_latencias = {}
+
+
+# ------------------------
+# REGISTRO DEL PROCESO
+# ------------------------
+def contar(nombre, n=1):
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + n
+
+
+def observar(nombre, segundos, n=1):
+    """Añade una latencia al histograma `nombre`; n > 1 la cuenta para n elementos (p. ej. media de un lote)."""
+    with _lock:
+        _latencias.setdefault(nombre, []).extend([segundos] * n)
+
+
+@contextmanager
+def medir(nombre):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - t0)
+
+
+def extraer():
+    """Devuelve lo acumulado en este proceso y lo vacía (para devolverlo desde un worker)."""
+    with _lock:
+        datos = {"contadores": dict(_contadores), "latencias": {k: list(v) for k, v in _latencias.items()}}
+        _contadores.clear()
+        _latencias.clear()
+    return datos
+
+
+def combinar(datos):
+    """Suma al registro de este proceso lo devuelto por extraer() en otro."""
+    if not datos:
+        return
+    with _lock:
+        for nombre, n in datos.get("contadores", {}).items():
+            _contadores[nombre] = _contadores.get(nombre, 0) + n
+        for nombre, valores in datos.get("latencias", {}).items():
+            _latencias.setdefault(nombre, []).extend(valores)
+
+
+# ------------------------
+# RESÚMENES
+# ------------------------
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumen_histograma(valores):
+    ordenados = sorted(valores)
+    cubos = {}
+    i = 0
+    for limite in CUBOS:
+        n = 0
+        while i < len(ordenados) and ordenados[i] <= limite:
+            n += 1
+            i += 1
+        cubos[f"<={limite}"] = n
+    cubos[f">{CUBOS[-1]}"] = len(ordenados) - i
+    total = sum(ordenados)
+    return {
+        "n": len(ordenados),
+        "total_s": round(total, 6),
+        "media_s": round(total / len(ordenados), 6) if ordenados else None,
+        "p50_s": percentil(ordenados, 50),
+        "p95_s": percentil(ordenados, 95),
+        "max_s": ordenados[-1] if ordenados else None,
+        "cubos": cubos,
+    }
+
+
+def rss_pico_mb(hijos=False):
+    """Pico de memoria residente del proceso (o del mayor hijo terminado), en MB; None si no se puede medir."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_CHILDREN if hijos else resource.RUSAGE_SELF).ru_maxrss
+        # Linux da KB y macOS bytes
+        return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None and not hijos:
+        memoria = psutil.Process().memory_info()
+        return round(getattr(memoria, "peak_wset", memoria.rss) / (1024 * 1024), 1)
+    return None
+
+
+def tiempo_cpu():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+# ------------------------
+# MÉTRICAS DE UNA ETAPA
+# ------------------------
+class Metricas:
+    """Context manager que mide una etapa completa y escribe su línea de métricas al terminar."""
+
+    def __init__(self, etapa, ruta=None, **extra):
+        self.etapa = etapa
+        self.marca = os.environ.get("REMAR_EJECUCION") or datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.ruta = ruta or os.environ.get("REMAR_METRICAS") or os.path.join(
+            LOGS_DIR, f"metricas_{self.marca}_{etapa}.jsonl")
+        self.extra = extra
+
+    def __enter__(self):
+        extraer()  # empezar de cero
+        self.inicio = datetime.datetime.now()
+        self.t0 = time.perf_counter()
+        self.cpu0 = tiempo_cpu()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        registro = {
+            "ejecucion": self.marca,
+            "etapa": self.etapa,
+            "estado": "ok" if tipo is None else "error",
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "fin": datetime.datetime.now().isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self.t0, 3),
+            "cpu_s": round(tiempo_cpu() - self.cpu0, 3),
+            "rss_pico_mb": rss_pico_mb(),
+            "rss_pico_hijos_mb": rss_pico_mb(hijos=True),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            **self.extra,
+        }
+        datos = extraer()
+        registro["contadores"] = datos["contadores"]
+        registro["latencias"] = {k: resumen_histograma(v) for k, v in sorted(datos["latencias"].items())}
+        if tipo is not None:
+            registro["error"] = f"{tipo.__name__}: {valor}"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"[WARN] No se pudieron guardar las métricas en {self.ruta}: {e}")
+        return False
+
+
+def leer_metricas(rutas):
+    """Registros de uno o varios ficheros .jsonl de métricas (las líneas ilegibles se ignoran)."""
+    registros = []
+    for ruta in rutas:
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        registros.append(json.loads(linea))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return registros
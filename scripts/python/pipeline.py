@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+"""
+Orquestador del pipeline REMAR (sustituye a la secuencia fija de run_job.sh).
+
+Cada etapa declara su comando, las etapas de las que depende y sus entradas y
+salidas (ficheros, carpetas o patrones glob). En cada ejecución:
+  - una etapa se salta si la huella de sus entradas (y de su propio script) es
+    la misma que en su última ejecución correcta y sus salidas siguen ahí;
+  - las ramas independientes se lanzan a la vez: la cadena de esfuerzo (R)
+    junto a la de gamba (Python, solo con --gamba), y los SSM de jonquillera
+    y tresmall entre sí;
+  - si una etapa falla, las que dependen de ella no se lanzan, pero el resto
+    de ramas sigue.
+
+Salidas en LOGS_DIR:
+  - pipeline_<marca>.log: log principal ([INFO]/[ERROR] por etapa)
+  - pipeline_<marca>/<etapa>.log: stdout y stderr de cada etapa
+  - tiempos_pipeline.csv: una fila por etapa y ejecución (estado, inicio, fin, segundos)
+  - estado_pipeline.json: huellas de las entradas de la última ejecución correcta
+  - metricas_<marca>.jsonl: métricas de las etapas Python (ver metricas.py)
+"""
+
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+import datetime
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+from catalogo import huella, cargar_catalogo, guardar_catalogo, registrar
+
+# ------------------------
+# CONFIGURACIÓN
+# ------------------------
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+PYTHON_DIR = os.path.join(REPO_DIR, "scripts", "python")
+R_DIR = os.path.join(REPO_DIR, "scripts", "r", "SSM")
+ENV_FILE = os.path.expanduser("~/REMAR-automatizacion/config/.env")  # el mismo que cargan los scripts R
+
+# Carpeta de los scripts de gamba. Los scripts 1-4b usan sus propias rutas fijas (ignoran
+# GAMBA_DIR): la rama de gamba solo se lanza con --gamba, en el equipo donde existen esas rutas
+GAMBA_DIR_DEFECTO = r"C:\Users\UIB\Desktop\REMAR-automatizacion"
+
+ESTADOS_OK = ("ok", "sin cambios")
+
+# siempre: se lanza aunque sus entradas no hayan cambiado
+# tolerante: se lanza aunque falle alguna de las etapas de las que depende
+Etapa = namedtuple("Etapa", ["nombre", "comando", "depende", "entradas", "salidas", "siempre", "tolerante"],
+                   defaults=(False, False))
+
+
+def parser_arguments():
+    parser = argparse.ArgumentParser(description="Ejecuta las etapas del pipeline REMAR")
+    parser.add_argument('--etapas', nargs="+", default=None,
+                        help="Ejecuta solo estas etapas (sus dependencias no se lanzan)")
+    parser.add_argument('--force', action="store_true", default=False,
+                        help="Ejecuta todas las etapas aunque sus entradas no hayan cambiado")
+    parser.add_argument('--paralelo', type=int, default=2,
+                        help="Número máximo de etapas ejecutándose a la vez")
+    parser.add_argument('--listar', action="store_true", default=False,
+                        help="Muestra las etapas con sus dependencias, entradas y salidas y termina")
+    parser.add_argument('--gamba', action="store_true", default=False,
+                        help="Añade la cadena de gamba (g1-g4b). Sus scripts usan rutas fijas de Windows; "
+                             "no usar a la vez que 1_inference_gamba_args.py --vigilar, que ya la ejecuta")
+    parser.add_argument('--env', default=ENV_FILE,
+                        help="Fichero .env con las carpetas de los scripts R")
+    return parser.parse_args()
+
+
+# ------------------------
+# RUTAS
+# ------------------------
+def leer_env(ruta):
+    """Carga el .env (como envio_logs.py) sin pisar el entorno ya definido."""
+    if not os.path.isfile(ruta):
+        print(f"[WARN] No existe {ruta}; se usan las variables de entorno actuales.")
+        return
+    load_dotenv(dotenv_path=ruta, override=False)
+
+
+def carpeta_env(clave, defecto):
+    """Carpeta de una variable del .env; las relativas lo son a WORKING_DIR, como en los scripts R."""
+    base = os.path.expanduser(os.environ.get("WORKING_DIR", REPO_DIR))
+    valor = os.path.expanduser(os.environ.get(clave) or defecto)
+    return os.path.normpath(os.path.join(base, valor))
+
+
+def definir_etapas(gamba_activa=False):
+    """Etapas del pipeline con sus comandos, dependencias, entradas y salidas (gamba solo con --gamba)."""
+    python = sys.executable
+    gamba = os.environ.get("GAMBA_DIR", GAMBA_DIR_DEFECTO)
+    ventas_csv = os.path.join(REPO_DIR, "data", "ventaslonja")
+    input_dir = carpeta_env("INPUT_DIR", ventas_csv)
+    results_dir = carpeta_env("results_dir", "results")
+    rdata_dir = carpeta_env("RDATA_DIR", "data/rdata")
+    reference_dir = carpeta_env("REFERENCE_DIR", "data/reference")
+    tracks_dir = carpeta_env("TRACKS_DIR", "data/tracks")
+    shp_dir = carpeta_env("SHP_DIR", "data/shp")
+    models_dir = carpeta_env("MODELS_DIR", "models")
+    processed_dir = carpeta_env("PROCESSED_DIR", "data/processed")
+
+    def script_r(nombre):
+        return ["Rscript", os.path.join(R_DIR, nombre)]
+
+    def script_py(nombre):
+        return [python, os.path.join(PYTHON_DIR, nombre)]
+
+    def ssm(metier):
+        return Etapa(f"05_ssm_{metier}", script_r(f"05_SSM_{metier}.R"), ["04_ssm_input"],
+                     entradas=[os.path.join(results_dir, f"input_{metier}.RData"),
+                               os.path.join(models_dir, f"model_{metier}.stan"),
+                               os.path.join(rdata_dir, f"priors_modelo_{metier}.RData"),
+                               os.path.join(shp_dir, "P_units_REMAR.shp")],
+                     salidas=[os.path.join(results_dir, f"final_SSM_{metier}_*.RData")])
+
+    etapas = [
+        # --- Cadena de esfuerzo (ventas + tracks -> SSM)
+        Etapa("00_mdb_a_csv", script_py("read_mdb_files.py"), [],
+              entradas=[os.path.join(REPO_DIR, "data", "raw_data")],
+              salidas=[ventas_csv, os.path.join(REPO_DIR, "data", "ventaslonja_parquet")]),
+        Etapa("01_limpieza", script_r("01_data_cleaning_mallorca.R"), ["00_mdb_a_csv"],
+              entradas=[input_dir, os.path.join(reference_dir, "boats.csv"), os.path.join(reference_dir, "sp.csv")],
+              salidas=[os.path.join(results_dir, "sample.RData"),
+                       os.path.join(processed_dir, "DATA_daily.csv")]),
+        Etapa("02_metier", script_r("02_module_metiere_classification.R"), ["01_limpieza"],
+              entradas=[os.path.join(results_dir, "sample.RData"), os.path.join(rdata_dir, "classificadors.RData")],
+              salidas=[os.path.join(results_dir, "predicted.RData")]),
+        Etapa("03_tracks", script_r("03_link_predicted_cajasverdes.R"), ["02_metier"],
+              entradas=[os.path.join(results_dir, "predicted.RData"), os.path.join(tracks_dir, "*.csv"),
+                        os.path.join(shp_dir, "BufferPuertos.shp"), os.path.join(shp_dir, "TierraMenos50m_4326.shp"),
+                        os.path.join(reference_dir, "boats.csv")],
+              salidas=[os.path.join(results_dir, "raw_*_tracks.RData")]),
+        Etapa("04_ssm_input", script_r("04_SSM_input.R"), ["03_tracks"],
+              entradas=[os.path.join(results_dir, "raw_jonquillera_tracks.RData"),
+                        os.path.join(results_dir, "raw_tresmall_tracks.RData"),
+                        os.path.join(shp_dir, "Morunas.shp")],
+              salidas=[os.path.join(results_dir, "input_jonquillera.RData"),
+                       os.path.join(results_dir, "input_tresmall.RData")]),
+        ssm("jonquillera"),
+        ssm("tresmall"),
+    ]
+    if gamba_activa:
+        etapas += [
+            # --- Cadena de gamba (imágenes + lonja -> DATOS_GAMBA)
+            Etapa("g1_inferencia", script_py("1_inference_gamba_args.py"), [],
+                  entradas=[os.path.join(gamba, "data", "img_lonja", "OPMM_Subasta_*.7z"),
+                            os.path.join(PYTHON_DIR, "best.pt")],
+                  salidas=[os.path.join(gamba, "INFERENCE", "resultados_metadatos.txt")]),
+            Etapa("g2_areas", script_py("2_calcular_areas_segmentos_gamba.py"), ["g1_inferencia"],
+                  entradas=[os.path.join(gamba, "INFERENCE")],
+                  salidas=[os.path.join(gamba, "AREAS")]),
+            Etapa("g3_peso", script_py("3_calculo_peso_medio_num_gamba.py"), ["g2_areas"],
+                  entradas=[os.path.join(gamba, "AREAS"), os.path.join(gamba, "INFERENCE", "resultados_metadatos.txt")],
+                  salidas=[os.path.join(gamba, "RESULTS", "resultados_procesados_*.csv")]),
+            # 4a escribe en el mismo dataset de lonja que 00_mdb_a_csv: va después para no pisarse
+            # (y solo vuelca lo que 00 no haya convertido ya)
+            Etapa("g4a_lonja", script_py("4a_convierte_mdb_a_csv.py"), ["00_mdb_a_csv"],
+                  entradas=[os.path.join(gamba, "data", "raw_data")],
+                  salidas=[os.path.join(gamba, "data", "ventaslonja_parquet")]),
+            Etapa("g4b_combina", script_py("4b_combina_lonja_imagen.py"), ["g3_peso", "g4a_lonja"],
+                  entradas=[os.path.join(gamba, "RESULTS", "resultados_procesados_*.csv"),
+                            os.path.join(gamba, "data", "ventaslonja_parquet")],
+                  salidas=[os.path.join(gamba, "RESULTS", "DATOS_GAMBA")]),
+        ]
+    # --- Informe diario: al final de todo (incluye las métricas de la ejecución) y se envía
+    # siempre, aunque haya fallado alguna etapa
+    etapas.append(Etapa("envio_logs", script_py("envio_logs.py"), [e.nombre for e in etapas],
+                        entradas=[], salidas=[], siempre=True, tolerante=True))
+    return etapas
+
+
+# ------------------------
+# HUELLAS DE ENTRADA
+# ------------------------
+def ficheros_de(ruta):
+    """Ficheros que cubre una entrada declarada: un fichero, una carpeta (recursiva) o un patrón glob."""
+    if os.path.isdir(ruta):
+        encontrados = []
+        for raiz, dirs, ficheros in os.walk(ruta):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            encontrados.extend(os.path.join(raiz, f) for f in ficheros if not f.startswith("."))
+        return encontrados
+    if glob.has_magic(ruta):
+        return [f for f in glob.glob(ruta) if os.path.isfile(f)]
+    return [ruta] if os.path.isfile(ruta) else []
+
+
+def huellas_entradas(etapa, previas):
+    """
+    Huella de cada fichero de entrada de la etapa, incluido su script. Si tamaño
+    y mtime coinciden con la huella previa se reutiliza sin volver a leer el fichero.
+    """
+    rutas = {os.path.abspath(f) for ruta in etapa.entradas for f in ficheros_de(ruta)}
+    rutas.add(os.path.abspath(etapa.comando[-1]))
+    huellas = {}
+    for ruta in sorted(rutas):
+        if not os.path.isfile(ruta):
+            continue
+        previa = previas.get(ruta)
+        st = os.stat(ruta)
+        if previa and previa["tamano"] == st.st_size and previa["mtime"] == st.st_mtime:
+            huellas[ruta] = previa
+        else:
+            huellas[ruta] = huella(ruta)
+    return huellas
+
+
+def mismas_huellas(actuales, previas):
+    if set(actuales) != set(previas):
+        return False
+    return all(h["sha256"] == previas[r]["sha256"] for r, h in actuales.items())
+
+
+def salidas_presentes(etapa):
+    for ruta in etapa.salidas:
+        if glob.has_magic(ruta):
+            if not glob.glob(ruta):
+                return False
+        elif not os.path.exists(ruta):
+            return False
+    return True
+
+
+def entradas_faltantes(etapa):
+    return [ruta for ruta in etapa.entradas if not ficheros_de(ruta)]
+
+
+# ------------------------
+# EJECUCIÓN
+# ------------------------
+class Pipeline:
+    def __init__(self, etapas, logs_dir, forzar=False, paralelo=2):
+        self.etapas = {e.nombre: e for e in etapas}
+        self.forzar = forzar
+        self.paralelo = max(1, paralelo)
+        self.marca = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.logs_dir = logs_dir
+        self.dir_etapas = os.path.join(logs_dir, f"pipeline_{self.marca}")
+        self.log_file = os.path.join(logs_dir, f"pipeline_{self.marca}.log")
+        self.tiempos_file = os.path.join(logs_dir, "tiempos_pipeline.csv")
+        self.estado_file = os.path.join(logs_dir, "estado_pipeline.json")
+        self.estado = cargar_catalogo(self.estado_file)
+        self.lock = threading.Lock()
+        # Las etapas Python escriben sus métricas (metricas.py) en un único fichero por ejecución
+        self.metricas_file = os.path.join(logs_dir, f"metricas_{self.marca}.jsonl")
+        self.entorno = {**os.environ, "REMAR_METRICAS": self.metricas_file, "REMAR_EJECUCION": self.marca}
+        os.makedirs(self.dir_etapas, exist_ok=True)
+
+    def log(self, nivel, mensaje):
+        linea = f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] [{nivel}] {mensaje}"
+        with self.lock:
+            print(linea, flush=True)
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+
+    def anotar_tiempo(self, nombre, estado, inicio, fin):
+        with self.lock:
+            nuevo = not os.path.isfile(self.tiempos_file)
+            with open(self.tiempos_file, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if nuevo:
+                    writer.writerow(["ejecucion", "etapa", "estado", "inicio", "fin", "segundos"])
+                writer.writerow([self.marca, nombre, estado,
+                                 datetime.datetime.fromtimestamp(inicio).isoformat(timespec="seconds"),
+                                 datetime.datetime.fromtimestamp(fin).isoformat(timespec="seconds"),
+                                 f"{fin - inicio:.1f}"])
+
+    def ejecutar_etapa(self, etapa):
+        """Lanza una etapa (o la salta si no ha cambiado nada). Devuelve su estado final."""
+        inicio = time.time()
+        previas = self.estado.get(etapa.nombre, {}).get("entradas", {})
+        huellas = huellas_entradas(etapa, previas)
+
+        faltan = entradas_faltantes(etapa)
+        if faltan:
+            self.log("WARN", f"{etapa.nombre}: no se encuentran entradas: {', '.join(faltan)}")
+
+        if (not self.forzar and not etapa.siempre and etapa.nombre in self.estado
+                and mismas_huellas(huellas, previas) and salidas_presentes(etapa)):
+            self.log("INFO", f"{etapa.nombre}: entradas sin cambios, se salta")
+            self.anotar_tiempo(etapa.nombre, "sin cambios", inicio, time.time())
+            return "sin cambios"
+
+        self.log("INFO", f"Inicio: {etapa.nombre} ({' '.join(etapa.comando)})")
+        log_etapa = os.path.join(self.dir_etapas, f"{etapa.nombre}.log")
+        try:
+            with open(log_etapa, "w", encoding="utf-8") as salida:
+                proceso = subprocess.run(etapa.comando, cwd=os.path.dirname(etapa.comando[-1]),
+                                         stdout=salida, stderr=subprocess.STDOUT, env=self.entorno)
+            correcto = proceso.returncode == 0
+            detalle = f"código {proceso.returncode}"
+        except OSError as e:
+            correcto = False
+            detalle = str(e)
+        fin = time.time()
+
+        if not correcto:
+            self.log("ERROR", f"Fallo: {etapa.nombre} ({detalle}, {fin - inicio:.1f} s); ver {log_etapa}")
+            self.anotar_tiempo(etapa.nombre, "error", inicio, fin)
+            return "error"
+
+        self.log("INFO", f"Completada: {etapa.nombre} ({fin - inicio:.1f} s)")
+        self.anotar_tiempo(etapa.nombre, "ok", inicio, fin)
+        with self.lock:
+            # Se guardan las huellas tomadas antes de lanzarla: si una entrada
+            # cambió durante la ejecución, la próxima vez se vuelve a lanzar.
+            registrar(self.estado, etapa.nombre, {"entradas": huellas}, segundos=round(fin - inicio, 1))
+            guardar_catalogo(self.estado, self.estado_file)
+        return "ok"
+
+    def ejecutar(self, seleccion=None):
+        """
+        Lanza las etapas en cuanto terminan sus dependencias, hasta `paralelo` a
+        la vez. Con `seleccion` solo se ejecutan esas etapas y sus dependencias
+        fuera de la selección se dan por satisfechas. Devuelve {etapa: estado}.
+        """
+        pendientes = [n for n in self.etapas if seleccion is None or n in seleccion]
+        resultados = {}
+        en_marcha = {}
+        self.log("INFO", f"REMAR pipeline iniciado: {len(pendientes)} etapas")
+
+        with ThreadPoolExecutor(max_workers=self.paralelo) as executor:
+            while pendientes or en_marcha:
+                avance = False
+                for nombre in list(pendientes):
+                    etapa = self.etapas[nombre]
+                    deps = [d for d in etapa.depende if d in pendientes or d in en_marcha.values()
+                            or d in resultados]
+                    if any(d not in resultados for d in deps):
+                        continue
+                    pendientes.remove(nombre)
+                    avance = True
+                    fallidas = [d for d in deps if resultados[d] not in ESTADOS_OK]
+                    if fallidas and not etapa.tolerante:
+                        self.log("ERROR", f"{nombre}: no se lanza porque falló {', '.join(fallidas)}")
+                        resultados[nombre] = "omitida"
+                        self.anotar_tiempo(nombre, "omitida", time.time(), time.time())
+                        continue
+                    en_marcha[executor.submit(self.ejecutar_etapa, etapa)] = nombre
+
+                if not en_marcha:
+                    if pendientes and not avance:
+                        raise RuntimeError(f"Dependencias circulares entre: {', '.join(pendientes)}")
+                    continue
+                terminadas, _ = wait(en_marcha, return_when=FIRST_COMPLETED)
+                for futuro in terminadas:
+                    nombre = en_marcha.pop(futuro)
+                    try:
+                        resultados[nombre] = futuro.result()
+                    except Exception as e:
+                        self.log("ERROR", f"{nombre}: error inesperado del orquestador: {e}")
+                        resultados[nombre] = "error"
+
+        fallos = [n for n, r in resultados.items() if r not in ESTADOS_OK]
+        if fallos:
+            self.log("ERROR", f"REMAR pipeline terminado con fallos en: {', '.join(fallos)}")
+        else:
+            self.log("INFO", "REMAR pipeline completado correctamente.")
+        return resultados
+
+
+def listar(etapas):
+    for etapa in etapas:
+        print(f"{etapa.nombre}")
+        print(f"  comando:  {' '.join(etapa.comando)}")
+        print(f"  depende:  {', '.join(etapa.depende) or '-'}")
+        for ruta in etapa.entradas:
+            print(f"  entrada:  {ruta}")
+        for ruta in etapa.salidas:
+            print(f"  salida:   {ruta}")
+
+
+def main():
+    args = parser_arguments()
+    leer_env(args.env)
+    etapas = definir_etapas(args.gamba)
+
+    if args.listar:
+        listar(etapas)
+        return 0
+
+    nombres = [e.nombre for e in etapas]
+    if args.etapas:
+        desconocidas = [n for n in args.etapas if n not in nombres]
+        if desconocidas:
+            print(f"[ERROR] Etapas desconocidas: {', '.join(desconocidas)}. Disponibles: {', '.join(nombres)}"
+                  + ("" if args.gamba else " (las de gamba, g1-g4b, solo con --gamba)"))
+            return 2
+
+    logs_dir = carpeta_env("LOGS_DIR", "logs")
+    pipeline = Pipeline(etapas, logs_dir, forzar=args.force, paralelo=args.paralelo)
+    resultados = pipeline.ejecutar(set(args.etapas) if args.etapas else None)
+    return 0 if all(r in ESTADOS_OK for r in resultados.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
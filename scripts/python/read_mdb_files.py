@@ -8,15 +8,38 @@ Script 1/6 - Reading .mdb auction data and converting to CSV
 
 import os
 import re
+import csv
 import time
+import sqlite3
+import argparse
 import warnings
 import logging
 import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from pathlib import Path
 
-import pyodbc
 import pandas as pd
 
+from catalogo import huella, sin_cambios, cargar_catalogo, guardar_catalogo, registrar
+from lonja_parquet import (pa, EscritorParticiones, nombre_origen, cargar_catalogo_lonja, guardar_catalogo_lonja,
+                           origen_vigente, registrar_origen, quitar_origenes_desaparecidos)
+from metricas import Metricas, contar, observar
+
+try:
+    import pyodbc
+except ImportError:  # solo hace falta para el backend "access" (Windows + Access driver)
+    pyodbc = None
+
+
+# Formato de FECHA en los CSV (el que espera 01_data_cleaning_mallorca.R). Se fija
+# explícitamente porque al escribir por trozos pandas podría omitir la hora en un
+# trozo donde todas las horas fueran 00:00:00.
+FECHA_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_CHUNKSIZE = 50000
+DEFAULT_MAX_CONNECTIONS = 4
+
 
 # -----------------------------
 # Logging
@@ -48,11 +71,11 @@ def setup_logging(log_path="../../logs/mdb_processing.log"):
 # -----------------------------
 # Utilidades MDB
 # -----------------------------
-def get_mdb_files(directory):
+def get_mdb_files(directory, extensions=(".mdb",)):
     mdb_files = []
     for root, _, files in os.walk(directory):
         for filename in files:
-            if filename.lower().endswith(".mdb"):
+            if filename.lower().endswith(extensions):
                 mdb_files.append(os.path.join(root, filename))
     return mdb_files
 
@@ -84,6 +107,9 @@ def filter_files_by_date(mdb_files, days_back=30):
 
 
 def check_access_driver(required="Microsoft Access Driver (*.mdb, *.accdb)"):
+    if pyodbc is None:
+        logging.error("pyodbc is not installed; the 'access' backend is not available.")
+        return False
     drivers = [d.strip() for d in pyodbc.drivers()]
     logging.info(f"Available ODBC drivers: {drivers}")
     if required not in drivers:
@@ -95,15 +121,15 @@ def check_access_driver(required="Microsoft Access Driver (*.mdb, *.accdb)"):
     return True
 
 
-def connect_with_retry(conn_str, retries=3, wait_s=2):
+def connect_with_retry(connect, path, retries=3, wait_s=2):
     last_exc = None
     for i in range(1, retries + 1):
         try:
-            conn = pyodbc.connect(conn_str)
+            conn = connect(path)
             return conn
-        except pyodbc.Error as e:
+        except CONNECT_ERRORS as e:
             last_exc = e
-            logging.warning(f"ODBC connect attempt {i}/{retries} failed: {e}")
+            logging.warning(f"Connect attempt {i}/{retries} failed: {e}")
             time.sleep(wait_s)
         except Exception as e:
             last_exc = e
@@ -115,16 +141,13 @@ def connect_with_retry(conn_str, retries=3, wait_s=2):
     return None
 
 
-def find_table_name(conn, preferred="DATOS"):
+def find_table_name(conn, preferred="DATOS", list_tables=None):
     """
     Busca 'DATOS' o una variante (mayúsculas/minúsculas, posibles comillas)
     """
+    list_tables = list_tables or list_tables_odbc
     try:
-        cursor = conn.cursor()
-        # cat=None, schem=None, table=None, tableType='TABLE'
-        tables = list(cursor.tables(tableType="TABLE"))
-        cursor.close()
-        names = [t.table_name for t in tables]
+        names = list_tables(conn)
         logging.info(f"Tables found in MDB: {names}")
 
         # Coincidencia exacta insensible a mayúsculas
@@ -145,117 +168,368 @@ def find_table_name(conn, preferred="DATOS"):
         return None
 
 
-def process_mdb_files(mdb_files, output_dir):
-    output_dir = os.path.abspath(output_dir)
-    os.makedirs(output_dir, exist_ok=True)
+# -----------------------------
+# Backends
+# -----------------------------
+def connect_access(path):
+    conn_str = (
+        r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};"
+        f"DBQ={path}"
+    )
+    return pyodbc.connect(conn_str)
 
-    if not check_access_driver():
-        logging.error("Required ODBC driver missing. Aborting processing.")
-        return
 
-    for file in mdb_files:
-        abs_file = os.path.abspath(file)
-        if not os.path.isfile(abs_file):
-            logging.error(f"File does not exist: {abs_file}")
-            continue
+def list_tables_odbc(conn):
+    cursor = conn.cursor()
+    # cat=None, schem=None, table=None, tableType='TABLE'
+    tables = list(cursor.tables(tableType="TABLE"))
+    cursor.close()
+    return [t.table_name for t in tables]
 
-        logging.info(f"Processing file: {abs_file}")
 
-        conn_str = (
-            r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};"
-            f"DBQ={abs_file}"
-        )
+def connect_sqlite(path):
+    # check_same_thread=False: la conexión se abre y se usa en el mismo hilo del pool,
+    # pero así no depende de en qué hilo se cierre
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
 
-        conn = connect_with_retry(conn_str, retries=3, wait_s=2)
-        if conn is None:
-            # Ya se loggeó el error en connect_with_retry
-            continue
 
+def list_tables_sqlite(conn):
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return names
+
+
+# Un backend sabe comprobar que está disponible, conectar con un archivo y listar
+# sus tablas. "sqlite" es un sustituto local (mismas tablas y columnas que el MDB
+# guardadas en SQLite) para ejecutar el proceso en Linux sin el driver de Access.
+Backend = namedtuple("Backend", ["name", "check", "connect", "list_tables", "extensions"])
+
+BACKENDS = {
+    "access": Backend("access", check_access_driver, connect_access, list_tables_odbc, (".mdb",)),
+    "sqlite": Backend("sqlite", lambda: True, connect_sqlite, list_tables_sqlite, (".mdb", ".sqlite", ".db")),
+}
+
+CONNECT_ERRORS = (sqlite3.Error,) + ((pyodbc.Error,) if pyodbc is not None else ())
+
+
+# -----------------------------
+# Conversión
+# -----------------------------
+def output_csv_name(abs_file):
+    """Nombre del CSV de salida a partir de la fecha en el nombre del archivo."""
+    basename = os.path.splitext(os.path.basename(abs_file))[0]
+    match = re.search(r"(\d{2}-\d{2}-\d{4})", basename)
+    if match:
+        date_str = match.group(0)
         try:
-            table_name = find_table_name(conn, preferred="DATOS")
-            if not table_name:
-                conn.close()
+            date_obj = datetime.strptime(date_str, "%d-%m-%Y")
+            date_fmt = date_obj.strftime("%Y%m%d")
+            return f"IMEDEA_{date_fmt}_{date_fmt}.csv"
+        except Exception as e:
+            logging.warning(f"Bad date in filename '{basename}': {e}")
+            return basename + ".csv"
+    logging.warning(f"No date in filename. Using raw basename: {basename}")
+    return basename + ".csv"
+
+
+def stream_query(conn, query, output_csv=None, parquet_writer=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Lee la consulta por trozos (read_sql_query con chunksize) y los va
+    escribiendo en output_csv y/o en el dataset parquet (EscritorParticiones).
+    El CSV se escribe en un .tmp que se renombra al final, así un fallo a mitad
+    no deja un CSV incompleto (el escritor parquet hace lo mismo al cerrarse).
+    Devuelve (filas, trozos); si no hay filas no se crea el CSV.
+    """
+    tmp_csv = output_csv + ".tmp" if output_csv else None
+    rows, chunks = 0, 0
+    try:
+        for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+            if chunk.empty:
                 continue
+            # Normalización de FECHA (si existe)
+            if "FECHA" in chunk.columns:
+                try:
+                    chunk["FECHA"] = pd.to_datetime(chunk["FECHA"], errors="coerce")
+                except Exception as e:
+                    logging.warning(f"Error parsing FECHA in {output_csv}: {e}")
+            if tmp_csv:
+                chunk.to_csv(tmp_csv, mode="w" if chunks == 0 else "a", header=chunks == 0,
+                             index=False, date_format=FECHA_FORMAT)
+            if parquet_writer is not None:
+                parquet_writer.escribir(chunk)
+            rows += len(chunk)
+            chunks += 1
+    except Exception:
+        if tmp_csv and os.path.exists(tmp_csv):
+            os.remove(tmp_csv)
+        if parquet_writer is not None:
+            parquet_writer.descartar()
+        raise
 
-            query = f"SELECT * FROM [{table_name}]"
-            logging.info(f"Running query: {query}")
+    if rows and tmp_csv:
+        os.replace(tmp_csv, output_csv)
+    return rows, chunks
 
-            df = pd.read_sql_query(query, conn)
-            logging.info(f"Read {len(df)} rows from table '{table_name}'")
-        except Exception as e:
-            logging.error(f"Error reading table from {abs_file}: {e}")
-            logging.debug("Traceback:\n" + traceback.format_exc())
-            try:
-                conn.close()
-            except Exception:
-                pass
-            continue
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
-
-        if df.empty:
-            logging.warning(f"Empty table in {abs_file}. Skipping CSV export.")
-            continue
 
-        # Normalización de FECHA (si existe)
-        if "FECHA" in df.columns:
-            try:
-                df["FECHA"] = pd.to_datetime(df["FECHA"], errors="coerce")
-            except Exception as e:
-                logging.warning(f"Error parsing FECHA in {abs_file}: {e}")
-
-        # Construcción del nombre de salida a partir de la fecha en el nombre del archivo
-        basename = os.path.splitext(os.path.basename(abs_file))[0]
-        match = re.search(r"(\d{2}-\d{2}-\d{4})", basename)
-        if match:
-            date_str = match.group(0)
-            try:
-                date_obj = datetime.strptime(date_str, "%d-%m-%Y")
-                date_fmt = date_obj.strftime("%Y%m%d")
-                csv_filename = f"IMEDEA_{date_fmt}_{date_fmt}.csv"
-            except Exception as e:
-                logging.warning(f"Bad date in filename '{basename}': {e}")
-                csv_filename = basename + ".csv"
-        else:
-            logging.warning(f"No date in filename. Using raw basename: {basename}")
-            csv_filename = basename + ".csv"
+def process_mdb_file(abs_file, output_dir, backend, chunksize=DEFAULT_CHUNKSIZE, write_csv=True, parquet_dir=None):
+    """
+    Convierte un .mdb (tabla DATOS) a CSV y/o al dataset parquet particionado
+    por día (parquet_dir). Devuelve un resumen con el resultado, las filas
+    leídas y los tiempos de conexión y de lectura/escritura.
+    """
+    summary = {"file": abs_file, "output": "", "parquet": "", "status": "error", "rows": 0, "chunks": 0,
+               "connect_s": 0.0, "read_write_s": 0.0, "total_s": 0.0}
+    t0 = time.perf_counter()
+
+    if not os.path.isfile(abs_file):
+        logging.error(f"File does not exist: {abs_file}")
+        summary["status"] = "missing"
+        return summary
+
+    logging.info(f"Processing file: {abs_file}")
+
+    conn = connect_with_retry(backend.connect, abs_file, retries=3, wait_s=2)
+    t_connect = time.perf_counter()
+    summary["connect_s"] = round(t_connect - t0, 3)
+    if conn is None:
+        # Ya se loggeó el error en connect_with_retry
+        summary["total_s"] = summary["connect_s"]
+        return summary
+
+    output_csv = os.path.join(output_dir, output_csv_name(abs_file)) if write_csv else None
+    parquet_writer = EscritorParticiones(parquet_dir, nombre_origen(abs_file)) if parquet_dir else None
+    try:
+        table_name = find_table_name(conn, preferred="DATOS", list_tables=backend.list_tables)
+        if not table_name:
+            return summary
+
+        query = f"SELECT * FROM [{table_name}]"
+        logging.info(f"Running query: {query}")
 
-        output_csv = os.path.join(output_dir, csv_filename)
+        rows, chunks = stream_query(conn, query, output_csv, parquet_writer, chunksize)
+        summary.update(rows=rows, chunks=chunks)
+        logging.info(f"Read {rows} rows from table '{table_name}' ({chunks} chunks)")
+
+        if rows == 0:
+            logging.warning(f"Empty table in {abs_file}. Skipping export.")
+            summary["status"] = "empty"
+        else:
+            summary["status"] = "ok"
+            if output_csv:
+                logging.info(f"Created CSV: {output_csv}")
+                summary["output"] = output_csv
+            if parquet_writer is not None:
+                parquet_files = parquet_writer.cerrar()
+                logging.info(f"Wrote {len(parquet_files)} parquet partition files for {os.path.basename(abs_file)}")
+                summary["parquet"] = ";".join(parquet_files)
+    except Exception as e:
+        logging.error(f"Error reading table from {abs_file}: {e}")
+        logging.debug("Traceback:\n" + traceback.format_exc())
+    finally:
         try:
-            df.to_csv(output_csv, index=False)
-            logging.info(f"Created CSV: {output_csv}")
-        except Exception as e:
-            logging.error(f"Error writing CSV for {abs_file}: {e}")
-            logging.debug("Traceback:\n" + traceback.format_exc())
+            conn.close()
+        except Exception:
+            pass
+        t_end = time.perf_counter()
+        summary["read_write_s"] = round(t_end - t_connect, 3)
+        summary["total_s"] = round(t_end - t0, 3)
 
+    return summary
 
-# -----------------------------
-# Main
-# -----------------------------
-if __name__ == "__main__":
-    warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
 
-    setup_logging("../../logs/mdb_processing.log")
+def csv_up_to_date(entry, abs_file):
+    """True si el CSV de una entrada del catálogo sigue existiendo y el .mdb no ha cambiado."""
+    if entry is None:
+        return False
+    if entry.get("status") != "empty" and not os.path.isfile(entry.get("output") or ""):
+        return False
+    return sin_cambios(entry, abs_file)
+
+
+def select_changed_files(mdb_files, catalog, write_csv=True, parquet_dir=None, parquet_catalog=None, force=False):
+    """
+    Separa los .mdb que hay que convertir de los que no han cambiado desde la
+    última conversión: misma huella en el catálogo de CSV (si se escriben CSV)
+    y en el del dataset parquet (si se escribe), y sus salidas siguen existiendo.
+    Con force todos quedan pendientes. Devuelve (pendientes, resúmenes de los omitidos).
+    """
+    pending, skipped = [], []
+    for file in mdb_files:
+        abs_file = os.path.abspath(file)
+        entry = catalog.get(abs_file)
+        up_to_date = (not force and
+                      (not write_csv or csv_up_to_date(entry, abs_file)) and
+                      (parquet_dir is None or origen_vigente(parquet_catalog, parquet_dir, abs_file)))
+        if up_to_date:
+            skipped.append({"file": abs_file, "output": (entry or {}).get("output", ""),
+                            "parquet": "", "status": "unchanged",
+                            "rows": (entry or {}).get("rows", 0), "chunks": 0,
+                            "connect_s": 0.0, "read_write_s": 0.0, "total_s": 0.0})
+        else:
+            pending.append(abs_file)
+    logging.info(f"Catalog: {len(pending)} new or changed files, {len(skipped)} unchanged (skipped).")
+    return pending, skipped
 
-    input_dir_path = os.path.abspath("../../data/raw_data")
-    output_dir_path = os.path.abspath("../../data/ventaslonja")
 
-    logging.info(f"Input dir: {input_dir_path}")
-    logging.info(f"Output dir: {output_dir_path}")
+def process_mdb_files(mdb_files, output_dir, backend=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                      chunksize=DEFAULT_CHUNKSIZE, catalog=None, write_csv=True, parquet_dir=None,
+                      parquet_catalog=None):
+    """
+    Convierte los .mdb con un pool de hilos: como mucho `max_connections`
+    conexiones abiertas a la vez. Devuelve la lista de resúmenes por archivo
+    (en el mismo orden que mdb_files). Si se pasa un catálogo, se registra en él
+    la huella de cada archivo convertido (o vacío), su CSV y sus filas; y en
+    parquet_catalog (el del dataset) sus ficheros parquet.
+    """
+    backend = backend or BACKENDS["access"]
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if not backend.check():
+        logging.error(f"Backend '{backend.name}' not available. Aborting processing.")
+        return []
 
-    all_mdb_files = get_mdb_files(input_dir_path)
-    logging.info(f"Found {len(all_mdb_files)} .mdb files total.")
+    abs_files = [os.path.abspath(f) for f in mdb_files]
+    workers = max(1, min(max_connections, len(abs_files)))
+    logging.info(f"Converting {len(abs_files)} files with backend '{backend.name}' "
+                 f"({workers} concurrent connections, chunksize={chunksize})")
 
-    mdb_files_to_process = filter_files_by_date(all_mdb_files, days_back=600)
-    logging.info(f"{len(mdb_files_to_process)} files selected by date filter.")
+    def convert(abs_file):
+        # La huella se toma antes de leer: si el archivo cambia durante la
+        # conversión, la siguiente ejecución lo volverá a convertir
+        fingerprint = huella(abs_file) if os.path.isfile(abs_file) else None
+        return fingerprint, process_mdb_file(abs_file, output_dir, backend, chunksize, write_csv, parquet_dir)
 
-    if mdb_files_to_process:
-        process_mdb_files(mdb_files_to_process, output_dir_path)
-        logging.info("All MDB files processed (selected set).")
+    if workers == 1:
+        results = [convert(f) for f in abs_files]
     else:
-        logging.warning("No MDB files to process after filtering.")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mdb") as pool:
+            results = list(pool.map(convert, abs_files))
+
+    for _, summary in results:
+        contar(f"mdb_{summary['status']}")
+        contar("filas_leidas", summary["rows"])
+        contar("chunks", summary["chunks"])
+        observar("conexion_mdb", summary["connect_s"])
+        observar("lectura_escritura_mdb", summary["read_write_s"])
+
+    for fingerprint, summary in results:
+        if fingerprint is None or summary["status"] not in ("ok", "empty"):
+            continue
+        if catalog is not None:
+            registrar(catalog, summary["file"], fingerprint, output=summary["output"],
+                      rows=summary["rows"], status=summary["status"])
+        if parquet_catalog is not None and parquet_dir:
+            registrar_origen(parquet_catalog, parquet_dir, summary["file"], fingerprint,
+                             [f for f in summary["parquet"].split(";") if f], summary["rows"])
+    return [summary for _, summary in results]
+
+
+def write_summary(summaries, summary_path):
+    """Resumen por archivo (tiempos y filas) en CSV y totales en el log."""
+    if not summaries:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()))
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    by_status = {}
+    for s in summaries:
+        by_status[s["status"]] = by_status.get(s["status"], 0) + 1
+    total_rows = sum(s["rows"] for s in summaries)
+    total_s = sum(s["total_s"] for s in summaries)
+    logging.info(f"Summary: {len(summaries)} files {by_status}, {total_rows} rows, "
+                 f"{total_s:.1f}s cumulative per-file time")
+    slowest = max(summaries, key=lambda s: s["total_s"])
+    logging.info(f"Slowest file: {os.path.basename(slowest['file'])} ({slowest['total_s']}s)")
+    logging.info(f"Per-file summary written to: {summary_path}")
+
+
+# -----------------------------
+# Main
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert .mdb auction files to daily CSVs")
+    parser.add_argument("--input-dir", default="../../data/raw_data")
+    parser.add_argument("--output-dir", default="../../data/ventaslonja")
+    parser.add_argument("--parquet-dir", default="../../data/ventaslonja_parquet",
+                        help="Date-partitioned parquet dataset (fecha=YYYY-MM-DD/), shared with "
+                             "4a_convierte_mdb_a_csv.py; its catalog is stored inside it")
+    parser.add_argument("--format", choices=["csv", "parquet", "both"], default="both",
+                        help="csv: IMEDEA_*.csv (read by 01_data_cleaning_mallorca.R); "
+                             "parquet: partitioned dataset; both: CSV and parquet")
+    parser.add_argument("--days-back", type=int, default=600)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="access",
+                        help="access: ODBC Access driver; sqlite: local SQLite stand-in")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help="Maximum number of files converted (connections open) at the same time")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows per read_sql_query chunk streamed to the CSV")
+    parser.add_argument("--summary", default="../../logs/mdb_ingestion_summary.csv",
+                        help="Per-file timing and row-count summary (CSV)")
+    parser.add_argument("--catalog", default=None,
+                        help="Catalog of converted sources (size, mtime, sha256, CSV and rows); "
+                             "default: catalogo_mdb.json in the output dir")
+    parser.add_argument("--force", action="store_true",
+                        help="Convert every selected file even if it is unchanged in the catalog "
+                             "(catalog entries of files outside --days-back are kept)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
+
+    args = parse_args()
+    setup_logging("../../logs/mdb_processing.log")
+    backend = BACKENDS[args.backend]
+
+    with Metricas("mdb_a_csv", backend=args.backend, formato=args.format):
+        input_dir_path = os.path.abspath(args.input_dir)
+        output_dir_path = os.path.abspath(args.output_dir)
+
+        write_csv = args.format in ("csv", "both")
+        parquet_dir = os.path.abspath(args.parquet_dir) if args.format in ("parquet", "both") else None
+        if parquet_dir and pa is None:
+            logging.warning("pyarrow is not installed; parquet output disabled.")
+            parquet_dir = None
+            write_csv = True
+
+        logging.info(f"Input dir: {input_dir_path}")
+        logging.info(f"Output dir: {output_dir_path}")
+        logging.info(f"Parquet dir: {parquet_dir or '(disabled)'}")
+
+        all_mdb_files = get_mdb_files(input_dir_path, backend.extensions)
+        logging.info(f"Found {len(all_mdb_files)} .mdb files total.")
+
+        mdb_files_to_process = filter_files_by_date(all_mdb_files, days_back=args.days_back)
+        logging.info(f"{len(mdb_files_to_process)} files selected by date filter.")
+
+        if mdb_files_to_process:
+            catalog_path = os.path.abspath(args.catalog or os.path.join(output_dir_path, "catalogo_mdb.json"))
+            catalog = cargar_catalogo(catalog_path)
+            # Catálogo del dataset parquet, compartido con 4a_convierte_mdb_a_csv.py
+            parquet_catalog = cargar_catalogo_lonja(parquet_dir) if parquet_dir else None
+            if parquet_dir:
+                quitar_origenes_desaparecidos(parquet_catalog, parquet_dir, all_mdb_files)
+            # --force solo afecta a los archivos seleccionados: los que quedan fuera de
+            # --days-back conservan su entrada en los catálogos
+            pending, skipped = select_changed_files(mdb_files_to_process, catalog, write_csv, parquet_dir,
+                                                    parquet_catalog, force=args.force)
+            contar("mdb_sin_cambios", len(skipped))
+
+            summaries = process_mdb_files(pending, output_dir_path, backend, max_connections=args.max_connections,
+                                          chunksize=args.chunksize, catalog=catalog, write_csv=write_csv,
+                                          parquet_dir=parquet_dir, parquet_catalog=parquet_catalog) if pending else []
+            guardar_catalogo(catalog, catalog_path)
+            if parquet_dir:
+                guardar_catalogo_lonja(parquet_catalog, parquet_dir)
+            write_summary(skipped + summaries, os.path.abspath(args.summary))
+            logging.info("All MDB files processed (selected set).")
+        else:
+            logging.warning("No MDB files to process after filtering.")
 
-    logging.info("==== MDB processing finished ====")
+        logging.info("==== MDB processing finished ====")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Transporte del servicio de inferencia local (etapa 1 con el modelo residente).
+
+El servicio escucha en un socket local (multiprocessing.connection: TCP en
+127.0.0.1, con clave compartida) y atiende las peticiones de una en una, así
+que el modelo solo se carga una vez para todas las ejecuciones. Cada petición
+es un dict con 'tipo'; la respuesta es otro dict (o {'error': ...}).
+
+    tipo 'estado'  -> lo responde el propio bucle (pid, arranque, trabajos atendidos)
+    tipo 'parar'   -> cierra el servicio
+    cualquier otro -> se pasa a la función `atender` de quien lanza el servicio
+
+Las peticiones viajan serializadas con pickle, así que la clave es lo único
+que impide ejecutar código a cualquier proceso que llegue al puerto: se toma
+de REMAR_INFERENCIA_CLAVE (entorno o config/.env, como las credenciales de
+envio_logs.py) y sin ella el servicio no arranca ni el cliente se conecta.
+
+La lógica del modelo (trabajos 'archivo' y 'lote') está en
+1_inference_gamba_args.py (--servir para lanzarlo, --cliente para usarlo).
+"""
+
+import os
+import datetime
+from pathlib import Path
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=Path("~/REMAR-automatizacion/config/.env").expanduser())
+
+HOST = "127.0.0.1"
+PUERTO = int(os.environ.get("REMAR_INFERENCIA_PUERTO", "6010"))
+CLAVE = os.environ.get("REMAR_INFERENCIA_CLAVE", "").encode("utf-8")
+
+
+class ServicioNoDisponible(Exception):
+    """No hay servicio escuchando o la conexión se cortó antes de recibir la respuesta."""
+
+
+class ErrorServicio(Exception):
+    """El servicio recibió la petición pero falló al atenderla."""
+
+
+class ClaveNoConfigurada(Exception):
+    """No hay clave compartida (REMAR_INFERENCIA_CLAVE) para el servicio."""
+
+
+def comprobar_clave(clave=CLAVE):
+    if not clave:
+        raise ClaveNoConfigurada("define REMAR_INFERENCIA_CLAVE en el entorno o en config/.env "
+                                 "(la misma para el servicio y sus clientes)")
+
+
+def servir(atender, puerto=PUERTO, clave=CLAVE, info=None):
+    """
+    Bucle del servicio: acepta conexiones en HOST:puerto y responde cada
+    petición con atender(peticion) hasta recibir {'tipo': 'parar'}. Un error
+    en una petición se devuelve al cliente y no tumba el servicio. Sin clave
+    lanza ClaveNoConfigurada antes de abrir el puerto.
+    """
+    comprobar_clave(clave)
+    arranque = datetime.datetime.now().isoformat(timespec="seconds")
+    trabajos = 0
+    with Listener((HOST, puerto), authkey=clave) as listener:
+        print(f"[INFO] Servicio de inferencia escuchando en {HOST}:{puerto} (pid {os.getpid()})", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"[WARN] Conexión rechazada: {e}", flush=True)
+                continue
+
+            with conn:
+                try:
+                    peticion = conn.recv()
+                except (OSError, EOFError) as e:
+                    print(f"[WARN] Petición incompleta: {e}", flush=True)
+                    continue
+
+                tipo = peticion.get("tipo") if isinstance(peticion, dict) else None
+                if tipo == "parar":
+                    conn.send({"ok": True})
+                    print("[INFO] Servicio de inferencia detenido", flush=True)
+                    return
+                if tipo == "estado":
+                    respuesta = {"pid": os.getpid(), "arranque": arranque, "trabajos": trabajos, **(info or {})}
+                else:
+                    try:
+                        respuesta = atender(peticion)
+                        trabajos += 1
+                    except Exception as e:
+                        print(f"[ERROR] Petición '{tipo}' fallida: {e}", flush=True)
+                        respuesta = {"error": f"{type(e).__name__}: {e}"}
+
+                try:
+                    conn.send(respuesta)
+                except (OSError, EOFError) as e:
+                    print(f"[WARN] El cliente se desconectó antes de la respuesta: {e}", flush=True)
+
+
+def enviar(peticion, puerto=PUERTO, clave=CLAVE):
+    """
+    Envía una petición y espera la respuesta. Lanza ServicioNoDisponible si no
+    hay servicio (o se corta la conexión, o no hay clave con la que conectarse)
+    y ErrorServicio si el servicio falló.
+    """
+    try:
+        comprobar_clave(clave)
+    except ClaveNoConfigurada as e:
+        raise ServicioNoDisponible(f"{HOST}:{puerto}: sin clave: {e}") from e
+    try:
+        with Client((HOST, puerto), authkey=clave) as conn:
+            conn.send(peticion)
+            respuesta = conn.recv()
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise ServicioNoDisponible(f"{HOST}:{puerto}: {e}") from e
+    if isinstance(respuesta, dict) and "error" in respuesta:
+        raise ErrorServicio(respuesta["error"])
+    return respuesta
+
+
+def estado(puerto=PUERTO, clave=CLAVE):
+    """Estado del servicio o None si no está en marcha."""
+    try:
+        return enviar({"tipo": "estado"}, puerto, clave)
+    except (ServicioNoDisponible, ErrorServicio):
+        return None
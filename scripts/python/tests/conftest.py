@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los scripts de gamba se importan como módulos sueltos desde scripts/python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
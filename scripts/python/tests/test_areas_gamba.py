@@ -0,0 +1,65 @@
+import numpy as np
+
+from areas_gamba import (areas_poligonos, leer_etiquetas, escribir_mascaras, leer_mascaras, escribir_tamanos,
+                         leer_tamanos, borrar_mascaras)
+
+CUADRADO = [(0, 0), (1, 0), (1, 1), (0, 1)]
+TRIANGULO = [(0.1, 0.1), (0.5, 0.1), (0.1, 0.6)]
+
+
+def planos(poligonos):
+    """coords y offsets como los de leer_etiquetas para una lista de polígonos."""
+    longitudes = [len(p) for p in poligonos]
+    coords = np.array([v for p in poligonos for v in p], dtype=np.float64).reshape(-1, 2)
+    offsets = np.zeros(len(poligonos) + 1, dtype=np.int64)
+    np.cumsum(longitudes, out=offsets[1:])
+    return coords, offsets
+
+
+def linea_save_txt(clase, xyn, conf):
+    """Línea de Results.save_txt(save_conf=True) para segmentación."""
+    valores = (clase, *np.asarray(xyn, dtype=np.float32).reshape(-1).tolist(), conf)
+    return ("%g " * len(valores)).rstrip() % valores
+
+
+def test_areas_poligonos_vacio_intermedio():
+    coords, offsets = planos([CUADRADO, [], CUADRADO])
+    np.testing.assert_allclose(areas_poligonos(coords, offsets, 1, 1), [1, 0, 1])
+
+
+def test_areas_poligonos_vacios_en_los_extremos():
+    coords, offsets = planos([[], CUADRADO, CUADRADO, []])
+    np.testing.assert_allclose(areas_poligonos(coords, offsets, 1, 1), [0, 1, 1, 0])
+
+
+def test_areas_poligonos_todos_vacios():
+    coords, offsets = planos([[], []])
+    np.testing.assert_allclose(areas_poligonos(coords, offsets, 1, 1), [0, 0])
+
+
+def test_almacen_descarta_poligonos_degenerados_como_labels(tmp_path):
+    clases = [2, 1, 0, 2, 1]
+    confianzas = [0.9, 0.8, 0.7, 0.6, 0.5]
+    poligonos = [np.array(TRIANGULO), np.zeros((0, 2)), np.array([(0.3, 0.3)]),
+                 np.array([(0.2, 0.2), (0.7, 0.4)]), np.array(CUADRADO) * 0.5]
+
+    escribir_mascaras(str(tmp_path), [("imagen", clases, confianzas, poligonos, (640, 640))])
+    ruta_txt = tmp_path / "imagen.txt"
+    ruta_txt.write_text("".join(linea_save_txt(c, p, f) + "\n" for c, f, p in zip(clases, confianzas, poligonos)))
+
+    coords_m, offsets_m, clases_m, _, _ = leer_mascaras(str(tmp_path), ["imagen"])
+    coords_e, offsets_e, clases_e, _ = leer_etiquetas([str(ruta_txt)])
+
+    np.testing.assert_array_equal(clases_m, clases_e)
+    np.testing.assert_array_equal(clases_m, [2, 2, 1])
+    np.testing.assert_array_equal(offsets_m, offsets_e)
+    np.testing.assert_allclose(areas_poligonos(coords_m, offsets_m, 640, 640, truncar=True),
+                               areas_poligonos(coords_e, offsets_e, 640, 640, truncar=True))
+
+
+def test_tamanos_ultima_entrada_y_borrado(tmp_path):
+    escribir_tamanos(str(tmp_path), [("a", (4000, 3000)), ("b", (640, 480))])
+    escribir_tamanos(str(tmp_path), [("a", (3000, 4000))])
+    assert leer_tamanos(str(tmp_path)) == {"a": (3000, 4000), "b": (640, 480)}
+    borrar_mascaras(str(tmp_path))
+    assert leer_tamanos(str(tmp_path)) == {}
@@ -0,0 +1,36 @@
+import os
+import importlib.util
+
+import pytest
+
+from areas_gamba import escribir_mascaras
+
+IMAGEN = "OPMM_Subasta_2025-03-03_05_00_00.000_Imedea"
+CUADRADO = [(0.25, 0.25), (0.75, 0.25), (0.75, 0.75), (0.25, 0.75)]  # 320x320 px en la rejilla 640x640
+
+
+def cargar_etapa2(tmp_path):
+    ruta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "2_calcular_areas_segmentos_gamba.py")
+    spec = importlib.util.spec_from_file_location("etapa2", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    modulo.TEMP_DIR = str(tmp_path / "TEMP")
+    return modulo
+
+
+@pytest.mark.parametrize("labels_vacio", [False, True])
+def test_almacen_de_mascaras_con_o_sin_labels_vacio(tmp_path, labels_vacio):
+    # Fecha repetida con --salidas mascaras tras una ejecución por defecto: labels/ puede quedar vacío
+    subdir = tmp_path / "INFERENCE" / "yolo_inference_results_2025-03-03_"
+    escribir_mascaras(str(subdir), [(IMAGEN, [2], [0.9], [CUADRADO], (640, 640))])
+    if labels_vacio:
+        os.makedirs(subdir / "labels")
+
+    etapa2 = cargar_etapa2(tmp_path)
+    assert etapa2.process_directory(str(tmp_path / "INFERENCE"), str(tmp_path / "AREAS")) == []
+
+    with open(tmp_path / "AREAS" / "areas_resultados_2025-03-03.txt", encoding="utf-8") as f:
+        texto = f.read()
+    assert f"Imagen: {IMAGEN}.txt" in texto
+    assert "Identificador: 2, Area: 102400" in texto
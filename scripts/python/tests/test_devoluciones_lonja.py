@@ -0,0 +1,65 @@
+import os
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generadores import generar_lonja_csv
+
+
+def cargar_etapa4b():
+    ruta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "4b_combina_lonja_imagen.py")
+    spec = importlib.util.spec_from_file_location("etapa4b", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def indices_pares_devolucion_iterrows(df_filtrado):
+    """Implementación original de 4b (comparación fila a fila dentro de cada día)."""
+    indices_a_eliminar = set()
+    for fecha, grupo in df_filtrado.groupby('Fecha_sin_hora'):
+        grupo = grupo.reset_index(drop=False)
+        for i, fila in grupo.iterrows():
+            if fila['NUMENVAS'] == -1:
+                for j, otra in grupo.iterrows():
+                    if i != j and (
+                        abs(fila['PESONETO']) == abs(otra['PESONETO']) and
+                        abs(fila['IMPORTE']) == abs(otra['IMPORTE']) and
+                        abs(fila['NUMVENTA']) == abs(otra['NUMVENTA'])
+                    ):
+                        indices_a_eliminar.update([fila['index'], otra['index']])
+    return indices_a_eliminar
+
+
+def lonja_filtrada(ruta):
+    """Mismo preparado que cargar_y_procesar_lonja antes de buscar los pares."""
+    df = pd.read_csv(ruta)
+    df = df[(df['NUMENVAS'] != 0) & (df['NUMENVAS'].abs() == 1)].copy()
+    df['FECHA'] = pd.to_datetime(df['FECHA'], format='%Y-%m-%d %H:%M:%S')
+    df['Fecha_sin_hora'] = df['FECHA'].dt.date
+    return df
+
+
+def test_pares_devolucion_igual_que_iterrows(tmp_path):
+    ruta = str(tmp_path / "ARA.csv")
+    generar_lonja_csv(ruta, ventas_dia=15, tasa_devolucion=0.1, semilla=3)
+    df = lonja_filtrada(ruta)
+
+    # Casos límite sobre días reales del año sintético
+    dia = df[df['NUMENVAS'] == 1].iloc[0]
+    devolucion_sola = dia.copy()
+    devolucion_sola[['NUMENVAS', 'NUMVENTA']] = [-1, 999999]
+    dos_devoluciones = devolucion_sola.copy()
+    dos_devoluciones['NUMVENTA'] = 888888
+    clave_nula = dia.copy()
+    clave_nula[['NUMENVAS', 'IMPORTE']] = [-1, np.nan]
+    otro_dia = dia.copy()
+    otro_dia['NUMENVAS'] = -1
+    otro_dia['Fecha_sin_hora'] = df['Fecha_sin_hora'].max()
+    df = pd.concat([df, pd.DataFrame([devolucion_sola, dos_devoluciones, dos_devoluciones, clave_nula, otro_dia])],
+                   ignore_index=True)
+
+    esperados = indices_pares_devolucion_iterrows(df)
+    assert len(esperados) > 100
+    assert cargar_etapa4b().indices_pares_devolucion(df) == esperados
@@ -0,0 +1,33 @@
+import os
+import importlib.util
+
+from benchmarks import yolo_simulado
+
+
+def cargar_etapa1():
+    yolo_simulado.instalar()
+    ruta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "1_inference_gamba_args.py")
+    spec = importlib.util.spec_from_file_location("etapa1", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+class YOLOConImagenMala(yolo_simulado.YOLO):
+    """predict() falla si el lote contiene la imagen 'mala.jpg'."""
+
+    def predict(self, entradas, batch=1, save=False, **kwargs):
+        if "mala.jpg" in entradas:
+            raise RuntimeError("imagen corrupta")
+        return super().predict(entradas, batch=batch, save=save, **kwargs)
+
+
+def test_lote_con_una_imagen_mala_solo_pierde_esa_imagen(capsys):
+    etapa1 = cargar_etapa1()
+    nombres = ["a.jpg", "b.jpg", "mala.jpg", "c.jpg"]
+    lote = [(nombre, nombre, 10.0 + i, i) for i, nombre in enumerate(nombres)]
+
+    filas, _ = etapa1.inferir_lote(YOLOConImagenMala(), lote, dir_salida=None, calcular_areas=True)
+
+    assert filas == [("a.jpg", 10.0, 0), ("b.jpg", 11.0, 1), ("c.jpg", 13.0, 3)]
+    assert "Error en inferencia: mala.jpg" in capsys.readouterr().out
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from catalogo import huella
+from lonja_parquet import (COLUMNAS_LONJA, normalizar_lonja, escribir_lonja_parquet, leer_lonja, cargar_catalogo_lonja,
+                           guardar_catalogo_lonja, origen_vigente, registrar_origen, quitar_origenes_desaparecidos)
+
+
+def ventas(**columnas):
+    base = {c: [None, None, None] for c in COLUMNAS_LONJA}
+    base["FECHA"] = ["2025-03-03 06:00:00"] * 3
+    base.update(columnas)
+    return pd.DataFrame(base)
+
+
+def test_codigos_se_guardan_como_texto(tmp_path):
+    df = ventas(CODCLIENTE=[12, "A-7", None], CODCENSO=[1001.0, np.nan, 1003.0])
+    escribir_lonja_parquet(df, str(tmp_path), "origen")
+    leido = leer_lonja(str(tmp_path))
+    assert leido["CODCLIENTE"].tolist()[:2] == ["12", "A-7"] and pd.isna(leido["CODCLIENTE"].iloc[2])
+    assert leido["CODCENSO"].iloc[0] == "1001" and leido["CODCENSO"].iloc[2] == "1003"
+
+
+def test_valores_no_numericos_se_avisan(capsys):
+    df = normalizar_lonja(ventas(NUMVENTA=["15", "x15", None], PESONETO=[3.5, 4, "?"]))
+    assert df["NUMVENTA"].isna().tolist() == [False, True, True]
+    salida = capsys.readouterr().out
+    assert "1 valores de NUMVENTA" in salida and "1 valores de PESONETO" in salida
+
+
+def test_catalogo_del_dataset_compartido(tmp_path):
+    dataset = str(tmp_path / "lonja")
+    mdb = tmp_path / "VENTAS_03-03-2025.mdb"
+    mdb.write_bytes(b"v1")
+
+    # Primera versión con dos días; la segunda solo tiene uno: el fichero del otro día sobra
+    df = ventas(FECHA=["2025-03-03 06:00:00", "2025-03-04 06:00:00", "2025-03-04 07:00:00"])
+    catalogo = cargar_catalogo_lonja(dataset)
+    registrar_origen(catalogo, dataset, str(mdb), huella(str(mdb)),
+                     escribir_lonja_parquet(df, dataset, "VENTAS_03-03-2025"), len(df))
+    guardar_catalogo_lonja(catalogo, dataset)
+
+    catalogo = cargar_catalogo_lonja(dataset)  # lo que vería el otro conversor
+    assert origen_vigente(catalogo, dataset, str(mdb))
+    assert len(leer_lonja(dataset)) == 3  # el catálogo (_catalogo.json) no se lee como datos
+
+    mdb.write_bytes(b"v2")
+    assert not origen_vigente(catalogo, dataset, str(mdb))
+    registrar_origen(catalogo, dataset, str(mdb), huella(str(mdb)),
+                     escribir_lonja_parquet(df.iloc[:1], dataset, "VENTAS_03-03-2025"), 1)
+    assert catalogo["VENTAS_03-03-2025"]["ficheros"] == [os.path.join("fecha=2025-03-03", "VENTAS_03-03-2025.parquet")]
+    assert len(leer_lonja(dataset)) == 1
+
+    quitar_origenes_desaparecidos(catalogo, dataset, [])
+    assert catalogo == {} and len(leer_lonja(dataset)) == 0
@@ -0,0 +1,81 @@
+import os
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+from areas_gamba import SLO_HAT, INT_HAT
+
+
+def cargar_etapa3():
+    ruta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "3_calculo_peso_medio_num_gamba.py")
+    spec = importlib.util.spec_from_file_location("etapa3", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def resumen_linea_a_linea(df_areas):
+    """Recorrido original de la etapa 3 (bloque a bloque, un polígono cada vez)."""
+    imagenes, id_0_2, id_2, area_media, pesos_por_imagen = [], [], [], [], []
+    imagen_actual, bloque_actual = None, None
+    num_id_0_2 = num_id_2 = area_sum_2 = 0
+    pesos_temp = []
+
+    def cerrar():
+        imagenes.append(imagen_actual)
+        id_0_2.append(num_id_0_2)
+        id_2.append(num_id_2)
+        area_media.append(area_sum_2 / num_id_2 if num_id_2 > 0 else 0)
+        pesos_por_imagen.append(pesos_temp)
+
+    for fila in df_areas.itertuples(index=False):
+        if fila.Bloque != bloque_actual:
+            if imagen_actual is not None:
+                cerrar()
+            bloque_actual, imagen_actual = fila.Bloque, fila.Imagen
+            num_id_0_2 = num_id_2 = area_sum_2 = 0
+            pesos_temp = []
+        if pd.isna(fila.Identificador):
+            continue
+        identificador, area = int(fila.Identificador), float(fila.Area)
+        if identificador in (0, 2):
+            num_id_0_2 += 1
+        if identificador == 2:
+            num_id_2 += 1
+            area_sum_2 += area
+            pesos_temp.append(np.exp(np.log(area) * SLO_HAT + INT_HAT))
+    if imagen_actual is not None:
+        cerrar()
+
+    return pd.DataFrame({
+        'Imagen': imagenes,
+        'Num_ID_0_2': id_0_2,
+        'Num_ID_2': id_2,
+        'Area_Media_2': area_media,
+        'Peso_Medio_2': [np.mean(p) if p else 0 for p in pesos_por_imagen],
+    }), [p for lista in pesos_por_imagen for p in lista]
+
+
+def tabla_areas(n_imagenes=300, poligonos_medios=40, semilla=0):
+    """Tabla larga como la de leer_areas_txt, con imágenes sin detecciones."""
+    rng = np.random.default_rng(semilla)
+    filas = []
+    for bloque in range(n_imagenes):
+        imagen = f"OPMM_Subasta_2025-03-03_05_{bloque // 60:02d}_{bloque % 60:02d}.000_Imedea"
+        n = int(rng.poisson(poligonos_medios)) if bloque % 7 else 0
+        if n == 0:
+            filas.append((bloque, imagen, None, np.nan))
+        for clase, area in zip(rng.choice([0, 1, 2], n, p=[0.1, 0.1, 0.8]), rng.uniform(50, 20000, n)):
+            filas.append((bloque, imagen, int(clase), float(area)))
+    return pd.DataFrame(filas, columns=['Bloque', 'Imagen', 'Identificador', 'Area'])
+
+
+def test_resumen_por_imagen_identico_al_recorrido_original():
+    df_areas = tabla_areas()
+    esperado, pesos_esperados = resumen_linea_a_linea(df_areas)
+    df_datos, pesos = cargar_etapa3().resumen_por_imagen(df_areas)
+
+    pd.testing.assert_frame_equal(df_datos, esperado, check_exact=True, check_dtype=False)
+    np.testing.assert_array_equal(pesos, pesos_esperados)